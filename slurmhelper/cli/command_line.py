@@ -4,26 +4,39 @@ import shutil
 import pprint
 
 import numpy as np
-import pandas as pd
 
 from argparse import ArgumentError
 
 from .parser import valid_specs
-from ..jobs.cli_helpers import prep_job, prep_job_array, generate_run_scripts
+from ..db import SlurmhelperDB
+from ..jobs.cli_helpers import (
+    prep_job,
+    prep_job_array,
+    generate_run_scripts,
+    find_jobs_to_resubmit,
+    resubmit_jobs,
+)
 from ..utils.io import (
     calculate_directories,
     calculate_directories_midwayscratch,
     copy_or_clean,
+    ensure_status_file,
     initialize_directories,
     is_valid_db,
+    load_db,
 )
 from ..utils.reporting import (
     list_slurm,
     check_runtimes,
     check_completed,
+    check_efficiency,
+    check_resources,
     check_queue,
     check_log,
+    lookup_crosswalk,
+    watch_completion,
 )
+from ..utils.scheduler import resolve_cache_ttl
 
 
 class SlurmhelperCLI:
@@ -80,7 +93,7 @@ class SlurmhelperCLI:
         if not (
             (args.operation in {"list", "init", "submit"})
             or (
-                args.operation == "gen-scripts"
+                args.operation in {"gen-scripts", "resubmit", "lookup"}
                 and args.ids is None
                 and args.range is None
             )
@@ -196,13 +209,29 @@ class SlurmhelperCLI:
             self.gen_scripts()  # generate template scripts for all jobs
 
     def submit(self):
-        from ..jobs.submit import submit_sbatch
-
-        sb_id = self.args.sbatch_id[0]
-        submit_sbatch(sb_id, self.paths)
+        from ..jobs.submit import submit_campaign
+
+        submit_campaign(
+            None if self.args.all else self.args.sbatch_id,
+            self.paths,
+            rate=self.args.submit_rate,
+            retries=self.args.retries,
+            backoff=self.args.backoff,
+            force=self.args.force,
+            dry=self.args.dry,
+            config=self.config,
+        )
 
     def list(self):
-        list_slurm(self.paths)
+        list_slurm(self.paths, job_list=self.args.job_id, status=self.args.status)
+
+    def lookup(self):
+        lookup_crosswalk(
+            self.paths,
+            getattr(self, "job_list", None),
+            self.args.slurm_id,
+            self.config,
+        )
 
     def gen_scripts(self):
         if hasattr(self, "job_list"):
@@ -248,6 +277,34 @@ class SlurmhelperCLI:
 
         prep_job(self.config, self.job_list, self.paths, self.args)
 
+    def resubmit(self):
+        jl = self.job_list if hasattr(self, "job_list") else None
+        self.job_list = find_jobs_to_resubmit(self.config, jl, self.paths, self.args)
+        if len(self.job_list) == 0:
+            print("Nothing to resubmit.")
+            return
+
+        if self.args.do_reset:
+            print(
+                "The --do-reset flag was used. Clean and then copy will be run prior "
+                "to resubmission for the jobs being resubmitted."
+            )
+            self.reset()
+        elif self.args.do_clean:
+            print(
+                "The --do-clean flag was used. Clean scripts will be run for the jobs "
+                "being resubmitted."
+            )
+            self.clean()
+        elif self.args.do_copy:
+            print(
+                "The --do-copy flag was used. Input copy scripts will be run for the jobs "
+                "being resubmitted."
+            )
+            self.copy()
+
+        resubmit_jobs(self.config, self.job_list, self.paths, self.args)
+
     def prep_array(self):
         if self.args.do_reset:
             print(
@@ -278,10 +335,55 @@ class SlurmhelperCLI:
 
         self.logger.debug(jl)
 
+        # bring the database up to date with what runners did since the last check
+        if hasattr(self, "paths"):
+            SlurmhelperDB(self.paths).merge_journals(self.paths)
+
         if self.args.check_operation == "queue":
-            check_queue()
+            check_queue(
+                self.paths,
+                self.config,
+                ttl=resolve_cache_ttl(self.config, self.args),
+            )
         elif self.args.check_operation == "runtime":
-            check_runtimes(self.paths, self.config, jl)
+            check_runtimes(
+                self.paths,
+                self.config,
+                jl,
+                self.args.scan_workers,
+                self.args.rescan,
+                group_by=self.args.group_by,
+                export=self.args.export,
+            )
+        elif self.args.check_operation == "efficiency":
+            check_efficiency(
+                self.paths,
+                self.config,
+                sbatch_ids=self.args.sbatch_id,
+                chunk_size=self.args.chunk_size,
+                export=self.args.export,
+                ttl=resolve_cache_ttl(self.config, self.args),
+            )
+        elif self.args.check_operation == "watch":
+            watch_completion(
+                self.paths,
+                self.config,
+                job_list=jl,
+                interval=self.args.interval,
+                poll=self.args.poll,
+                workers=self.args.scan_workers,
+                rescan=self.args.rescan,
+            )
+        elif self.args.check_operation == "resources":
+            check_resources(
+                self.paths,
+                self.config,
+                job_list=jl,
+                percentile=self.args.percentile,
+                margin=self.args.margin,
+                workers=self.args.scan_workers,
+                rescan=self.args.rescan,
+            )
         elif self.args.check_operation == "completion":
             check_completed(
                 self.paths,
@@ -289,6 +391,9 @@ class SlurmhelperCLI:
                 job_list=jl,
                 return_completed_list=False,
                 failed_report=self.args.show_failed_logs,
+                quick=self.args.quick,
+                workers=self.args.scan_workers,
+                rescan=self.args.rescan,
             )
         elif self.args.check_operation == "log":
             if self.args.job_id is not None:
@@ -312,7 +417,7 @@ class SlurmhelperCLI:
         self.logger.critical("Not yet implemented.")
 
     def __load_database(self):
-        self.db = pd.read_csv(os.path.join(self.paths["base"], "db.csv"))
+        self.db = SlurmhelperDB(self.paths).load_jobs(columns=[])
 
     def __validate_and_copy_db(self, db_file):
         self.logger.info(f"validating file {db_file}")
@@ -324,6 +429,9 @@ class SlurmhelperCLI:
         else:
             self.logger.info("Copying file")
             shutil.copy2(db_file, os.path.join(self.paths["base"], "db.csv"))
+            job_df = load_db(db_file)
+            SlurmhelperDB(self.paths).initialize(self.paths, job_df, self.config)
+            ensure_status_file(self.paths, job_df.order_id.max())
 
 
 def main():
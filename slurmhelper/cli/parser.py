@@ -103,6 +103,7 @@ def add_sbatch_args(parser):
     :return: parser (enhanced with new arguments!)
     """
     parser = add_sbatch_id_arg(parser)
+    parser = add_scan_args(parser)
     parser.add_argument(
         "--time",
         "-t",
@@ -130,6 +131,73 @@ def add_sbatch_args(parser):
         default=[16000],
         help="Memory (in mb) to request",
     )
+    parser.add_argument(
+        "--time-percentile",
+        "--time_percentile",
+        type=float,
+        action="store",
+        help="When --time is not given, wall time is estimated from the runtimes of "
+        "jobs already completed in this working directory: this percentile of past "
+        "runtimes (per job class, if your spec defines job_class_columns) is used "
+        "for each job. Defaults to 95, or to the percentile in your spec's "
+        "duration_model.",
+    )
+    parser.add_argument(
+        "--time-margin",
+        "--time_margin",
+        type=float,
+        action="store",
+        help="Safety margin added to wall times estimated from past runtimes, as a "
+        "fraction (e.g., 0.1 for 10%%). Defaults to 0.1, or to the margin in your "
+        "spec's duration_model.",
+    )
+    parser.add_argument(
+        "--static-time",
+        "--static_time",
+        action="store_true",
+        help="Do not estimate wall time from past runtimes; only use job_time from "
+        "your spec.",
+    )
+    parser.add_argument(
+        "--concurrency",
+        "-k",
+        type=int,
+        nargs=1,
+        action="store",
+        help="Number of jobs to run at once within the sbatch script (or within each "
+        "array element). If not given, jobs run serially. If 0, this is derived from "
+        "--n-tasks / --memory and the n_thr / mem_mb values in your spec's "
+        "script_global_settings.",
+    )
+    parser.add_argument(
+        "--pack",
+        action="store_true",
+        help="Size the tasks and memory requested for packed scripts / array elements "
+        "from --concurrency, i.e. concurrency x n_thr tasks and concurrency x mem_mb "
+        "memory. Overrides --n-tasks and --memory.",
+    )
+    parser.add_argument(
+        "--signal-grace",
+        "--signal_grace",
+        type=int,
+        action="store",
+        help="Ask slurm to send a warning signal (USR1) this many seconds before the "
+        "job's walltime runs out (or it is preempted). Wrappers then stop starting jobs, "
+        "let running ones finish, and record the rest as not started.",
+    )
+    parser.add_argument(
+        "--forward-signal",
+        "--forward_signal",
+        action="store_true",
+        help="Pass the warning signal (USR1) on to running jobs, e.g. if they can "
+        "checkpoint upon it. Jobs that do not trap USR1 are terminated by it.",
+    )
+    parser.add_argument(
+        "--requeue",
+        action="store_true",
+        help="After a warning signal, requeue the sbatch job (or array element) once "
+        "running jobs are over. Jobs it already completed are not run again.",
+    )
     parser.add_argument(
         "--no-header",
         "--no_header",
@@ -140,6 +208,71 @@ def add_sbatch_args(parser):
     return parser
 
 
+def add_array_args(parser):
+    """
+    Helper function. Adds arguments related to how jobs are laid out in sbatch arrays
+    to the prep-array and resubmit command subparsers.
+    :param parser: subcommand parser object
+    :return: parser (enhanced with new arguments!)
+    """
+    parser.add_argument(
+        "--n-parcels",
+        "--n_parcels",
+        nargs=1,
+        type=int,
+        action="store",
+        help="Manual override to specify number" "of parcels to divide yo jobz",
+    )
+    parser.add_argument(
+        "--max-array-size",
+        "--max_array_size",
+        type=int,
+        action="store",
+        help="Cluster MaxArraySize (array indices must stay below it). Arrays that "
+        "would exceed it are split into several parts. Overrides max_array_size in "
+        "your spec, and what --query-limits reports.",
+    )
+    parser.add_argument(
+        "--max-submit-jobs",
+        "--max_submit_jobs",
+        type=int,
+        action="store",
+        help="Maximum number of jobs (incl. array elements) you may have queued at "
+        "once. Overrides max_submit_jobs in your spec, and what --query-limits reports.",
+    )
+    parser.add_argument(
+        "--query-limits",
+        "--query_limits",
+        action="store_true",
+        help="Ask the scheduler for its MaxArraySize (scontrol show config) and your "
+        "MaxSubmitJobs (sacctmgr) limits.",
+    )
+    parser = add_cache_args(parser)
+    parser.add_argument(
+        "--chain",
+        action="store_true",
+        help="If the array is split into several parts, chain them: each part submits "
+        "the next one with a dependency on itself, so only the first part needs to be "
+        "submitted and the queue never holds more than two parts at once.",
+    )
+    parser.add_argument(
+        "--dynamic",
+        action="store_true",
+        help="Do not split jobs across array elements ahead of time. Instead, each "
+        "element pulls the next unclaimed job from a queue shared by the whole array, "
+        "until the queue is empty or it does not have enough walltime left for it.",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        "--rate_limit",
+        type=int,
+        action="store",
+        help="Limit the number of concurrent array jobs to"
+        "the number provided, if specified.",
+    )
+    return parser
+
+
 def add_ids_args(parser, required=True):
     """
     Helper function. Adds arguments for ids to various subcommands.
@@ -167,6 +300,50 @@ def add_ids_args(parser, required=True):
     return parser
 
 
+def add_scan_args(parser):
+    """
+    Helper function. Adds the option controlling how many job logs are scanned at once, to
+    subparsers of commands that read job logs.
+    :param parser: subcommand parser object
+    :return: parser (enhanced with new arguments!)
+    """
+    parser.add_argument(
+        "--scan-workers",
+        "--scan_workers",
+        type=int,
+        default=None,
+        help="Number of threads reading job logs at once (default: 8). Use 1 to read "
+        "them one at a time.",
+    )
+    parser.add_argument(
+        "--rescan",
+        help="parse every job log again, instead of only those that changed since the "
+        "last check",
+        action="store_true",
+    )
+    return parser
+
+
+def add_cache_args(parser):
+    """
+    Helper function. Adds the option controlling how long scheduler query results are
+    reused, to subparsers of commands that query the scheduler.
+    :param parser: subcommand parser object
+    :return: parser (enhanced with new arguments!)
+    """
+    parser.add_argument(
+        "--cache-ttl",
+        "--cache_ttl",
+        type=int,
+        default=None,
+        help="Reuse the results of scheduler queries (squeue, sacct, scontrol...) made "
+        "less than this many seconds ago, by any slurmhelper command in this working "
+        "directory (default: 30, or scheduler_cache_ttl in your spec). 0 always asks "
+        "the scheduler.",
+    )
+    return parser
+
+
 def add_logging_args(parser):
     """
     Helper function. Adds arguments for logging to parser object.
@@ -413,12 +590,86 @@ def build_parser():
     # create the parser for the "LIST" command
     # -----------------------------------------------------------------------
     list = subparsers.add_parser("list", help="print a list of existing scripts")
-    list = add_parser_options(list, "wd")
+    list = add_parser_options(list, "wd", "spec")
+    list.add_argument(
+        "--job-id",
+        "--job_id",
+        "-j",
+        type=int,
+        nargs="+",
+        default=None,
+        help="only list scripts (and array elements) that run these jobs",
+    )
+    list.add_argument(
+        "--status",
+        choices=["success", "failed", "running", "no_log", "skipped"],
+        default=None,
+        help="only list scripts with jobs whose latest known status is this one",
+    )
 
     # create the parser for the "SUBMIT" command
     # -----------------------------------------------------------------------
-    submit = subparsers.add_parser("submit", help="submit an sbatch job nicely")
-    submit = add_parser_options(submit, "wd", "spec", "sbatch-id")
+    submit = subparsers.add_parser(
+        "submit", help="submit one or several sbatch jobs nicely"
+    )
+    submit = add_parser_options(submit, "wd", "spec", "dry")
+    submit_what = submit.add_mutually_exclusive_group(required=True)
+    submit_what.add_argument(
+        "--sbatch-id",
+        "--sbatch_id",
+        "-s",
+        type=int,
+        nargs="+",
+        help="Specify one or several sbatch job ids to submit.",
+    )
+    submit_what.add_argument(
+        "--all",
+        action="store_true",
+        help="Submit every sbatch job prepped in this working directory (those already "
+        "submitted are skipped, unless --force is given).",
+    )
+    submit.add_argument(
+        "--submit-rate",
+        "--submit_rate",
+        type=float,
+        default=1.0,
+        help="Maximum number of submissions per second, to go easy on slurmctld. "
+        "Default: 1.",
+    )
+    submit.add_argument(
+        "--retries",
+        type=int,
+        default=5,
+        help="Number of times to retry a submission when sbatch fails for transient "
+        "reasons (e.g., slurmctld timing out). Default: 5.",
+    )
+    submit.add_argument(
+        "--backoff",
+        type=float,
+        default=2.0,
+        help="Seconds to wait before retrying a failed submission; doubled at each "
+        "retry. Default: 2.",
+    )
+    submit.add_argument(
+        "--force",
+        action="store_true",
+        help="Submit scripts even if they were submitted before.",
+    )
+
+    # create the parser for the "LOOKUP" command
+    # -----------------------------------------------------------------------
+    lookup = subparsers.add_parser(
+        "lookup", help="find which slurm jobs ran which user jobs, and vice versa"
+    )
+    lookup = add_parser_options(lookup, "wd", "spec", "ids-optional")
+    lookup.add_argument(
+        "--slurm-id",
+        "--slurm_id",
+        type=str,
+        nargs="+",
+        help="Slurm job ids to look up, optionally with an array index "
+        "(e.g., 18334739 or 18334739_117).",
+    )
 
     # create the parser for the "COPY" command
     # -----------------------------------------------------------------------
@@ -445,21 +696,38 @@ def build_parser():
     prep_array = add_parser_options(
         prep_array, "wd", "ids", "sbatch", "spec", "dry", "do-cc"
     )
-    prep_array.add_argument(
-        "--n-parcels",
-        "--n_parcels",
-        nargs=1,
-        type=int,
-        action="store",
-        help="Manual override to specify number" "of parcels to divide yo jobz",
+    prep_array = add_array_args(prep_array)
+
+    # create the parser for the "RESUBMIT" command
+    # -----------------------------------------------------------------------
+    resubmit = subparsers.add_parser(
+        "resubmit", help="resubmit failed or missing jobs of an sbatch job array"
     )
-    prep_array.add_argument(
-        "--rate-limit",
-        "--rate_limit",
+    resubmit = add_parser_options(
+        resubmit, "wd", "ids-optional", "sbatch", "spec", "dry", "do-cc"
+    )
+    resubmit = add_array_args(resubmit)
+    resubmit.add_argument(
+        "--repack-as",
+        "--repack_as",
         type=int,
+        nargs=1,
         action="store",
-        help="Limit the number of concurrent array jobs to"
-        "the number provided, if specified.",
+        help="Instead of rerunning elements of the existing array (given by --sbatch-id), "
+        "prep a new array with this sbatch id holding only the jobs to rerun.",
+    )
+    resubmit.add_argument(
+        "--failed-only",
+        "--failed_only",
+        action="store_true",
+        help="Only resubmit jobs whose logs indicate failure, not jobs without logs (or "
+        "not started by their wrapper).",
+    )
+    resubmit.add_argument(
+        "--submit",
+        action="store_true",
+        help="Submit the resubmission to sbatch right away, instead of printing the "
+        "commands to do so.",
     )
 
     # create the parser for the "GENSCRIPTS" command
@@ -476,24 +744,119 @@ def build_parser():
     # Operations of checks that can be done
     # ~~~ status ~~~
     check_queue = check_subparsers.add_parser(
-        "queue", help="check user queue on sbatch"
+        "queue",
+        help="summarize the jobs of this working directory in the queue, by submission, "
+        "state and reason",
     )
+    check_queue = add_parser_options(check_queue, "wd", "spec")
+    check_queue = add_cache_args(check_queue)
     # ~~~ runtime ~~~
     check_runtimes = check_subparsers.add_parser(
         "runtime", help="describe runtime statistics for completed jobs"
     )
     check_runtimes = add_parser_options(check_runtimes, "wd", "spec", "ids")
+    check_runtimes = add_scan_args(check_runtimes)
+    check_runtimes.add_argument(
+        "--group-by",
+        "--group_by",
+        nargs="+",
+        metavar="COLUMN",
+        help="also describe runtimes for each group of jobs sharing values of these job "
+        "database columns (e.g., task), and list outlier jobs within each group",
+    )
+    check_runtimes.add_argument(
+        "--export",
+        metavar="PATH",
+        help="write the per-group summary (or, without --group-by, each job's runtime) to "
+        "this .csv or .parquet file",
+    )
+    # ~~~ resources ~~~
+    check_resources = check_subparsers.add_parser(
+        "resources",
+        help="describe resources used by completed jobs, and recommend what to request",
+    )
+    check_resources = add_parser_options(
+        check_resources, "wd", "spec", "ids-optional"
+    )
+    check_resources = add_scan_args(check_resources)
+    check_resources.add_argument(
+        "--percentile",
+        type=float,
+        default=95,
+        help="percentile of past usage to size recommended requests for (default: 95)",
+    )
+    check_resources.add_argument(
+        "--margin",
+        type=float,
+        default=0.1,
+        help="safety margin added to recommended memory and wall time, as a fraction "
+        "(default: 0.1, i.e. 10%%)",
+    )
+    # ~~~ efficiency ~~~
+    check_efficiency = check_subparsers.add_parser(
+        "efficiency",
+        help="compare what submitted sbatch jobs requested with what they used, from "
+        "slurm accounting (sacct)",
+    )
+    check_efficiency = add_parser_options(check_efficiency, "wd", "spec")
+    check_efficiency = add_cache_args(check_efficiency)
+    check_efficiency.add_argument(
+        "--sbatch-id",
+        "--sbatch_id",
+        "-s",
+        type=int,
+        nargs="+",
+        help="sbatch_ids to report on (default: all submissions)",
+    )
+    check_efficiency.add_argument(
+        "--chunk-size",
+        "--chunk_size",
+        type=int,
+        default=200,
+        help="number of slurm job ids to ask sacct about at once (default: 200)",
+    )
+    check_efficiency.add_argument(
+        "--export",
+        metavar="PATH",
+        help="write the report to this .csv or .parquet file",
+    )
     # ~~ completed ~~~
     check_completed = check_subparsers.add_parser(
         "completion", help="survey which jobs have been completed so far"
     )
     check_completed = add_parser_options(check_completed, "wd", "spec", "ids-optional")
+    check_completed = add_scan_args(check_completed)
     check_completed.add_argument(
         "--show-failed-logs",
         "--show_failed_logs",
         help="print the job logs for failed jobs",
         action="store_true",
     )
+    check_completed.add_argument(
+        "--quick",
+        help="only count jobs by the status wrappers recorded in the status file, "
+        "without reading any logs",
+        action="store_true",
+    )
+    # ~~~ watch ~~~
+    check_watch = check_subparsers.add_parser(
+        "watch",
+        help="follow jobs as they run, re-checking only those whose logs change",
+    )
+    check_watch = add_parser_options(check_watch, "wd", "spec", "ids-optional")
+    check_watch = add_scan_args(check_watch)
+    check_watch.add_argument(
+        "--interval",
+        type=float,
+        default=2.0,
+        help="seconds to gather changes for between updates (default: 2)",
+    )
+    check_watch.add_argument(
+        "--poll",
+        action="store_true",
+        help="poll for changed files instead of using inotify (which is not used anyway "
+        "on network filesystems, where it does not see what compute nodes write)",
+    )
     check_log = check_subparsers.add_parser("log", help="print out a given log")
     check_log = add_parser_options(check_log, "wd", "spec")
     check_log_printing = check_log.add_mutually_exclusive_group()
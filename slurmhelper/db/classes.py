@@ -1,12 +1,218 @@
+import glob
+import json
 import logging
-import pickledb
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
 
 logger = logging.getLogger("cli")
 
+SCHEMA_VERSION = 7
+
+# Rows are written in batches of this size, within a single transaction
+BATCH_SIZE = 5000
+
+# Rows are looked up by at most this many keys at a time, under SQLite's limit on the
+# number of variables in a statement (999 in older versions)
+MAX_VARIABLES = 900
+
+# State of a working directory. array_elements holds one row per (submission, array
+# element, job); array_index is NULL for jobs of serial scripts, and for jobs of --dynamic
+# arrays (any element of the array may run them). outcomes holds the latest known status
+# of each job (success, failed, running, no_log, skipped), and job_runs every time a job
+# ran, as told by runner journals; journals holds how far each journal was merged.
+# log_index caches what was parsed out of each job log, along with the log's mtime and size
+# when it was parsed, so unchanged logs are never read again. job_resources holds the resources
+# runners measured for each job's latest run (see ..jobs.runner.MEASURE_SHIM). sacct_records
+# caches Slurm accounting records of jobs (and array elements) that reached a final state.
+# script_inventory holds what each script prepped requests and runs (elements: see their
+# array part), and script_jobs which jobs each sbatch script or array part runs (array_index
+# is NULL as in array_elements). submission_scripts holds a hash of the script each
+# submission ran, so that scripts prepped again are not mistaken for ones already submitted.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    order_id INTEGER PRIMARY KEY,
+    params TEXT
+);
+CREATE TABLE IF NOT EXISTS scripts (
+    name TEXT PRIMARY KEY,
+    sbatch_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    path TEXT NOT NULL,
+    array TEXT,
+    created_at TEXT
+);
+CREATE INDEX IF NOT EXISTS scripts_sbatch_id ON scripts (sbatch_id);
+CREATE TABLE IF NOT EXISTS script_inventory (
+    name TEXT PRIMARY KEY,
+    n_jobs INTEGER,
+    job_ranges TEXT,
+    time TEXT,
+    mem TEXT,
+    n_tasks INTEGER
+);
+CREATE TABLE IF NOT EXISTS script_jobs (
+    name TEXT NOT NULL,
+    array_index INTEGER,
+    order_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS script_jobs_order_id ON script_jobs (order_id);
+CREATE INDEX IF NOT EXISTS script_jobs_name ON script_jobs (name);
+CREATE TABLE IF NOT EXISTS submissions (
+    slurm_id TEXT PRIMARY KEY,
+    sbatch_id INTEGER NOT NULL,
+    script TEXT NOT NULL,
+    array TEXT,
+    sbatch_args TEXT,
+    spec_name TEXT,
+    spec_version TEXT,
+    submitted_at TEXT,
+    token TEXT
+);
+CREATE INDEX IF NOT EXISTS submissions_sbatch_id ON submissions (sbatch_id);
+CREATE INDEX IF NOT EXISTS submissions_script ON submissions (script);
+CREATE TABLE IF NOT EXISTS submission_scripts (
+    slurm_id TEXT PRIMARY KEY REFERENCES submissions (slurm_id),
+    script_hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS array_elements (
+    slurm_id TEXT NOT NULL REFERENCES submissions (slurm_id),
+    array_index INTEGER,
+    order_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS array_elements_order_id ON array_elements (order_id);
+CREATE INDEX IF NOT EXISTS array_elements_element ON array_elements (slurm_id, array_index);
+CREATE TABLE IF NOT EXISTS outcomes (
+    order_id INTEGER PRIMARY KEY,
+    status TEXT NOT NULL,
+    slurm_id TEXT,
+    array_index INTEGER,
+    exit_code INTEGER,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS outcomes_status ON outcomes (status);
+CREATE INDEX IF NOT EXISTS outcomes_slurm_id ON outcomes (slurm_id);
+CREATE TABLE IF NOT EXISTS job_runs (
+    order_id INTEGER NOT NULL,
+    slurm_id TEXT,
+    array_index INTEGER,
+    host TEXT,
+    started_at INTEGER,
+    finished_at INTEGER,
+    exit_code INTEGER
+);
+CREATE INDEX IF NOT EXISTS job_runs_order_id ON job_runs (order_id);
+CREATE INDEX IF NOT EXISTS job_runs_slurm_id ON job_runs (slurm_id, array_index);
+CREATE TABLE IF NOT EXISTS log_index (
+    order_id INTEGER PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    success INTEGER NOT NULL,
+    runtime INTEGER
+);
+CREATE TABLE IF NOT EXISTS job_resources (
+    order_id INTEGER PRIMARY KEY,
+    walltime INTEGER,
+    max_rss_kb INTEGER,
+    user_cpu REAL,
+    sys_cpu REAL,
+    read_bytes INTEGER,
+    write_bytes INTEGER
+);
+CREATE TABLE IF NOT EXISTS sacct_records (
+    job_id TEXT PRIMARY KEY,
+    slurm_id TEXT NOT NULL,
+    array_index INTEGER,
+    state TEXT NOT NULL,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sacct_records_slurm_id ON sacct_records (slurm_id);
+CREATE TABLE IF NOT EXISTS journals (
+    path TEXT PRIMARY KEY,
+    inode INTEGER,
+    offset INTEGER NOT NULL
+);
+"""
+
+# upsert of a job's status, keeping what is known of where it ran when not given
+UPSERT_OUTCOME = """
+INSERT INTO outcomes VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (order_id) DO UPDATE SET
+    status = excluded.status,
+    slurm_id = COALESCE(excluded.slurm_id, outcomes.slurm_id),
+    array_index = COALESCE(excluded.array_index, outcomes.array_index),
+    exit_code = CASE WHEN excluded.status = 'running' THEN NULL
+                     ELSE COALESCE(excluded.exit_code, outcomes.exit_code) END,
+    updated_at = excluded.updated_at
+"""
+
+
+def insert_many(conn, sql, rows, batch_size=BATCH_SIZE):
+    """
+    Run an INSERT statement over many rows, batch_size rows at a time.
+    :param conn: sqlite3.Connection (the caller commits)
+    :param sql: str, statement with placeholders
+    :param rows: iterable of tuples
+    :param batch_size: int
+    :return: int, number of rows inserted
+    """
+    n = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            conn.executemany(sql, batch)
+            n += len(batch)
+            batch = []
+    if len(batch) > 0:
+        conn.executemany(sql, batch)
+        n += len(batch)
+    return n
+
+
+def select_in(conn, query, column, values, where=None, params=None):
+    """
+    Run a SELECT statement over the rows whose column holds any of the given values, with
+    WHERE ... IN (...) clauses of at most MAX_VARIABLES values each, so that indexes are used.
+    :param conn: sqlite3.Connection
+    :param query: str, SELECT ... FROM ... statement, without WHERE clause
+    :param column: str, column to look values up in
+    :param values: iterable of values; None for all rows
+    :param where: optional list of other conditions, with placeholders
+    :param params: optional list of values for the placeholders of where
+    :return: list of rows
+    """
+    where, params = list(where or []), list(params or [])
+    if values is None:
+        chunks = [None]
+    else:
+        values = sorted(set(values))
+        chunks = [
+            values[i : i + MAX_VARIABLES] for i in range(0, len(values), MAX_VARIABLES)
+        ]
+    rows = []
+    for chunk in chunks:
+        clauses, chunk_params = list(where), list(params)
+        if chunk is not None:
+            clauses.append(f"{column} IN ({', '.join(['?'] * len(chunk))})")
+            chunk_params += chunk
+        sql = query if len(clauses) == 0 else query + " WHERE " + " AND ".join(clauses)
+        rows += conn.execute(sql, chunk_params).fetchall()
+    return rows
+
 
 class SlurmhelperDB:
     """
-    Class for interacting with the internal database.
+    Class for interacting with the internal database: a SQLite file in the working directory
+    (<wd>/slurmhelper.sqlite), in WAL mode so that readers (e.g., check) are not blocked by a
+    writer (e.g., submit). Working directories set up by older versions of slurmhelper
+    (database.db, db.csv) are migrated on first use.
     """
 
     def __init__(self, dirs):
@@ -14,86 +220,627 @@ class SlurmhelperDB:
         Instantiates a SlurmhelperDB object.
         :param dirs: dict, result of the compute_paths() function
         """
-        from pathlib import Path
-
-        self.db_file = Path(dirs["base"]) / "database.db"
+        self.dirs = dirs
+        self.db_file = Path(dirs["base"]) / "slurmhelper.sqlite"
 
         if self.db_file.exists():
             logger.info(f"Slurmhelper DB file exists in: {str(self.db_file)}.")
-            self.__is_initialized = True
         else:
             logger.info(
-                "Slurmhelper DB file does not exist. Make sure you initialize it before moving forward."
+                f"Slurmhelper DB file does not exist yet; it will be created in "
+                f"{str(self.db_file)}."
+            )
+
+    def __repr__(self):
+        return f"SlurmhelperDB instance for interacting with {self.db_file}"
+
+    def __str__(self):
+        return self.__repr__()
+
+    def connect(self):
+        """
+        Open the database, creating (and migrating into) it if needed. Use as
+        `with closing(db.connect()) as conn, conn:` to commit upon success.
+        :return: sqlite3.Connection
+        """
+        if not self.db_file.parent.exists():
+            raise FileNotFoundError(
+                f"Working directory {self.db_file.parent} not found. Did you initialize it?"
             )
-            self.__is_initialized = False
+        conn = sqlite3.connect(str(self.db_file), timeout=60)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < SCHEMA_VERSION:
+            with conn:
+                # tables are only ever added, so the schema upgrades itself
+                conn.executescript(SCHEMA)
+                if version == 0:
+                    self._migrate_legacy(conn)
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        return conn
+
+    def _migrate_legacy(self, conn):
+        """
+        Import the state kept by older versions of slurmhelper: the job table (db.csv) and the
+        pickledb file (database.db). Legacy files are left in place.
+        :param conn: sqlite3.Connection, within a transaction
+        :return:
+        """
+        base = Path(self.dirs["base"])
+
+        if (base / "db.csv").exists():
+            import pandas as pd
+
+            n = self._insert_jobs(conn, pd.read_csv(base / "db.csv"))
+            logger.info(f"Migrated {n} jobs from {base / 'db.csv'}.")
+
+        if (base / "database.db").exists():
+            try:
+                with open(base / "database.db", "r") as f:
+                    legacy = json.load(f)
+                for key in ["dirs", "job_spec"]:
+                    if key in legacy:
+                        self._set_meta(conn, key, legacy[key])
+            except ValueError as err:
+                logger.warning(f"Could not migrate {base / 'database.db'}: {err}")
+
+    @staticmethod
+    def _set_meta(conn, key, value):
+        conn.execute(
+            "INSERT OR REPLACE INTO meta VALUES (?, ?)",
+            (key, json.dumps(value, default=str)),
+        )
+
+    @staticmethod
+    def _insert_jobs(conn, job_df):
+        return insert_many(
+            conn,
+            "INSERT OR REPLACE INTO jobs VALUES (?, ?)",
+            (
+                (int(row["order_id"]), json.dumps(row, default=str))
+                for row in job_df.to_dict(orient="records")
+            ),
+        )
 
     def initialize(self, dirs, job_df, job_spec):
         """
-        Creates a pickleDB database from scratch for a given project.
+        Fill the database for a given project (or refresh it, upon re-initialization).
         :param dirs: dict, result of the compute_paths() function
         :param job_df: pandas.DataFrame (contents of CSV file)
         :param job_spec: dict, result of reading YAML file or whatever.
         :return:
         """
+        with closing(self.connect()) as conn, conn:
+            self._set_meta(conn, "dirs", dirs)
+            self._set_meta(conn, "job_spec", job_spec)
+            conn.execute("DELETE FROM jobs")
+            n = self._insert_jobs(conn, job_df)
+        logger.info(f"Stored {n} jobs in {self.db_file}.")
 
-        if self.db_file.exists():
-            raise FileExistsError(
-                "Database file already exists for your project! You should not be initializing a new one."
+    def job_ids(self):
+        """
+        Ids of all jobs in the job table.
+        :return: sorted list of order_ids (int)
+        """
+        with closing(self.connect()) as conn:
+            rows = conn.execute("SELECT order_id FROM jobs ORDER BY order_id").fetchall()
+        return [row[0] for row in rows]
+
+    def load_jobs(self, job_list=None, columns=None):
+        """
+        The job table (contents of the CSV file given to init), as stored by initialize().
+        :param job_list: list of job ids (int) to restrict to; all jobs if None
+        :param columns: list of columns to keep besides order_id (those in the table); all
+                        if None
+        :return: pandas.DataFrame, one row per job, in order_id order
+        """
+        import pandas as pd
+
+        if job_list is not None:
+            job_list = [int(j) for j in job_list]
+        with closing(self.connect()) as conn:
+            rows = select_in(conn, "SELECT params FROM jobs", "order_id", job_list)
+        if job_list is None and len(rows) == 0:
+            raise ValueError(
+                f"No jobs found in {self.db_file}. Did you initialize this working "
+                f"directory with your job database (slurmhelper init --db)?"
             )
 
-        # Establish connection to database.
-        db = pickledb.load(self.db_file, False)
+        df = pd.DataFrame([json.loads(row[0]) for row in rows])
+        if len(df) == 0:
+            df = pd.DataFrame(columns=["order_id"] + list(columns or []))
+        if columns is not None:
+            columns = [c for c in columns if c in df.columns and c != "order_id"]
+            df = df[["order_id"] + columns]
+        return df.sort_values("order_id").reset_index(drop=True)
 
-        # Add a key to store the directory tree map
-        db.set("dirs", dirs)
+    def add_scripts(self, scripts):
+        """
+        Record scripts written by prep / prep-array (overwriting records of the same name),
+        along with what they request and which jobs they run.
+        :param scripts: list of dicts with keys name, sbatch_id, kind (sbatch, array or
+                        element), path, and optionally array (--array index list), time,
+                        mem, n_tasks, and jobs ({array index or None: [job ids]})
+        :return:
+        """
+        from ..utils.misc import compact_index_ranges
 
-        # Add a key for our dataframe with jobs (already validated by the CLI interface class)
-        db.set("job_df", job_df)
+        created_at = datetime.now().isoformat(timespec="seconds")
+        with closing(self.connect()) as conn, conn:
+            conn.executemany(
+                "DELETE FROM script_jobs WHERE name = ?", [(s["name"],) for s in scripts]
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO script_inventory VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        s["name"],
+                        None
+                        if "jobs" not in s
+                        else sum([len(jobs) for jobs in s["jobs"].values()]),
+                        None
+                        if "jobs" not in s
+                        else compact_index_ranges(
+                            [j for jobs in s["jobs"].values() for j in jobs]
+                        ),
+                        None if s.get("time", None) is None else str(s["time"]),
+                        None if s.get("mem", None) is None else str(s["mem"]),
+                        s.get("n_tasks", None),
+                    )
+                    for s in scripts
+                ],
+            )
+            insert_many(
+                conn,
+                "INSERT INTO script_jobs VALUES (?, ?, ?)",
+                (
+                    (s["name"], idx, int(job))
+                    for s in scripts
+                    for (idx, jobs) in s.get("jobs", dict()).items()
+                    for job in jobs
+                ),
+            )
+            insert_many(
+                conn,
+                "INSERT OR REPLACE INTO scripts VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        s["name"],
+                        int(s["sbatch_id"]),
+                        s["kind"],
+                        str(s["path"]),
+                        s.get("array", None),
+                        created_at,
+                    )
+                    for s in scripts
+                ),
+            )
 
-        # Add a key for our job spec
-        db.set(
-            "job_spec", job_spec
-        )  # should point to dict with spec, or to the JobSpec class, when finished...
+    def find_scripts(self, kind=None):
+        """
+        Scripts recorded by prep / prep-array, with what they request and run (n_jobs,
+        job_ranges, time, mem and n_tasks; None for scripts prepped by older versions).
+        :param kind: str, only return scripts of this kind (sbatch, array or element)
+        :return: list of dicts, sorted by name
+        """
+        query = (
+            "SELECT s.*, i.n_jobs, i.job_ranges, i.time, i.mem, i.n_tasks "
+            "FROM scripts s LEFT JOIN script_inventory i USING (name)"
+        )
+        params = []
+        if kind is not None:
+            query += " WHERE s.kind = ?"
+            params.append(kind)
+        with closing(self.connect()) as conn:
+            rows = conn.execute(query + " ORDER BY name", params).fetchall()
+        return [dict(row) for row in rows]
 
-        # Add a key for our job objects
-        db.set("job_obj_dict", dict())
+    def find_script_jobs(self, job_list=None, status=None):
+        """
+        Which sbatch scripts and array parts (and elements) run given jobs.
+        :param job_list: list of job ids (int); all jobs if None
+        :param status: str, only jobs whose latest known status is this one (see
+                       find_outcomes())
+        :return: list of dicts (name, array_index, order_id), sorted by name and job id
+        """
+        query = "SELECT j.name, j.array_index, j.order_id FROM script_jobs j"
+        where, params = [], []
+        if status is not None:
+            query += " JOIN outcomes o USING (order_id)"
+            where.append("o.status = ?")
+            params.append(status)
+        if job_list is not None:
+            job_list = [int(j) for j in job_list]
+        with closing(self.connect()) as conn:
+            rows = select_in(conn, query, "j.order_id", job_list, where, params)
+        return sorted(
+            [dict(row) for row in rows], key=lambda r: (r["name"], r["order_id"])
+        )
 
-        # Add a key for our sbatch jobs
-        db.set("sbatch_jobs", dict())
+    def add_sbatch_job(self, sbatch_id, sbatch_job):
+        """
+        Record a submission of an sbatch job. Submitting the same Slurm job id again
+        replaces its previous record.
+        :param sbatch_id: sbatch_id (int)
+        :param sbatch_job: dict with keys slurm_id, script, and optionally array (sbatch
+                           --array index list), sbatch_args, spec_name, spec_version,
+                           submitted_at, token, script_hash (see
+                           ..jobs.submit.script_hash()), and elements ({array index or
+                           None: [job ids]})
+        :return:
+        """
+        if not isinstance(sbatch_job, dict) or "slurm_id" not in sbatch_job:
+            raise ValueError(
+                f"You did not provide a valid sbatch job record to add. Aborting."
+            )
 
-        db.dump()
+        slurm_id = str(sbatch_job["slurm_id"])
+        with closing(self.connect()) as conn, conn:
+            conn.execute("DELETE FROM array_elements WHERE slurm_id = ?", (slurm_id,))
+            conn.execute(
+                "INSERT OR REPLACE INTO submissions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    slurm_id,
+                    int(sbatch_id),
+                    sbatch_job["script"],
+                    sbatch_job.get("array", None),
+                    json.dumps(sbatch_job.get("sbatch_args", [])),
+                    sbatch_job.get("spec_name", None),
+                    sbatch_job.get("spec_version", None),
+                    sbatch_job.get("submitted_at", None),
+                    sbatch_job.get("token", None),
+                ),
+            )
+            if sbatch_job.get("script_hash", None) is not None:
+                conn.execute(
+                    "INSERT OR REPLACE INTO submission_scripts VALUES (?, ?)",
+                    (slurm_id, sbatch_job["script_hash"]),
+                )
+            n = insert_many(
+                conn,
+                "INSERT INTO array_elements VALUES (?, ?, ?)",
+                (
+                    (slurm_id, idx, int(job))
+                    for (idx, jobs) in sbatch_job.get("elements", dict()).items()
+                    for job in jobs
+                ),
+            )
 
-    def __repr__(self):
-        return f"SlurmhelperDB instance for interacting with {self.db_file}"
+        logger.info(f"Recorded slurm job {slurm_id} (sbatch_id {sbatch_id}, {n} jobs).")
 
-    def __str__(self):
-        return self.__repr__()
+    def has_sbatch_job(self, slurm_id):
+        """
+        Whether a Slurm job id was recorded.
+        :param slurm_id: str, Slurm job id
+        :return: bool
+        """
+        with closing(self.connect()) as conn:
+            return (
+                conn.execute(
+                    "SELECT 1 FROM submissions WHERE slurm_id = ?", (str(slurm_id),)
+                ).fetchone()
+                is not None
+            )
 
-    def add_sbatch_job(self, sbatch_id, sbatch_job):
+    def find_submissions(self, script, sbatch_args=None, script_hash=None):
+        """
+        Previous submissions of a script, with the same extra sbatch arguments.
+        :param script: str, script name without extension (e.g., sb-0001)
+        :param sbatch_args: list of extra arguments given to sbatch
+        :param script_hash: only submissions of the script with these contents (see
+                            ..jobs.submit.script_hash()); submissions recorded without a
+                            hash, by older versions of slurmhelper, always match
+        :return: list of dicts, oldest first
+        """
+        query = (
+            "SELECT s.* FROM submissions s "
+            "LEFT JOIN submission_scripts h ON h.slurm_id = s.slurm_id "
+            "WHERE s.script = ? AND s.sbatch_args = ?"
+        )
+        params = [script, json.dumps(sbatch_args or [])]
+        if script_hash is not None:
+            query += " AND (h.script_hash = ? OR h.script_hash IS NULL)"
+            params.append(script_hash)
+        with closing(self.connect()) as conn:
+            rows = conn.execute(
+                query + " ORDER BY s.submitted_at, s.rowid", params
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def list_submissions(self, sbatch_ids=None):
+        """
+        All recorded submissions.
+        :param sbatch_ids: list of sbatch_ids (int) to restrict to; all if None
+        :return: list of dicts, oldest first
+        """
+        if sbatch_ids is not None:
+            sbatch_ids = [int(i) for i in sbatch_ids]
+        with closing(self.connect()) as conn:
+            rows = select_in(
+                conn, "SELECT rowid, * FROM submissions", "sbatch_id", sbatch_ids
+            )
+        rows = sorted(rows, key=lambda row: (row["submitted_at"] or "", row["rowid"]))
+        return [{k: row[k] for k in row.keys() if k != "rowid"} for row in rows]
+
+    def find_slurm_jobs(self, job_id):
         """
-        Add an sbatch job to the dict. One at a time, please!
-        :param sbatch_id: sbatch_id (integer?)
-        :param sbatch_job: sbatch job object.
+        Which Slurm jobs (and array elements) were submitted to run a given user job.
+        :param job_id: int, order_id of the user job
+        :return: list of dicts (slurm_id, array_index, sbatch_id, script, submitted_at),
+                 most recent submission first. array_index is None if unknown ahead of
+                 time (serial scripts, and --dynamic arrays).
+        """
+        with closing(self.connect()) as conn:
+            rows = conn.execute(
+                "SELECT e.slurm_id, e.array_index, s.sbatch_id, s.script, s.submitted_at "
+                "FROM array_elements e JOIN submissions s USING (slurm_id) "
+                "WHERE e.order_id = ? ORDER BY s.submitted_at DESC, s.rowid DESC",
+                (int(job_id),),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def find_user_jobs(self, slurm_id, array_index=None):
+        """
+        Which user jobs were submitted in a given Slurm job (or array element).
+        :param slurm_id: str, Slurm job id
+        :param array_index: int, array element (None for all jobs of the Slurm job)
+        :return: sorted list of job ids (int)
+        """
+        query = "SELECT order_id FROM array_elements WHERE slurm_id = ?"
+        params = [str(slurm_id)]
+        if array_index is not None:
+            # jobs of --dynamic arrays may run in any element
+            query += " AND (array_index = ? OR array_index IS NULL)"
+            params.append(int(array_index))
+        with closing(self.connect()) as conn:
+            return sorted([row[0] for row in conn.execute(query, params)])
+
+    def record_outcomes(self, outcomes):
+        """
+        Record the latest known status of jobs.
+        :param outcomes: list of dicts with keys order_id, status, and optionally slurm_id,
+                         array_index, exit_code
         :return:
         """
-        # Establish connection to database.
-        db = pickledb.load(self.db_file, False)
+        updated_at = datetime.now().isoformat(timespec="seconds")
+        with closing(self.connect()) as conn, conn:
+            insert_many(
+                conn,
+                UPSERT_OUTCOME,
+                (
+                    (
+                        int(o["order_id"]),
+                        o["status"],
+                        o.get("slurm_id", None),
+                        o.get("array_index", None),
+                        o.get("exit_code", None),
+                        updated_at,
+                    )
+                    for o in outcomes
+                ),
+            )
 
-        if sbatch_id in db.get("sbatch_jobs").keys():
-            raise ValueError(
-                f"The specified sbatch_id ({sbatch_id}) already exists in the database. "
-                f"Aborting operation to avoid adding a duplicate!"
+    def merge_journals(self, dirs):
+        """
+        Merge the job events appended to runner journals (see ..jobs.runner.journal_path())
+        since the last merge. Only complete lines are read, starting from the offset up to
+        which each journal was merged before, so each merge only reads new events. Journals
+        that were replaced since (e.g., a script prepped again) are merged from the start.
+        :param dirs: dict, result of the compute_paths() function
+        :return: int, number of events merged
+        """
+        journals = sorted(glob.glob(os.path.join(dirs["slurm_logs"], "*.journal")))
+        n_events = 0
+        with closing(self.connect()) as conn, conn:
+            offsets = {
+                row["path"]: (row["inode"], row["offset"])
+                for row in conn.execute("SELECT path, inode, offset FROM journals")
+            }
+            for path in journals:
+                stat = os.stat(path)
+                (inode, offset) = offsets.get(path, (stat.st_ino, 0))
+                if inode != stat.st_ino or stat.st_size < offset:
+                    logger.warning(f"Journal {path} was replaced; merging it from the start.")
+                    offset = 0
+                size = stat.st_size
+                if size == offset:
+                    continue
+                with open(path, "rb") as f:
+                    f.seek(offset)
+                    chunk = f.read(size - offset)
+                # a line still being written is left for the next merge
+                end = chunk.rfind(b"\n") + 1
+                events = [
+                    line.split()
+                    for line in chunk[:end].decode("utf-8", "replace").splitlines()
+                ]
+                n_events += self._apply_events(
+                    conn, [e for e in events if len(e) == 7 and e[2].isdigit()]
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO journals VALUES (?, ?, ?)",
+                    (path, stat.st_ino, offset + end),
+                )
+        logger.info(f"Merged {n_events} job events from {len(journals)} journals.")
+        return n_events
+
+    @staticmethod
+    def _apply_events(conn, events):
+        """
+        Apply journal events to job_runs and outcomes.
+        :param conn: sqlite3.Connection, within a transaction
+        :param events: list of lists [epoch, event, job id, exit code, slurm job id,
+                       array index, host], oldest first
+        :return: int, number of events applied
+        """
+        for (epoch, event, job_id, rc, slurm_id, array_index, host) in events:
+            job_id = int(job_id)
+            slurm_id = None if slurm_id == "NA" else slurm_id
+            array_index = int(array_index) if array_index.isdigit() else None
+            updated_at = datetime.fromtimestamp(int(epoch)).isoformat(timespec="seconds")
+            if event == "start":
+                conn.execute(
+                    "INSERT INTO job_runs VALUES (?, ?, ?, ?, ?, NULL, NULL)",
+                    (job_id, slurm_id, array_index, host, int(epoch)),
+                )
+                status, exit_code = "running", None
+            elif event == "end":
+                exit_code = int(rc)
+                conn.execute(
+                    "UPDATE job_runs SET finished_at = ?, exit_code = ? "
+                    "WHERE order_id = ? AND slurm_id IS ? AND array_index IS ? "
+                    "AND finished_at IS NULL",
+                    (int(epoch), exit_code, job_id, slurm_id, array_index),
+                )
+                status = "success" if exit_code == 0 else "failed"
+            elif event == "skip":
+                if (
+                    conn.execute(
+                        "SELECT 1 FROM outcomes WHERE order_id = ? AND status = 'success'",
+                        (job_id,),
+                    ).fetchone()
+                    is not None
+                ):
+                    continue
+                status, exit_code = "skipped", None
+            else:
+                continue
+            conn.execute(
+                UPSERT_OUTCOME,
+                (job_id, status, slurm_id, array_index, exit_code, updated_at),
             )
+        return len(events)
 
-        # TODO: fix this ASAP once SbatchJob is implemented!!!!!!!
-        if not isinstance(sbatch_job, str):
-            raise ValueError(
-                f"You did not provide a valid SbatchJob object to add. Aborting."
+    def find_log_index(self):
+        """
+        What was parsed out of job logs so far (see update_log_index()).
+        :return: dict {order_id: (mtime_ns, size, success, runtime)}
+        """
+        with closing(self.connect()) as conn:
+            rows = conn.execute(
+                "SELECT order_id, mtime_ns, size, success, runtime FROM log_index"
+            ).fetchall()
+        return {row[0]: (row[1], row[2], bool(row[3]), row[4]) for row in rows}
+
+    def update_log_index(self, entries):
+        """
+        Record what was parsed out of job logs.
+        :param entries: list of tuples (order_id, mtime_ns, size, success, runtime)
+        :return:
+        """
+        with closing(self.connect()) as conn, conn:
+            insert_many(
+                conn,
+                "INSERT OR REPLACE INTO log_index VALUES (?, ?, ?, ?, ?)",
+                (
+                    (int(j), int(mtime), int(size), int(bool(ok)), rt)
+                    for (j, mtime, size, ok, rt) in entries
+                ),
             )
 
-        db.dadd("sbatch_jobs", sbatch_job)
+    def clear_log_index(self):
+        """
+        Forget what was parsed out of job logs, so that they are all read again.
+        :return:
+        """
+        with closing(self.connect()) as conn, conn:
+            conn.execute("DELETE FROM log_index")
 
-        db.dump()
+    def update_job_resources(self, rows):
+        """
+        Record the resources used by jobs.
+        :param rows: list of dicts with keys order_id, walltime (seconds), max_rss_kb,
+                     user_cpu, sys_cpu (seconds), read_bytes and write_bytes
+        :return:
+        """
+        with closing(self.connect()) as conn, conn:
+            insert_many(
+                conn,
+                "INSERT OR REPLACE INTO job_resources VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        int(row["order_id"]),
+                        row["walltime"],
+                        row["max_rss_kb"],
+                        row["user_cpu"],
+                        row["sys_cpu"],
+                        row["read_bytes"],
+                        row["write_bytes"],
+                    )
+                    for row in rows
+                ),
+            )
+
+    def find_job_resources(self, job_list=None):
+        """
+        Resources used by jobs, as measured by their runners.
+        :param job_list: list of job ids (int); all jobs if None
+        :return: dict {order_id: row dict}
+        """
+        if job_list is not None:
+            job_list = [int(j) for j in job_list]
+        with closing(self.connect()) as conn:
+            rows = select_in(conn, "SELECT * FROM job_resources", "order_id", job_list)
+        return {row["order_id"]: dict(row) for row in rows}
+
+    def add_sacct_records(self, records):
+        """
+        Cache Slurm accounting records. Only records of jobs in a final state should be
+        given, since they are never queried again.
+        :param records: list of record dicts (see ..utils.scheduler.parse_sacct_output())
+        :return:
+        """
+        with closing(self.connect()) as conn, conn:
+            insert_many(
+                conn,
+                "INSERT OR REPLACE INTO sacct_records VALUES (?, ?, ?, ?, ?)",
+                (
+                    (
+                        r["job_id"],
+                        r["slurm_id"],
+                        r["array_index"],
+                        r["state"],
+                        json.dumps(r),
+                    )
+                    for r in records
+                ),
+            )
+
+    def find_sacct_records(self, slurm_ids):
+        """
+        Cached Slurm accounting records (see add_sacct_records()).
+        :param slurm_ids: list of Slurm job ids
+        :return: dict {job id (e.g., 123 or 123_4): record dict}
+        """
+        with closing(self.connect()) as conn:
+            rows = select_in(
+                conn,
+                "SELECT record FROM sacct_records",
+                "slurm_id",
+                [str(s) for s in slurm_ids],
+            )
+        return {r["job_id"]: r for r in (json.loads(row[0]) for row in rows)}
+
+    def find_outcomes(self, job_list=None, status=None):
+        """
+        Latest known status of jobs.
+        :param job_list: list of job ids (int); all jobs if None
+        :param status: str, only return jobs with this status
+        :return: dict {order_id: row dict}
+        """
+        where, params = [], []
+        if status is not None:
+            where.append("status = ?")
+            params.append(status)
+        if job_list is not None:
+            job_list = [int(j) for j in job_list]
+        with closing(self.connect()) as conn:
+            rows = select_in(
+                conn, "SELECT * FROM outcomes", "order_id", job_list, where, params
+            )
+        return {row["order_id"]: dict(row) for row in rows}
 
     def add_user_job(self, job):
         """
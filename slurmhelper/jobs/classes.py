@@ -1,5 +1,6 @@
 import copy
 import glob
+import hashlib
 import json
 import logging
 import os
@@ -8,6 +9,29 @@ from string import Template, Formatter
 
 logger = logging.getLogger("cli")
 
+# Added to run scripts when the spec asks to skip jobs whose outputs are up to date
+SKIP_GUARD_TEMPLATE = """
+# ~~~~~~~~~~~~~ slurmhelper: skip this job if its outputs are up to date ~~~~~~~~~~~~~
+_sh_fingerprint=${fingerprint}
+_sh_marker=${marker}
+if [ -z "$${SLURMHELPER_FORCE:-}" ] && [ -f "$$_sh_marker" ] && [ "$$(cat "$$_sh_marker")" = "$$_sh_fingerprint" ]; then
+    echo "[slurmhelper] job ${job_id}: outputs are up to date (fingerprint $${_sh_fingerprint}); skipping"
+    # tell the runner, so that this run is not counted in runtime statistics
+    if [ -n "$${SLURMHELPER_UP_TO_DATE_FILE:-}" ]; then : > "$$SLURMHELPER_UP_TO_DATE_FILE"; fi
+    echo 0
+    exit 0
+fi
+# record the fingerprint next to the outputs once the job succeeds: the runner does it once
+# this script exits 0 (so that traps of the script's own do not get in the way), or, when the
+# script is run by hand, an EXIT trap
+if [ -n "$${SLURMHELPER_FINGERPRINT_FILE:-}" ]; then
+    printf '%s\\n%s\\n' "$$_sh_marker" "$$_sh_fingerprint" > "$$SLURMHELPER_FINGERPRINT_FILE"
+else
+    trap '_sh_rc=$$?; if [ "$$_sh_rc" -eq 0 ]; then mkdir -p "$$(dirname "$$_sh_marker")" && echo "$$_sh_fingerprint" > "$$_sh_marker"; fi' EXIT
+fi
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+"""
+
 
 class Job:
     """
@@ -32,6 +56,7 @@ class Job:
         self.compute_paths(config, verbose)
 
         self._is_scripted = False
+        self._fingerprint = None
 
     def __str__(self):
         return "{job:05d}".format(job=self.id)
@@ -219,8 +244,62 @@ class Job:
         if cnt > 0:
             self.is_scripted = True
 
+        if config.get("skip_up_to_date", False) and self.script_run is not None:
+            self._add_skip_guard()
+
         return cnt > 0
 
+    @property
+    def fingerprint(self):
+        """
+        Fingerprint of what this job does: a hash of its parameters and of its rendered
+        run script. Only available once scripts are computed.
+        :return: str, hex digest
+        """
+        if self._fingerprint is None:
+            payload = json.dumps(
+                {"params": self.params, "run_script": self.script_run},
+                sort_keys=True,
+                default=str,
+            )
+            self._fingerprint = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+        return self._fingerprint
+
+    @property
+    def fingerprint_marker(self):
+        """
+        Where the fingerprint of this job is kept once it succeeds: alongside its outputs,
+        so that removing the outputs also invalidates it.
+        :return: str, path (None if the spec does not define this_job_output_dir)
+        """
+        if "this_job_output_dir" not in self.params:
+            return None
+        return os.path.join(self.params["this_job_output_dir"], ".slurmhelper_fingerprint")
+
+    def _add_skip_guard(self):
+        """
+        Make the run script skip the job (reporting success) if a previous successful run
+        left the same fingerprint next to its outputs. Set SLURMHELPER_FORCE=1 to run it
+        regardless.
+        """
+        if self.fingerprint_marker is None:
+            logger.warning(
+                f"Job {self}: skip_up_to_date requires output_path_subject in your spec "
+                f"(for this_job_output_dir); the job will always run."
+            )
+            return
+
+        guard = Template(SKIP_GUARD_TEMPLATE).substitute(
+            fingerprint=self.fingerprint,
+            marker=self.fingerprint_marker,
+            job_id=str(self),
+        )
+        lines = self.script_run.split("\n")
+        if lines[0].startswith("#!"):
+            self.script_run = "\n".join([lines[0] + guard] + lines[1:])
+        else:
+            self.script_run = guard.lstrip("\n") + self.script_run
+
     def _write(self, operation):
         p = Path(self._basedirs["job_scripts"])  # target path
         if not p.exists():
@@ -264,6 +343,9 @@ class Job:
         self._jd["this_job_log_file"] = str(
             Path(bd["job_logs"]).joinpath("%s.txt" % (str(self)))
         )
+        self._jd["this_job_sidecar_file"] = str(
+            Path(bd["job_logs"]).joinpath("%s.json" % (str(self)))
+        )
         self._jd["this_job_inputs_dir"] = str(
             Path(bd["job_inputs"]).joinpath(str(self))
         )
@@ -319,9 +401,38 @@ class Job:
 
     @property
     def ran_successfully(self):
+        sidecar = self.read_job_sidecar()
+        if sidecar is not None:
+            return sidecar["exit_code"] == 0
         # assumption: exit code is last line!
-        lines = self.read_job_log_lines()
-        return lines[-1] == "0"
+        lines = self.read_job_log_tail(1)
+        return len(lines) > 0 and lines[-1] == "0"
+
+    def read_job_sidecar(self):
+        """
+        What the runner recorded about this job once it was over (see
+        ..utils.reporting.read_job_sidecar()).
+        :return: dict, or None if there is no sidecar (e.g., the job ran with an older wrapper)
+        """
+        from ..utils.reporting import read_job_sidecar
+
+        return read_job_sidecar(self._jd["this_job_sidecar_file"])
+
+    def read_job_log_tail(self, n):
+        """
+        Last n lines of the job log (see read_job_log_lines()), read from the end of the file.
+        :param n: number of lines
+        :return: list of str
+        """
+        from ..utils.reporting import read_log_tail_lines
+
+        if not self.has_job_log:
+            raise FileNotFoundError(
+                f"No log file is available for job {self.id} in "
+                f"{self._jd['this_job_log_file']}!"
+            )
+
+        return read_log_tail_lines(self._jd["this_job_log_file"], n)
 
     def read_job_log_lines(self):
         from ..utils.reporting import read_log_file_lines
@@ -377,6 +488,9 @@ class TestableJob(Job):
         self._path_log = os.path.join(
             paths["job_logs"], "{job:05d}.txt".format(job=self.id)
         )
+        self._path_sidecar = os.path.join(
+            paths["job_logs"], "{job:05d}.json".format(job=self.id)
+        )
         self.config = config
         # run tests
         self.run_tests()
@@ -461,28 +575,41 @@ class TestableJob(Job):
     def test_check_logs(self):
         rv = {"result": False, "logs": []}
 
-        if not os.path.isfile(self._path_log):
+        from ..utils.reporting import read_job_sidecar
+
+        sidecar = read_job_sidecar(self._path_sidecar)
+        if sidecar is not None:
+            if sidecar["exit_code"] == 0:
+                rv["result"] = True
+            else:
+                rv["logs"].append(
+                    "Job exited with code {rc} on {host}.".format(
+                        rc=sidecar["exit_code"], host=sidecar["host"]
+                    )
+                )
+        elif not os.path.isfile(self._path_log):
             rv["logs"].append(
                 "Job log file NOT found at {dir}".format(dir=self._path_log)
             )
         else:
-            with open(self._path_log, "r") as logfile:
-                log = logfile.read().splitlines()
-                if len(log) == 0:
-                    rv["logs"].append("Log file is empty.")
-                elif len(log) == 1:
-                    rv["logs"].append(
-                        "Log file is one line long? Weird. Line is:\n{line1}".format(
-                            line1=log[0]
-                        )
-                    )
-                elif log[-1] == "0" and log[-2] == "SUCCESS":
-                    rv["result"] = True
-                else:
-                    rv["logs"].append(
-                        "Log ending is not as expected. Last two lines are:"
-                        "\n{line1}\n{line2}".format(line1=log[-2], line2=log[-1])
+            from ..utils.reporting import read_log_tail_lines
+
+            log = read_log_tail_lines(self._path_log, 2)
+            if len(log) == 0:
+                rv["logs"].append("Log file is empty.")
+            elif len(log) == 1:
+                rv["logs"].append(
+                    "Log file is one line long? Weird. Line is:\n{line1}".format(
+                        line1=log[0]
                     )
+                )
+            elif log[-1] == "0" and log[-2] == "SUCCESS":
+                rv["result"] = True
+            else:
+                rv["logs"].append(
+                    "Log ending is not as expected. Last two lines are:"
+                    "\n{line1}\n{line2}".format(line1=log[-2], line2=log[-1])
+                )
 
         # Append results to results dict
         self._tests_results["check_log"] = rv
@@ -1,20 +1,187 @@
+import copy
+import glob
 import logging
+import math
 import os
+import shutil
 from string import Template
 from time import sleep
 
+import pandas as pd
 import progressbar
 
-from .utils import build_job_objects
-from ..utils.io import write_job_script
-from ..utils.misc import split_list
-from ..utils.time import calculate_wall_time, calculate_min_number_of_parcels
+from .runner import (
+    build_runner,
+    queue_record_width,
+    resolve_packing,
+    write_job_queue,
+)
+from .utils import build_job_objects, group_resource_classes, load_job_resources
+from ..db import SlurmhelperDB
+from ..utils.io import (
+    ensure_status_file,
+    load_sbatch_manifest,
+    write_job_script,
+    write_sbatch_manifest,
+)
+from ..utils.misc import compact_index_ranges, split_list
+from ..utils.scheduler import (
+    array_part_capacity,
+    resolve_array_limits,
+    scheduler_cache_dir,
+)
+from ..utils.time import (
+    calculate_wall_time,
+    calculate_min_number_of_parcels,
+    calculate_min_number_of_parcels_from_estimates,
+    delta_to_slurm_time,
+    estimate_job_times,
+    estimate_wall_time,
+    slurm_time_to_seconds,
+)
 
 logger = logging.getLogger("cli")
 
+ARRAY_SIGNAL_FORWARDING = """# pass slurm's warning signal on to the array element (started in the background)
+_sh_forward_to_element() {
+    local rc=""
+    _sh_element_pid=$!
+    trap 'kill -USR1 "$_sh_element_pid" 2> /dev/null || true' USR1
+    until [ -n "$rc" ]; do
+        wait "$_sh_element_pid" && rc=0 || rc=$?
+        if [ "$rc" -gt 128 ] && kill -0 "$_sh_element_pid" 2> /dev/null; then
+            rc=""
+        fi
+    done
+    return "$rc"
+}
+"""
+
+
+def load_runtime_history(config, job_list, paths, args):
+    """
+    Estimate per-job runtimes for the jobs being prepped, from the runtimes of jobs already
+    completed in this working directory (see ..utils.reporting:runtime_model_from_logs()).
+    The percentile and safety margin come from --time-percentile / --time-margin, or the
+    duration_model dict in your spec (e.g., {percentile: 95, margin: 0.1, min_samples: 5}).
+    :param config: dict, output of load_spec()
+    :param job_list: list of jobs to prepare
+    :param paths: dict output of calculate_directories()
+    :param args: parsed ArgParse object
+    :return: tuple (dict mapping job id to timedelta, margin); None if --static-time was
+             given, or if there is not enough history to estimate runtimes for these jobs.
+    """
+    from ..utils.reporting import runtime_model_from_logs
+
+    if args.static_time:
+        return None
+
+    model_cfg = config.get("duration_model", None) or dict()
+    percentile = args.time_percentile
+    if percentile is None:
+        percentile = model_cfg.get("percentile", 95)
+    margin = args.time_margin
+    if margin is None:
+        margin = model_cfg.get("margin", 0.1)
+
+    model = runtime_model_from_logs(
+        paths,
+        config,
+        percentile,
+        getattr(args, "scan_workers", None),
+        getattr(args, "rescan", False),
+    )
+    db = SlurmhelperDB(paths).load_jobs(job_list, model["columns"])
+    job_times = estimate_job_times(model, db, job_list)
+
+    if job_times is None:
+        logger.info(
+            f"Not enough runtime history ({model['n']} completed jobs) to estimate wall "
+            f"time; using job_time from the spec."
+        )
+        return None
+
+    print(
+        f"Wall time estimated from the runtimes of {model['n']} completed jobs "
+        f"(p{percentile} per job, +{margin * 100:.0f}% margin)."
+    )
+    return job_times, margin
+
+
+def parcel_wall_time(parcels, config, concurrency=1, history=None):
+    """
+    Wall time for the longest of a set of parcels (lists of jobs) that share an sbatch header.
+    :param parcels: list of lists of job ids
+    :param config: dict, output of load_spec()
+    :param concurrency: number of jobs run at once within each parcel
+    :param history: output of load_runtime_history(), or None to use the spec's job_time
+    :return: wall time, formatted as string
+    """
+    if history is None:
+        time = calculate_wall_time(
+            max([len(p) for p in parcels]), config, concurrency
+        )  # we should use the maximum wall time for parcels
+    else:
+        job_times, margin = history
+        times = [
+            estimate_wall_time(
+                [job_times[int(j)] for j in p], config, concurrency, margin
+            )
+            for p in parcels
+        ]
+        time = max(times, key=slurm_time_to_seconds)
+    return cap_wall_time(time, config)
+
+
+def cap_wall_time(time, config):
+    """
+    Keep a wall time estimate within the spec's max_job_time, warning if it had to be cut.
+    :param time: wall time, formatted as string
+    :param config: dict, output of load_spec()
+    :return: wall time, formatted as string
+    """
+    max_job_time = config.get("max_job_time", None)
+    if max_job_time is None:
+        return time
+    if slurm_time_to_seconds(time) <= max_job_time.total_seconds():
+        return time
+    capped = delta_to_slurm_time(max_job_time)
+    logger.warning(
+        f"Estimated wall time ({time}) exceeds max_job_time; requesting {capped} instead. "
+        f"Jobs that do not fit in it will be left for you to resubmit."
+    )
+    return capped
+
+
+def job_time_estimates(job_list, config, history=None):
+    """
+    Runtime to expect from each of a list of jobs, used by element runners to tell whether
+    a job will fit in the walltime left.
+    :param job_list: list of job ids
+    :param config: dict, output of load_spec()
+    :param history: output of load_runtime_history() (estimates get its safety margin), or
+                    None to use the spec's job_time for every job
+    :return: dict with a timedelta for each job id (integers)
+    """
+    if history is None:
+        return {int(j): config["job_time"] for j in job_list}
+    job_times, margin = history
+    return {int(j): job_times[int(j)] * (1 + margin) for j in job_list}
+
 
 # Implementation of the prep portion of the script...
-def prep_job(config, job_list, paths, args, array_job_index=None):
+def prep_job(
+    config,
+    job_list,
+    paths,
+    args,
+    array_job_index=None,
+    packing=None,
+    name_prefix=None,
+    walltime=None,
+    queue=None,
+    job_times=None,
+):
     """
         Will create a submission wrapper for one or more jobs, which
         are aggregated to be run serially. This function can be used for
@@ -27,6 +194,15 @@ def prep_job(config, job_list, paths, args, array_job_index=None):
         :param args: parsed ArgParse object
         :param array_job_index: None if this is not to be run as array;
                                 integer if part of array.jobs
+        :param packing: tuple (concurrency, n_tasks, mem), as returned by
+                        resolve_packing(). Computed from args if not given.
+        :param name_prefix: prefix for array element script names (defaults to
+                            sb-<sbatch_id>; e.g. sb-0001-part2 for parts of a family).
+        :param walltime: wall time requested for the array this element belongs to.
+        :param queue: tuple (path, record width) of a job queue that the element
+                      pulls jobs from, instead of running job_list (dynamic mode).
+        :param job_times: dict with the estimated runtime of each job, as returned by
+                          job_time_estimates(). Computed if not given.
     ❯ ls
     00001_clean.sh 00001_run.sh   00002_copy.sh  00003_clean.sh 00003_run.sh
     00001_copy.sh  00002_clean.sh 00002_run.sh   00003_copy.sh
@@ -37,24 +213,32 @@ def prep_job(config, job_list, paths, args, array_job_index=None):
     """
 
     logger.info("========== BEGIN PREPPING SERIAL JOB ==========")
-    # Wall time
+    # How many jobs to run at once, and resources to request for them
+    if packing is None:
+        packing = resolve_packing(config, args)
+    concurrency, n_tasks, mem = packing
 
     # Give me a good job name
-    if args.operation == "prep-array" and array_job_index is not None:
-        job_name = "sb-{sbatch_id:04d}-{array_job_index:03d}".format(
-            sbatch_id=args.sbatch_id[0], array_job_index=array_job_index
+    if array_job_index is not None:
+        if name_prefix is None:
+            name_prefix = "sb-{sbatch_id:04d}".format(sbatch_id=args.sbatch_id[0])
+        job_name = "{prefix}-{array_job_index:03d}".format(
+            prefix=name_prefix, array_job_index=array_job_index
         )
     else:
         job_name = "sb-{sbatch_id:04d}".format(sbatch_id=args.sbatch_id[0])
 
     # begin assembling the thingy
-    if args.no_header or args.operation == "prep-array":
+    time = walltime
+    history = None
+    if args.no_header or array_job_index is not None:
         header_f = "\n".join(["""#!/bin/bash -e""", config["preamble"]])
     else:
         if args.time is not None:  # use manually specified time
             time = args.time
-        else:  # calculate wall time using our current assumptions
-            time = calculate_wall_time(len(job_list), config)
+        else:  # estimate from past runtimes, or from our current assumptions
+            history = load_runtime_history(config, job_list, paths, args)
+            time = parcel_wall_time([job_list], config, concurrency, history)
         # Figure out the log path
         log_out = os.path.join(
             paths["slurm_logs"], "{job_name}.txt".format(job_name=job_name)
@@ -62,28 +246,27 @@ def prep_job(config, job_list, paths, args, array_job_index=None):
         hdr = Template(config["header"]).safe_substitute(
             job_name=job_name,
             log_path=log_out,
-            n_tasks=args.n_tasks[0],
-            mem=args.memory[0],
+            n_tasks=n_tasks,
+            mem=mem,
             time=time,
             job_array="",
         )
-        header_f = "\n".join([hdr, config["preamble"]])
+        header_f = "\n".join([hdr] + signal_directives(args) + [config["preamble"]])
 
     # Ok, let's create the section where we call each job script.
-    script_call = "bash {target_path} 2>&1 | tee {job_log_path}"
-
-    job_calls = []
-    for job_id in job_list:
-        script_name = "{job_id:05d}_run.sh".format(job_id=job_id)
-        target_path = os.path.join(paths["job_scripts"], script_name)
-        job_log_path = os.path.join(
-            paths["job_logs"], "{job_id:05d}.txt".format(job_id=job_id)
-        )
-        job_calls.append(
-            script_call.format(target_path=target_path, job_log_path=job_log_path)
-        )
-
-    job_calls_str = "\n".join(job_calls)
+    if job_times is None:
+        job_times = job_time_estimates(job_list, config, history)
+    job_calls_str = build_runner(
+        job_list,
+        paths,
+        job_name,
+        concurrency,
+        walltime_secs=slurm_time_to_seconds(time) if time is not None else 0,
+        queue=queue,
+        job_times=job_times,
+        forward_signal=args.forward_signal,
+        requeue=args.requeue,
+    )
     script = "\n\n".join(
         [
             header_f,
@@ -95,6 +278,23 @@ def prep_job(config, job_list, paths, args, array_job_index=None):
 
     if not args.dry:
         write_job_script(job_name, args.sbatch_id[0], paths, script)
+        ensure_status_file(paths, max(job_list))
+        if array_job_index is None:
+            # array elements are recorded along with their array, by prep_job_array()
+            SlurmhelperDB(paths).add_scripts(
+                [
+                    {
+                        "name": job_name,
+                        "sbatch_id": args.sbatch_id[0],
+                        "kind": "sbatch",
+                        "path": os.path.join(paths["slurm_scripts"], f"{job_name}.sh"),
+                        "time": time,
+                        "mem": mem,
+                        "n_tasks": n_tasks,
+                        "jobs": {None: [int(j) for j in job_list]},
+                    }
+                ]
+            )
 
     if args.verbose or args.dry:
         logger.info(
@@ -118,100 +318,546 @@ def prep_job_array(config, job_list, paths, args):
     Will create an array-ified submission wrapper a list of jobs, which
     are automagically arranged into an optimized array of serial jobs :)
 
+    If your database defines per-job resource columns (see
+    jobs.utils.load_job_resources()), jobs are first grouped into resource
+    classes, and one appropriately sized array is written per class. Arrays
+    that would exceed the cluster's MaxArraySize / MaxSubmitJobs limits (see
+    utils.scheduler.resolve_array_limits()) are further split into several
+    arrays, which can be chained so that each one submits the next.
+
+    All arrays belong to the same sbatch_id family: they share the
+    sb-<sbatch_id> job name. If there is more than one, each array is a
+    "part" with its own scripts (sb-<sbatch_id>-part<k>.sh), elements
+    (sb-<sbatch_id>-part<k>-<index>.sh) and logs, with element indices
+    starting from 100 in every part.
+
+    With --dynamic, jobs are not parcelled out ahead of time: every element of
+    an array pulls the next unclaimed job from a queue shared by the whole
+    array (scripts/slurm/<part>.queue), longest jobs first, until the queue is
+    empty or the element does not have enough walltime left for the next job.
+
     :param config: dict, output of load_spec()
     :param job_list: list of jobs to prepare
     :param paths: dict output of calculate_directories()
     :param args: parsed ArgParse object
     :return: job_name: name of script to run job
     """
-    # allow for manual override of number of parcels, else, calculate it
-    if args.n_parcels is not None:
-        n_parcels = args.n_parcels[0]
-    else:
-        n_parcels = calculate_min_number_of_parcels(len(job_list), config)
-
-    # divvy up my jobs evenly
-    job_array = split_list(job_list, wanted_parts=n_parcels)
-
-    # verbose print statement because, reasons
-    logger.info("JOB ARRAY IS:")
-    logger.info(job_array)
-
-    # for each parcel to include in the array
-    for i in progressbar.progressbar(range(0, n_parcels), redirect_stdout=True):
-        # retrieve my parcel
-        parcel = job_array[i]
-        arr_j_i = i + 100
-        # make as many jobs as we want, each job is a buddy :)
-        # this will write out the sub_job scripts too
-        prep_job(config, parcel, paths, args, array_job_index=arr_j_i)
-        sleep(0.1)
-
-    # ok, here's the array script...
+    sbatch_id = args.sbatch_id[0]
     job_name = "sb-{sbatch_id:04d}".format(
-        sbatch_id=args.sbatch_id[0]
+        sbatch_id=sbatch_id
     )  # notice, we still have an sb- name, this is
 
-    # for all jobs submitted...
-    # Wall time
-    if args.time is not None:  # use manually specified time
-        time = args.time
-    else:  # calculate wall time using our current assumptions
-        parcel_lengths = [len(p) for p in job_array]
-        time = calculate_wall_time(
-            max(parcel_lengths), config
-        )  # we should use the maximum wall time for parcels
+    # past runtimes, to estimate wall time from (if not given)
+    history = None
+    if args.time is None:
+        history = load_runtime_history(config, job_list, paths, args)
+
+    # limits on how big any one array may get
+    limits = resolve_array_limits(config, args, scheduler_cache_dir(paths))
+    capacity = array_part_capacity(limits, start_index=100, chained=args.chain)
 
-    # Figure out the log path
-    log_out = os.path.join(
-        paths["slurm_logs"], "{job_name}-%a.txt".format(job_name=job_name)
+    # group jobs by their resource needs (a single class if the db has none)
+    classes = group_resource_classes(
+        load_job_resources(paths, config, job_list), job_list
     )
+    if len(classes) > 1:
+        print(
+            f"Jobs were grouped into {len(classes)} resource classes; "
+            f"one array will be prepared for each."
+        )
+
+    # plan out each array, as (config, resources, packing, parcels)
+    plans = []
+    for (k, (resources, class_jobs)) in enumerate(classes, start=1):
+        # each class is timed with its own per-job time, if provided
+        class_config = config
+        if resources.get("time", None) is not None:
+            class_config = {**config, "job_time": resources["time"]}
+
+        # jobs run at once per element, and resources requested for each element
+        packing = resolve_packing(class_config, args, resources)
+        concurrency = packing[0]
+
+        # allow for manual override of number of parcels, else, calculate it
+        if args.n_parcels is not None:
+            # spread the requested parcels across classes, proportionally
+            n_parcels = max(
+                1, round(args.n_parcels[0] * len(class_jobs) / len(job_list))
+            )
+        elif history is not None:
+            # sized from the same per-job estimates the wall time will come from
+            job_times, margin = history
+            n_parcels = calculate_min_number_of_parcels_from_estimates(
+                [job_times[int(j)] for j in class_jobs],
+                class_config,
+                concurrency,
+                margin,
+            )
+        else:
+            n_parcels = calculate_min_number_of_parcels(
+                len(class_jobs), class_config, concurrency
+            )
+        # no empty parcels, please
+        n_parcels = min(n_parcels, len(class_jobs))
+
+        # divvy up my jobs evenly
+        job_array = split_list(class_jobs, wanted_parts=n_parcels)
+
+        # verbose print statement because, reasons
+        logger.info(f"JOB ARRAY (resource class {k}: {resources}) IS:")
+        logger.info(job_array)
+
+        # split oversized arrays to respect cluster limits
+        step = len(job_array) if capacity is None else capacity
+        for start in range(0, len(job_array), step):
+            plans.append(
+                (class_config, resources, packing, job_array[start : start + step])
+            )
+
+    if capacity is not None and len(plans) > len(classes):
+        print(
+            f"Arrays were split into {len(plans)} parts of at most {capacity} elements "
+            f"to respect cluster limits ({limits})."
+        )
+    n_elements = sum([len(plan[3]) for plan in plans])
+    if (
+        not args.chain
+        and limits["max_submit_jobs"] is not None
+        and n_elements > limits["max_submit_jobs"]
+    ):
+        logger.warning(
+            f"This family has {n_elements} array elements in total, more than the "
+            f"{limits['max_submit_jobs']} jobs you may submit at once. Consider --chain."
+        )
+
+    if not args.dry:
+        # chain markers of previous preps of this sbatch_id would stop the new parts from
+        # submitting each other: record what they submitted, and start afresh
+        from .submit import record_chained_submissions
+
+        record_chained_submissions(paths, config)
+        for marker in glob.glob(
+            os.path.join(paths["slurm_scripts"], f".{job_name}-part*.submitted")
+        ):
+            shutil.rmtree(marker)
+
+    multipart = len(plans) > 1
+    parts = []
+    for (k, (class_config, resources, packing, job_array)) in enumerate(
+        plans, start=1
+    ):
+        concurrency, n_tasks, mem = packing
+        part_name = job_name if not multipart else f"{job_name}-part{k}"
+
+        # Wall time
+        if args.time is not None:  # use manually specified time
+            time = args.time
+        else:  # estimate from past runtimes, or from our current assumptions
+            time = parcel_wall_time(job_array, class_config, concurrency, history)
+
+        # what to expect from each job, to know which ones fit in the walltime left
+        part_jobs = [int(j) for parcel in job_array for j in parcel]
+        part_times = job_time_estimates(part_jobs, class_config, history)
+
+        # in dynamic mode, elements pull this part's jobs from a shared queue
+        queue = None
+        if args.dynamic:
+            queue_path = os.path.join(paths["slurm_scripts"], f"{part_name}.queue")
+            if not args.dry:
+                write_job_queue(queue_path, part_jobs, part_times)
+            queue = (queue_path, queue_record_width(part_jobs))
+
+        # for each parcel to include in the array
+        elements = dict()
+        for i in progressbar.progressbar(
+            range(0, len(job_array)), redirect_stdout=True
+        ):
+            # retrieve my parcel
+            parcel = job_array[i]
+            arr_j_i = i + 100
+            # make as many jobs as we want, each job is a buddy :)
+            # this will write out the sub_job scripts too
+            prep_job(
+                class_config,
+                parcel,
+                paths,
+                args,
+                array_job_index=arr_j_i,
+                packing=packing,
+                name_prefix=part_name,
+                walltime=time,
+                queue=queue,
+                job_times=part_times,
+            )
+            # dynamic elements only find out which jobs they ran at run time
+            elements[arr_j_i] = [] if args.dynamic else [int(j) for j in parcel]
+            sleep(0.1)
+
+        parts.append(
+            {
+                "name": part_name,
+                "start_index": 100,
+                "end_index": 100 + len(job_array) - 1,
+                "time": time,
+                "n_tasks": n_tasks,
+                "mem": mem,
+                "concurrency": concurrency,
+                "resources": {
+                    dim: (str(val) if dim == "time" else val)
+                    for (dim, val) in resources.items()
+                },
+                "dynamic": bool(args.dynamic),
+                "queue": queue[0] if queue is not None else None,
+                "jobs": part_jobs,
+                "elements": elements,
+            }
+        )
+
+    # ok, here's the array script(s)...
     if args.rate_limit is not None:
         steppity = """%{rate}""".format(rate=args.rate_limit)
     else:
         steppity = ""
 
-    arr = "#SBATCH --array={start_index:d}-{end_index:d}{step}".format(
-        start_index=100, end_index=(100 + n_parcels - 1), step=steppity
-    )
-    path_to_array = os.path.join(
-        paths["slurm_scripts"],
-        "sb-{sbatch_id:04d}-$SLURM_ARRAY_TASK_ID.sh".format(
-            sbatch_id=args.sbatch_id[0]
-        ),
-    )
-
-    hdr = Template(config["header"]).safe_substitute(
-        job_name=job_name,
-        log_path=log_out,
-        n_tasks=args.n_tasks[0],
-        mem=args.memory[0],
-        time=time,
-        job_array=arr,
-    )
-    array_script = "\n".join(
-        [
-            hdr,
+    tgt_paths = []
+    for (k, part) in enumerate(parts):
+        # Figure out the log path
+        log_out = os.path.join(
+            paths["slurm_logs"], "{name}-%a.txt".format(name=part["name"])
+        )
+        arr = "#SBATCH --array={start_index:d}-{end_index:d}{step}".format(
+            start_index=part["start_index"], end_index=part["end_index"], step=steppity
+        )
+        path_to_array = os.path.join(
+            paths["slurm_scripts"],
+            "{name}-$SLURM_ARRAY_TASK_ID.sh".format(name=part["name"]),
+        )
+        hdr = Template(config["header"]).safe_substitute(
+            job_name=job_name,
+            log_path=log_out,
+            n_tasks=part["n_tasks"],
+            mem=part["mem"],
+            time=part["time"],
+            job_array=arr,
+        )
+        script_chunks = [hdr] + signal_directives(args)
+        if args.chain and k + 1 < len(parts):
+            script_chunks.append(
+                build_chain_call(parts[k + 1]["name"], part["start_index"], paths)
+            )
+        if args.signal_grace is not None:
+            # slurm only signals this script: run the element in the background, and
+            # pass the signal on to it
+            script_chunks.append(ARRAY_SIGNAL_FORWARDING)
+            path_to_array += " & _sh_forward_to_element"
+        script_chunks.append(
             Template(config["array_footer"]).safe_substitute(
                 path_to_array=path_to_array
-            ),
+            )
+        )
+        array_script = "\n".join(script_chunks)
+        tgt_path = os.path.join(
+            paths["slurm_scripts"], "{name}.sh".format(name=part["name"])
+        )
+        if not args.dry:
+            # finally, write out the array script
+            write_job_script(part["name"], sbatch_id, paths, array_script)
+            print(f"Array script will be written to: {tgt_path}")
+        logger.debug("Contents of ARRAY script:\n------------------\n")
+        logger.debug(array_script)
+        tgt_paths.append(tgt_path)
+
+    if not args.dry:
+        # keep a record of how this sbatch_id family is laid out
+        scripts = []
+        for part in parts:
+            scripts.append(
+                {
+                    "name": part["name"],
+                    "sbatch_id": sbatch_id,
+                    "kind": "array",
+                    "path": os.path.join(paths["slurm_scripts"], f"{part['name']}.sh"),
+                    "array": compact_index_ranges(
+                        range(part["start_index"], part["end_index"] + 1)
+                    ),
+                    "time": part["time"],
+                    "mem": part["mem"],
+                    "n_tasks": part["n_tasks"],
+                    # any element of a dynamic array may run any of its jobs
+                    "jobs": {None: part["jobs"]} if part["dynamic"] else part["elements"],
+                }
+            )
+            for idx in part["elements"].keys():
+                element_name = "{name}-{idx:03d}".format(name=part["name"], idx=idx)
+                scripts.append(
+                    {
+                        "name": element_name,
+                        "sbatch_id": sbatch_id,
+                        "kind": "element",
+                        "path": os.path.join(
+                            paths["slurm_scripts"], f"{element_name}.sh"
+                        ),
+                        "time": part["time"],
+                        "mem": part["mem"],
+                        "n_tasks": part["n_tasks"],
+                    }
+                )
+        SlurmhelperDB(paths).add_scripts(scripts)
+        write_sbatch_manifest(
+            sbatch_id,
+            paths,
+            {
+                "sbatch_id": sbatch_id,
+                "job_name": job_name,
+                "chained": bool(args.chain) and multipart,
+                "limits": limits,
+                "parts": parts,
+            },
+        )
+        print("Done!")
+        if len(tgt_paths) == 1:
+            print("Please run the following command to submit your sbatch job array:")
+        elif args.chain:
+            print(
+                "Parts are chained: each submits the next one once it starts. "
+                "Please run the following command (or slurmhelper submit) "
+                "to submit the first one:"
+            )
+            tgt_paths = tgt_paths[:1]
+        else:
+            print(
+                "Please run the following commands (or slurmhelper submit) "
+                "to submit your sbatch job arrays:"
+            )
+        print("")
+        for tgt_path in tgt_paths:
+            print(f"  sbatch {tgt_path}")
+        print("")
+
+
+def signal_directives(args):
+    """
+    Extra #SBATCH directives for graceful timeouts / preemption: --signal-grace asks slurm
+    to send USR1 to the batch script that many seconds before the job ends (which element
+    runners trap, see jobs.runner), and --requeue makes the job requeueable (appending to
+    its log, rather than overwriting it, when it runs again).
+    :param args: parsed ArgParse object
+    :return: list of str
+    """
+    directives = []
+    if args.signal_grace is not None:
+        directives.append(f"#SBATCH --signal=B:USR1@{args.signal_grace}")
+    if args.requeue:
+        if args.signal_grace is None:
+            logger.warning(
+                "--requeue only takes effect upon the warning signal: use --signal-grace."
+            )
+        directives += ["#SBATCH --requeue", "#SBATCH --open-mode=append"]
+    return directives
+
+
+def build_chain_call(next_part_name, start_index, paths):
+    """
+    Bash snippet to add to a (chained) array part, which submits the next part of the
+    family with a dependency on the current one. Only the first element does so, and
+    a marker directory (.<next part>.submitted/<Slurm ID of the current part>) makes sure
+    it only happens once per submission of the current part (e.g., not upon requeues); the
+    Slurm ID of the next part is saved in it, for slurmhelper to record.
+    :param next_part_name: name of the next part's script, e.g. sb-0001-part2
+    :param start_index: index of the first element of the current part
+    :param paths: dict output of calculate_directories()
+    :return: str, bash code
+    """
+    sbatch_name = next_part_name.split("-part")[0]
+    next_script = os.path.join(paths["slurm_scripts"], f"{next_part_name}.sh")
+    marker = os.path.join(paths["slurm_scripts"], f".{next_part_name}.submitted")
+    crashes = os.path.join(paths["crashes"], sbatch_name)
+    return "\n".join(
+        [
+            "# submit the next part of this sbatch_id family, once, from the first element",
+            f'if [ "$SLURM_ARRAY_TASK_ID" = "{start_index}" ] && mkdir -p "{marker}" \\',
+            f'    && mkdir "{marker}/$SLURM_ARRAY_JOB_ID" 2>/dev/null; then',
+            f'    mkdir -p "{crashes}"',
+            f'    (cd "{crashes}" && sbatch --parsable --dependency=afterany:$SLURM_ARRAY_JOB_ID "{next_script}") \\',
+            f'        > "{marker}/$SLURM_ARRAY_JOB_ID/slurm_id"',
+            "fi",
+            "",
         ]
     )
-    if not args.dry:
-        # finally, write out the array script
-        write_job_script(job_name, args.sbatch_id[0], paths, array_script)
 
-        tgt_path = os.path.join(
-            paths["slurm_scripts"], "{name}.sh".format(name=job_name)
+
+def find_jobs_to_resubmit(config, job_list, paths, args):
+    """
+    Find the jobs of an sbatch_id family (or of the given job list) that need to be run
+    again: those whose logs indicate failure and (unless --failed-only is given) those
+    without logs, or not started by element runners.
+    :param config: dict, output of load_spec()
+    :param job_list: list of job ids to restrict the search to, or None
+    :param paths: dict output of calculate_directories()
+    :param args: parsed ArgParse object
+    :return: sorted list of job ids (integers)
+    """
+    from ..utils.reporting import find_incomplete_jobs
+
+    sbatch_id = args.sbatch_id[0]
+    manifest = load_sbatch_manifest(sbatch_id, paths)
+    if manifest is not None:
+        candidates = sorted(
+            set([j for part in manifest["parts"] for j in part_job_ids(part)])
+        )
+        if job_list is not None:
+            candidates = [j for j in candidates if j in set(job_list)]
+    elif job_list is not None:
+        candidates = job_list
+    else:
+        raise ValueError(
+            f"No manifest found for sbatch_id {sbatch_id} (was it prepped with "
+            f"prep-array?). Please provide the jobs to consider with --ids / --range."
         )
 
-        print(f"Array script will be written to: {tgt_path}")
+    incomplete = find_incomplete_jobs(
+        paths,
+        config,
+        candidates,
+        getattr(args, "scan_workers", None),
+        getattr(args, "rescan", False),
+    )
+    to_rerun = set(incomplete["failed"])
+    if not args.failed_only:
+        to_rerun |= set(incomplete["no_log"]) | set(incomplete["skipped"])
+
+    print(
+        f"Of {len(candidates)} jobs considered, {len(incomplete['failed'])} failed, "
+        f"{len(incomplete['no_log'])} have no logs and {len(incomplete['skipped'])} were "
+        f"not started by their wrapper; {len(to_rerun)} will be resubmitted."
+    )
+    return sorted(to_rerun)
 
-        logger.debug("Contents of ARRAY script:\n------------------\n")
-        logger.debug(array_script)
-        print("Done!")
-        print("Please run the following command to submit your sbatch job array:")
-        print(f"\n  sbatch {tgt_path}\n")
+
+def part_job_ids(part):
+    """
+    Job ids of a part of an sbatch_id family, as recorded in its manifest.
+    :param part: dict, an element of the "parts" of a manifest
+    :return: list of job ids (integers)
+    """
+    if "jobs" in part:
+        return part["jobs"]
+    return [j for jobs in part["elements"].values() for j in jobs]
+
+
+def resubmit_jobs(config, job_list, paths, args):
+    """
+    Resubmit the given jobs of an existing sbatch_id family, as cheaply as possible.
+    By default, the family's existing array scripts are reused: each part is given a sparse
+    --array index list (e.g., 3,17,40-52) holding only the elements that ran any of these
+    jobs, so existing job scripts and element wrappers are rerun as they are. Parts prepped
+    with --dynamic have their queue refilled with these jobs, and as many elements as
+    needed to drain it are resubmitted. With --repack-as, a new array is prepped instead
+    (see prep_job_array()), holding only these jobs.
+    :param config: dict, output of load_spec()
+    :param job_list: list of job ids to rerun, e.g. from find_jobs_to_resubmit()
+    :param paths: dict output of calculate_directories()
+    :param args: parsed ArgParse object
+    :return: list of tuples (script name, sparse array index list) resubmitted (empty if
+             the jobs were repacked into a new array)
+    """
+    from .submit import submit_sbatch, submit_sbatch_script
+
+    sbatch_id = args.sbatch_id[0]
+    manifest = load_sbatch_manifest(sbatch_id, paths)
+
+    if args.repack_as is not None or manifest is None:
+        if args.repack_as is None:
+            raise ValueError(
+                f"No manifest found for sbatch_id {sbatch_id}, so its array elements "
+                f"cannot be reused. Please use --repack-as <new sbatch id>."
+            )
+        repack_args = copy.copy(args)
+        repack_args.sbatch_id = args.repack_as
+        prep_job_array(config, job_list, paths, repack_args)
+        if args.submit and not args.dry:
+            submit_sbatch(args.repack_as[0], paths, config=config)
+        return []
+
+    # what to expect from each job, estimated as prep-array does, for dynamic queues
+    history = None
+    if args.time is None and any([p.get("dynamic", False) for p in manifest["parts"]]):
+        history = load_runtime_history(config, job_list, paths, args)
+
+    to_rerun = set(job_list)
+    if args.rate_limit is not None:
+        steppity = """%{rate}""".format(rate=args.rate_limit)
+    else:
+        steppity = ""
+
+    resubmissions = []
+    n_rerun_ok = 0
+    for part in manifest["parts"]:
+        if part.get("dynamic", False):
+            part_rerun = [j for j in part["jobs"] if j in to_rerun]
+            if len(part_rerun) == 0:
+                continue
+            class_config = config
+            if part["resources"].get("time", None) is not None:
+                class_config = {
+                    **config,
+                    "job_time": pd.to_timedelta(part["resources"]["time"]),
+                }
+            n_elements = min(
+                part["end_index"] - part["start_index"] + 1,
+                math.ceil(len(part_rerun) / part["concurrency"]),
+            )
+            indices = range(part["start_index"], part["start_index"] + n_elements)
+            if not args.dry:
+                write_job_queue(
+                    part["queue"],
+                    part_rerun,
+                    job_time_estimates(part_rerun, class_config, history),
+                )
+        else:
+            indices = [
+                idx
+                for (idx, jobs) in part["elements"].items()
+                if len(to_rerun.intersection(jobs)) > 0
+            ]
+            if len(indices) == 0:
+                continue
+            n_rerun_ok += len(
+                [
+                    j
+                    for idx in indices
+                    for j in part["elements"][idx]
+                    if j not in to_rerun
+                ]
+            )
+        resubmissions.append((part["name"], compact_index_ranges(indices) + steppity))
+
+    if n_rerun_ok > 0:
+        logger.warning(
+            f"{n_rerun_ok} jobs that already completed share array elements with the ones "
+            f"being resubmitted, and will run again. Use --repack-as <new sbatch id> to "
+            f"only rerun the jobs that need it."
+        )
+
+    if args.submit and not args.dry:
+        for (name, array) in resubmissions:
+            submit_sbatch_script(
+                sbatch_id,
+                name,
+                paths,
+                [f"--array={array}"],
+                force=True,
+                config=config,
+            )
+    else:
+        print("Please run the following command(s) to resubmit these jobs:")
+        print("")
+        for (name, array) in resubmissions:
+            script = os.path.join(paths["slurm_scripts"], f"{name}.sh")
+            print(f"  sbatch --array={array} {script}")
+        print("")
+
+    return resubmissions
 
 
 def generate_run_scripts(dirs, config, args, job_list=None):
@@ -0,0 +1,612 @@
+"""
+Building blocks for the bash "element runner" that sbatch wrappers (and sbatch array elements) use
+to call user job scripts. The runner keeps one log per job in logs/jobs/<job_id>.txt, records the
+exit code of every job, and can keep up to K jobs running at once when an element is packed with
+more cores / memory than a single job needs. Job events (start, end, skip) are appended to a journal
+of the script's own, which slurmhelper merges into its database (see ..db.SlurmhelperDB), and the
+byte of each job in the working directory's status file is updated (see ..utils.io.status_file_path()).
+Once a job is over, a small JSON sidecar next to its log records how it went (see job_sidecar_path()),
+including the resources it used when python3 is available to measure them (see MEASURE_SHIM).
+
+Jobs either come from a fixed list baked into the wrapper, or (in dynamic mode) are pulled one at
+a time from a queue file shared by all elements of an array, until the queue is empty. Either way,
+the runner keeps track of the walltime left, and does not start jobs expected to outlast it: they
+are skipped (and recorded as such), or left in the queue for other elements.
+"""
+
+import logging
+import os
+from string import Template
+
+from ..utils.io import JOB_STATUS_CODES, status_file_path
+
+logger = logging.getLogger("cli")
+
+# launcher measuring the resources used by a job: it runs the job, passes warning signals on to it,
+# and reaps it with wait4(), whose rusage covers the job and all the processes it waited for.
+# Peak RSS is that of the largest process; I/O is counted in 512-byte filesystem blocks.
+MEASURE_SHIM = """import os, signal, subprocess, sys
+
+child = subprocess.Popen(sys.argv[2:])
+
+
+def forward(signum, frame):
+    try:
+        child.send_signal(signum)
+    except OSError:
+        pass
+
+
+for signum in (signal.SIGUSR1, signal.SIGTERM, signal.SIGINT):
+    signal.signal(signum, forward)
+_, status, usage = os.wait4(child.pid, 0)
+child.returncode = 0  # reaped above
+if os.WIFEXITED(status):
+    rc = os.WEXITSTATUS(status)
+else:
+    rc = 128 + os.WTERMSIG(status)
+with open(sys.argv[1], "w") as f:
+    f.write(
+        ', "max_rss_kb": %d, "user_cpu": %.2f, "sys_cpu": %.2f, "read_bytes": %d, "write_bytes": %d'
+        % (
+            usage.ru_maxrss,
+            usage.ru_utime,
+            usage.ru_stime,
+            usage.ru_inblock * 512,
+            usage.ru_oublock * 512,
+        )
+    )
+sys.exit(rc)
+"""
+
+RUNNER_SETUP = """# ~~~~~~~~~~~~~ slurmhelper element runner ~~~~~~~~~~~~~
+_sh_concurrency=${concurrency}
+_sh_scripts_dir=${scripts_dir}
+_sh_logs_dir=${logs_dir}
+_sh_status_dir=$$(mktemp -d)
+_sh_skipped_file=${skipped_file}
+_sh_done_file=${done_file}
+_sh_journal=${journal}
+_sh_status_file=${status_file}
+_sh_host=$${HOSTNAME:-$$(hostname)}
+_sh_python=$$(command -v python3 || true)
+if [ -n "$$_sh_python" ]; then
+    cat > "$${_sh_status_dir}/.measure.py" << '_SH_MEASURE_EOF'
+${measure_shim}_SH_MEASURE_EOF
+fi
+_sh_n_skipped=0
+_sh_forward_signal=${forward_signal}
+_sh_requeue=${requeue}
+_sh_stopping=0
+_sh_start_time=$$(date +%s)
+_sh_walltime=${walltime_secs}
+# when this allocation ends: as told by slurm, or from the wall time requested (if known)
+if [ -n "$${SLURM_JOB_END_TIME:-}" ]; then
+    _sh_end_time=$$SLURM_JOB_END_TIME
+elif [ "$$_sh_walltime" -gt 0 ]; then
+    _sh_end_time=$$((_sh_start_time + _sh_walltime))
+else
+    _sh_end_time=$$((_sh_start_time + 10 ** 9))
+fi
+
+# jobs completed by this script are listed in its done file, so that they are not run again if
+# slurm requeues it (SLURM_RESTART_COUNT > 0); a fresh run starts a fresh list
+_sh_restarts=$${SLURM_RESTART_COUNT:-0}
+if [ "$$_sh_restarts" -eq 0 ]; then
+    : > "$$_sh_done_file"
+fi
+
+# one line per event: <epoch> <event> <job id> <exit code or -> <slurm job id> <array index> <host>
+# (array elements are identified by their array's job id and their index)
+_sh_log_event() {
+    echo "$$(date +%s) $$1 $$2 $${3:--} $${SLURM_ARRAY_JOB_ID:-$${SLURM_JOB_ID:-NA}} $${SLURM_ARRAY_TASK_ID:-NA} $$_sh_host" >> "$$_sh_journal"
+}
+
+# set the byte of a job in the status file (positioned write, the rest of the file is untouched)
+_sh_set_status() {
+    printf "\\\\$$(printf %o "$$2")" \\
+        | dd of="$$_sh_status_file" bs=1 seek=$$((10#$$1)) count=1 conv=notrunc 2> /dev/null || true
+}
+
+# write the sidecar of a job once it is over: <job id> <exit code> <start epoch> <end epoch>
+# (written to a temporary file first, so that readers never see half of it), along with the
+# resources measured for it, if any
+_sh_write_sidecar() {
+    local sidecar="$${_sh_logs_dir}/$${1}.json"
+    local usage=""
+    if [ -e "$${_sh_status_dir}/.$${1}.usage" ]; then
+        usage=$$(cat "$${_sh_status_dir}/.$${1}.usage")
+        rm -f "$${_sh_status_dir}/.$${1}.usage"
+    fi
+    # the run script found the job's outputs up to date, and did not run it
+    if [ -e "$${_sh_status_dir}/.$${1}.up_to_date" ]; then
+        usage="$${usage}, \\"up_to_date\\": true"
+        rm -f "$${_sh_status_dir}/.$${1}.up_to_date"
+    fi
+    printf '{"job": %d, "exit_code": %d, "start": %d, "end": %d, "host": "%s", "slurm_job_id": "%s", "array_task_id": "%s"%s}\\n' \\
+        "$$((10#$$1))" "$$2" "$$3" "$$4" "$$_sh_host" \\
+        "$${SLURM_ARRAY_JOB_ID:-$${SLURM_JOB_ID:-NA}}" "$${SLURM_ARRAY_TASK_ID:-NA}" "$$usage" \\
+        > "$${sidecar}.tmp" && mv -f "$${sidecar}.tmp" "$$sidecar"
+}
+
+# record the fingerprint of a job that succeeded next to its outputs, as its run script asked
+# (see skip_up_to_date): <job id> <exit code>
+_sh_record_fingerprint() {
+    local request="$${_sh_status_dir}/.$${1}.fingerprint"
+    local marker fingerprint
+    if [ "$$2" = "0" ] && [ -s "$$request" ]; then
+        { read -r marker; read -r fingerprint; } < "$$request"
+        mkdir -p "$$(dirname "$$marker")" && echo "$$fingerprint" > "$$marker"
+    fi
+    rm -f "$$request"
+}
+
+_sh_time_left() {
+    echo $$((_sh_end_time - $$(date +%s)))
+}
+
+_sh_already_done() {
+    [ "$$_sh_restarts" -gt 0 ] && grep -qx "$$1" "$$_sh_done_file" 2> /dev/null
+}
+
+# upon the warning signal requested with --signal=B:USR1@<seconds>, stop starting jobs, and
+# (optionally) pass it on to running jobs so they can checkpoint
+_sh_on_warning() {
+    _sh_stopping=1
+    echo "[slurmhelper] warning signal received with $$(_sh_time_left)s of walltime left; not starting any more jobs"
+    if [ "$$_sh_forward_signal" = "1" ]; then
+        for _sh_pid_file in "$${_sh_status_dir}"/.*.pid; do
+            [ -e "$$_sh_pid_file" ] || continue
+            kill -USR1 "$$(cat "$$_sh_pid_file")" 2> /dev/null || true
+        done
+    fi
+}
+trap _sh_on_warning USR1
+
+_sh_run_job() {
+    local job_id=$$1
+    local rc=""
+    local pid
+    local -a launch=()
+    local started=$$(date +%s)
+    # the sidecar of a previous run of this job would tell about that run
+    rm -f "$${_sh_logs_dir}/$${job_id}.json" "$${_sh_status_dir}/.$${job_id}.fingerprint"
+    _sh_log_event start "$$job_id"
+    _sh_set_status "$$job_id" ${status_running}
+    if [ -n "$$_sh_python" ]; then
+        launch=("$$_sh_python" "$${_sh_status_dir}/.measure.py" "$${_sh_status_dir}/.$${job_id}.usage")
+    fi
+    if [ "$$_sh_concurrency" -gt 1 ]; then
+        # concurrent jobs only write to their own log, to keep the sbatch log readable
+        SLURMHELPER_UP_TO_DATE_FILE="$${_sh_status_dir}/.$${job_id}.up_to_date" \\
+            SLURMHELPER_FINGERPRINT_FILE="$${_sh_status_dir}/.$${job_id}.fingerprint" \\
+            "$${launch[@]}" bash "$${_sh_scripts_dir}/$${job_id}_run.sh" > "$${_sh_logs_dir}/$${job_id}.txt" 2>&1 &
+    else
+        SLURMHELPER_UP_TO_DATE_FILE="$${_sh_status_dir}/.$${job_id}.up_to_date" \\
+            SLURMHELPER_FINGERPRINT_FILE="$${_sh_status_dir}/.$${job_id}.fingerprint" \\
+            "$${launch[@]}" bash "$${_sh_scripts_dir}/$${job_id}_run.sh" > >(tee "$${_sh_logs_dir}/$${job_id}.txt") 2>&1 &
+    fi
+    pid=$$!
+    echo "$$pid" > "$${_sh_status_dir}/.$${job_id}.pid"
+    # a trapped signal interrupts `wait`, so keep waiting until the job is really over
+    until [ -n "$$rc" ]; do
+        wait "$$pid" && rc=0 || rc=$$?
+        if [ "$$rc" -gt 128 ] && kill -0 "$$pid" 2> /dev/null; then
+            rc=""
+        fi
+    done
+    rm -f "$${_sh_status_dir}/.$${job_id}.pid"
+    echo "$$rc" > "$${_sh_status_dir}/$${job_id}"
+    _sh_record_fingerprint "$$job_id" "$$rc"
+    _sh_write_sidecar "$$job_id" "$$rc" "$$started" "$$(date +%s)"
+    _sh_log_event end "$$job_id" "$$rc"
+    if [ "$$rc" = "0" ]; then
+        _sh_set_status "$$job_id" ${status_success}
+    else
+        _sh_set_status "$$job_id" ${status_failed}
+    fi
+    if [ "$$rc" = "0" ]; then
+        echo "$$job_id" >> "$$_sh_done_file"
+    fi
+    echo "[slurmhelper] job $${job_id} finished with exit code $${rc}"
+}
+"""
+
+SOURCE_STATIC = """
+# jobs for this element: a fixed list, with their estimated runtimes (in seconds).
+# jobs that would not finish in the walltime left are skipped, and recorded as such.
+_sh_jobs=(${job_ids})
+_sh_estimates=(${estimates})
+_sh_next_index=0
+
+_sh_skip_job() {
+    echo "$${1} $${2} $$(_sh_time_left) $${SLURM_JOB_ID:-NA}" >> "$$_sh_skipped_file"
+    _sh_log_event skip "$$1"
+    _sh_set_status "$$1" ${status_skipped}
+    _sh_n_skipped=$$((_sh_n_skipped + 1))
+}
+
+_sh_next_job() {
+    local est
+    while [ "$$_sh_next_index" -lt "$${#_sh_jobs[@]}" ]; do
+        _sh_job=$${_sh_jobs[$$_sh_next_index]}
+        est=$${_sh_estimates[$$_sh_next_index]}
+        _sh_next_index=$$((_sh_next_index + 1))
+        if _sh_already_done "$$_sh_job"; then
+            echo "[slurmhelper] job $${_sh_job} already completed before this job was requeued"
+        elif [ "$$(_sh_time_left)" -ge "$$est" ]; then
+            return 0
+        else
+            echo "[slurmhelper] skipping job $${_sh_job}: $$(_sh_time_left)s of walltime left, it needs ~$${est}s"
+            _sh_skip_job "$$_sh_job" "$$est"
+        fi
+    done
+    return 1
+}
+
+# mark the jobs not started yet as skipped
+_sh_stop() {
+    while [ "$$_sh_next_index" -lt "$${#_sh_jobs[@]}" ]; do
+        if ! _sh_already_done "$${_sh_jobs[$$_sh_next_index]}"; then
+            _sh_skip_job "$${_sh_jobs[$$_sh_next_index]}" "$${_sh_estimates[$$_sh_next_index]}"
+        fi
+        _sh_next_index=$$((_sh_next_index + 1))
+    done
+}
+
+echo "[slurmhelper] running $${#_sh_jobs[@]} jobs, up to $${_sh_concurrency} at a time"
+"""
+
+SOURCE_DYNAMIC = """
+# jobs for this element: pulled from a queue shared by all elements of the array.
+# the queue holds fixed-width records ("<job id> <estimated seconds>"), and its cursor file
+# holds the number of records claimed so far, so a claim only reads a single record.
+_sh_queue=${queue}
+_sh_record_width=${record_width}
+
+_sh_lock() {
+    if command -v flock > /dev/null; then
+        exec 9> "$${_sh_queue}.lock"
+        flock -x 9
+    else
+        until mkdir "$${_sh_queue}.lockdir" 2> /dev/null; do
+            sleep 0.$$((RANDOM % 10))
+        done
+    fi
+}
+
+_sh_unlock() {
+    if command -v flock > /dev/null; then
+        flock -u 9
+        exec 9>&-
+    else
+        rmdir "$${_sh_queue}.lockdir"
+    fi
+}
+
+_sh_next_job() {
+    local n record est
+    _sh_job=""
+    _sh_lock
+    n=$$(cat "$${_sh_queue}.cursor" 2> /dev/null || echo 0)
+    record=$$(dd if="$$_sh_queue" bs="$$_sh_record_width" skip="$$n" count=1 2> /dev/null)
+    if [ -n "$$record" ]; then
+        est=$$((10#$${record##* }))
+        if [ "$$(_sh_time_left)" -lt "$$est" ]; then
+            echo "[slurmhelper] $$(_sh_time_left)s of walltime left, not enough for the next job ($${est}s)"
+        else
+            _sh_job=$${record%% *}
+            echo $$((n + 1)) > "$${_sh_queue}.cursor"
+            echo "$${_sh_job} $${SLURM_ARRAY_TASK_ID:-NA} $${SLURM_JOB_ID:-NA}" >> "$${_sh_queue}.claims"
+        fi
+    fi
+    _sh_unlock
+    [ -n "$$_sh_job" ]
+}
+
+# jobs not claimed yet are simply left in the queue
+_sh_stop() {
+    echo "[slurmhelper] leaving the jobs not claimed yet in $${_sh_queue}"
+}
+
+echo "[slurmhelper] pulling jobs from $${_sh_queue}, up to $${_sh_concurrency} at a time"
+"""
+
+RUNNER_LOOP = """
+while true; do
+    if [ "$$_sh_concurrency" -gt 1 ]; then
+        # refill slots as jobs finish (polling, since `wait -n` needs bash >= 4.3)
+        while [ "$$(jobs -rp | wc -l)" -ge "$$_sh_concurrency" ]; do
+            sleep 1
+        done
+    fi
+    if [ "$$_sh_stopping" = "1" ]; then
+        _sh_stop
+        break
+    fi
+    _sh_next_job || break
+    if [ "$$_sh_concurrency" -gt 1 ]; then
+        echo "[slurmhelper] starting job $${_sh_job}"
+        _sh_run_job "$$_sh_job" &
+    else
+        _sh_run_job "$$_sh_job"
+    fi
+done
+until wait; do
+    # interrupted by a trapped signal; jobs are still running
+    :
+done
+
+# summary
+_sh_n_run=0
+_sh_n_ok=0
+_sh_failed=()
+for _sh_rc_file in "$${_sh_status_dir}"/*; do
+    [ -e "$$_sh_rc_file" ] || continue
+    _sh_n_run=$$((_sh_n_run + 1))
+    _sh_rc=$$(cat "$$_sh_rc_file")
+    if [ "$$_sh_rc" = "0" ]; then
+        _sh_n_ok=$$((_sh_n_ok + 1))
+    else
+        _sh_failed+=("$$(basename "$$_sh_rc_file"):$${_sh_rc}")
+    fi
+done
+echo "[slurmhelper] $${_sh_n_ok} of $${_sh_n_run} jobs exited successfully."
+if [ "$${#_sh_failed[@]}" -gt 0 ]; then
+    echo "[slurmhelper] failed jobs (job:exit code): $${_sh_failed[*]}"
+fi
+if [ "$$_sh_n_skipped" -gt 0 ]; then
+    echo "[slurmhelper] $${_sh_n_skipped} jobs were not started (see $${_sh_skipped_file})."
+fi
+rm -rf "$$_sh_status_dir"
+
+if [ "$$_sh_stopping" = "1" ] && [ "$$_sh_requeue" = "1" ] && [ -n "$${SLURM_JOB_ID:-}" ]; then
+    echo "[slurmhelper] requeueing slurm job $${SLURM_JOB_ID}"
+    scontrol requeue "$$SLURM_JOB_ID" || echo "[slurmhelper] could not requeue slurm job $${SLURM_JOB_ID}"
+fi
+"""
+
+# width of the estimated runtime (in seconds) field of job queue records
+QUEUE_EST_WIDTH = 8
+
+
+def resolve_packing(config, args, resources=None):
+    """
+    Figure out how many jobs an sbatch script / array element should run at once, and how
+    many tasks and how much memory should be requested for it.
+
+    If --concurrency is not given, jobs run serially (as always). A concurrency of 0 is
+    derived from the requested --n-tasks / --memory, divided by n_thr / mem_mb in your
+    spec's script_global_settings. If --pack is given, --n-tasks / --memory are instead
+    sized from the concurrency, i.e. concurrency x n_thr and concurrency x mem_mb.
+
+    :param config: dict, output of load_spec()
+    :param args: parsed ArgParse object
+    :param resources: optional dict with per-job "cpus" and/or "mem" needs (e.g., for a
+                      resource class, see jobs.utils.group_resource_classes()). These take
+                      the place of n_thr / mem_mb, and always size the request.
+    :return: tuple (concurrency, n_tasks, mem)
+    """
+    n_tasks = args.n_tasks[0]
+    mem = args.memory[0]
+
+    settings = config.get("script_global_settings", None) or dict()
+    n_thr = settings.get("n_thr", None)
+    mem_mb = settings.get("mem_mb", None)
+
+    # per-job needs given for this set of jobs win over the spec's globals
+    resources = {k: v for (k, v) in (resources or dict()).items() if v is not None}
+    if "cpus" in resources:
+        n_thr = resources["cpus"]
+    if "mem" in resources:
+        mem_mb = resources["mem"]
+
+    if args.concurrency is None:
+        if args.pack:
+            logger.warning("--pack was given without --concurrency; nothing to pack.")
+        if "cpus" in resources:
+            n_tasks = int(n_thr)
+        if "mem" in resources:
+            mem = int(mem_mb)
+        return 1, n_tasks, mem
+
+    concurrency = args.concurrency[0]
+    if concurrency < 0:
+        raise ValueError("--concurrency should be a non-negative integer.")
+    if concurrency == 0:
+        if n_thr is None and mem_mb is None:
+            raise ValueError(
+                "Cannot derive concurrency automatically: your spec does not define n_thr "
+                "or mem_mb in script_global_settings. Please provide --concurrency explicitly."
+            )
+        fits = []
+        if n_thr is not None:
+            fits.append(n_tasks // int(n_thr))
+        if mem_mb is not None:
+            fits.append(mem // int(mem_mb))
+        concurrency = max(1, min(fits))
+        logger.info(
+            f"Derived concurrency of {concurrency} jobs per element "
+            f"({n_tasks} tasks, {mem} mb requested)."
+        )
+
+    if args.pack:
+        if n_thr is not None:
+            n_tasks = concurrency * int(n_thr)
+        if mem_mb is not None:
+            mem = concurrency * int(mem_mb)
+        logger.info(
+            f"Packed element sized to {n_tasks} tasks and {mem} mb "
+            f"for {concurrency} concurrent jobs."
+        )
+    else:
+        if "cpus" in resources:
+            n_tasks = concurrency * int(n_thr)
+        if "mem" in resources:
+            mem = concurrency * int(mem_mb)
+        if n_thr is not None and concurrency * int(n_thr) > n_tasks:
+            logger.warning(
+                f"{concurrency} concurrent jobs x {n_thr} threads exceeds the {n_tasks} tasks "
+                f"requested. Consider using --pack."
+            )
+        if mem_mb is not None and concurrency * int(mem_mb) > mem:
+            logger.warning(
+                f"{concurrency} concurrent jobs x {mem_mb} mb exceeds the {mem} mb "
+                f"requested. Consider using --pack."
+            )
+
+    return concurrency, n_tasks, mem
+
+
+def queue_record_width(job_list):
+    """
+    Width (in bytes, newline included) of the records of a job queue (see write_job_queue()).
+    :param job_list: list of job ids (integers) in the queue
+    :return: int
+    """
+    return max(5, len(str(max(job_list)))) + QUEUE_EST_WIDTH + 2
+
+
+def write_job_queue(path, job_list, job_times):
+    """
+    Write the job queue shared by the elements of a dynamic array (see SOURCE_DYNAMIC).
+    Jobs are queued longest first, so that the slowest ones do not start last. Previous
+    progress through a queue at the same path (its cursor and claims files) is reset.
+    :param path: path of the queue file
+    :param job_list: list of job ids (integers)
+    :param job_times: dict with estimated runtime (timedelta) of each job id
+    :return: int, width (in bytes) of the queue records
+    """
+    width = queue_record_width(job_list)
+    id_width = width - QUEUE_EST_WIDTH - 2
+    ordered = sorted(job_list, key=lambda j: -job_times[j].total_seconds())
+
+    with open(path, "w") as f:
+        for job_id in ordered:
+            est = min(int(job_times[job_id].total_seconds()), 10 ** QUEUE_EST_WIDTH - 1)
+            f.write(f"{job_id:0{id_width}d} {est:0{QUEUE_EST_WIDTH}d}\n")
+    for suffix in [".cursor", ".claims"]:
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    logger.info(f"Wrote queue of {len(job_list)} jobs to {path}")
+
+    return width
+
+
+def read_runner_jobs(path):
+    """
+    Read back the job ids a script built with build_runner() runs, from its _sh_jobs array.
+    :param path: path of the script
+    :return: list of job ids (integers); empty if the script pulls jobs from a queue, or
+             was not built by build_runner()
+    """
+    with open(path, "r") as f:
+        for line in f:
+            if line.startswith("_sh_jobs=("):
+                return [int(j) for j in line.strip()[len("_sh_jobs=(") : -1].split()]
+    return []
+
+
+def skipped_jobs_path(name, paths):
+    """
+    Path of the file where a script's runner lists the jobs it did not start, either for lack
+    of walltime or because it received a warning signal. Each line holds a job id, its
+    estimated runtime and the walltime left (in seconds), and the slurm job id of the script.
+    :param name: name of the script (e.g., sb-0001-100)
+    :param paths: dict output of calculate_directories()
+    :return: str, path
+    """
+    return os.path.join(paths["slurm_logs"], f"{name}.skipped")
+
+
+def journal_path(name, paths):
+    """
+    Path of the journal a script's runner appends job events to (see RUNNER_SETUP).
+    :param name: name of the script (e.g., sb-0001-100)
+    :param paths: dict output of calculate_directories()
+    :return: str, path
+    """
+    return os.path.join(paths["slurm_logs"], f"{name}.journal")
+
+
+def job_sidecar_path(job_id, paths):
+    """
+    Path of the JSON sidecar a runner writes next to the log of a job once it is over, with
+    keys job, exit_code, start and end (epoch seconds), host, slurm_job_id and array_task_id
+    (the latter two are "NA" outside of slurm / arrays). When the job's resources were
+    measured (see MEASURE_SHIM), keys max_rss_kb, user_cpu, sys_cpu (seconds), read_bytes and
+    write_bytes are added.
+    :param job_id: job id (integer)
+    :param paths: dict output of calculate_directories()
+    :return: str, path
+    """
+    return os.path.join(paths["job_logs"], "{job:05d}.json".format(job=job_id))
+
+
+def build_runner(
+    job_list,
+    paths,
+    name,
+    concurrency=1,
+    walltime_secs=0,
+    queue=None,
+    job_times=None,
+    forward_signal=False,
+    requeue=False,
+):
+    """
+    Build the section of an sbatch wrapper that calls each job script.
+    :param job_list: list of job ids (integers) to run (ignored if a queue is given)
+    :param paths: dict output of calculate_directories()
+    :param name: name of the script (e.g., sb-0001-100). Its runner lists jobs it did not
+                 start in logs/slurm/<name>.skipped, and the ones it completed (so that they
+                 are not rerun if slurm requeues it) in logs/slurm/<name>.done, and
+                 appends job events to logs/slurm/<name>.journal.
+    :param concurrency: number of jobs to keep running at once
+    :param walltime_secs: wall time requested for the script, in seconds (0 if unknown); used
+                          to tell how much time is left when slurm does not set
+                          SLURM_JOB_END_TIME
+    :param queue: optional tuple (path, record width) of a job queue to pull jobs from (see
+                  write_job_queue()), instead of running job_list
+    :param job_times: optional dict with the estimated runtime (timedelta) of each job in
+                      job_list. Jobs are only started if they are expected to finish within
+                      the walltime left.
+    :param forward_signal: whether to pass the USR1 warning signal on to running jobs
+    :param requeue: whether to requeue the script (scontrol requeue) once running jobs are
+                    over, after a warning signal
+    :return: str, bash code
+    """
+    runner = Template(RUNNER_SETUP).substitute(
+        concurrency=concurrency,
+        scripts_dir=paths["job_scripts"],
+        logs_dir=paths["job_logs"],
+        skipped_file=skipped_jobs_path(name, paths),
+        done_file=os.path.join(paths["slurm_logs"], f"{name}.done"),
+        journal=journal_path(name, paths),
+        measure_shim=MEASURE_SHIM,
+        status_file=status_file_path(paths),
+        status_running=JOB_STATUS_CODES["running"],
+        status_success=JOB_STATUS_CODES["success"],
+        status_failed=JOB_STATUS_CODES["failed"],
+        forward_signal=int(forward_signal),
+        requeue=int(requeue),
+        walltime_secs=int(walltime_secs),
+    )
+    if queue is None:
+        runner += Template(SOURCE_STATIC).substitute(
+            status_skipped=JOB_STATUS_CODES["skipped"],
+            job_ids=" ".join(["{job_id:05d}".format(job_id=j) for j in job_list]),
+            estimates=" ".join(
+                [
+                    str(int(job_times[j].total_seconds()) if job_times else 0)
+                    for j in job_list
+                ]
+            ),
+        )
+    else:
+        runner += Template(SOURCE_DYNAMIC).substitute(
+            queue=queue[0], record_width=queue[1]
+        )
+    runner += Template(RUNNER_LOOP).substitute()
+
+    return runner
@@ -1,17 +1,357 @@
-def submit_sbatch(id, dirs):
+"""
+Submission of sbatch scripts to slurm: one sbatch_id, several, or a whole campaign at once.
+Submissions are throttled, retried with exponential backoff when slurmctld is busy, and
+recorded in the database (see ..db.SlurmhelperDB) so that nothing is submitted twice.
+"""
+
+import glob
+import logging
+import os
+import random
+import re
+import subprocess
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+logger = logging.getLogger("cli")
+
+# sbatch failures worth retrying: slurmctld is busy or unreachable, as opposed to the
+# request itself being invalid
+TRANSIENT_SBATCH_ERRORS = re.compile(
+    r"socket timed out|timed out|unable to contact slurm controller|"
+    r"resource temporarily unavailable|connection refused|connection reset|"
+    r"slurm_persist_conn|transport endpoint|try again|not responding",
+    re.IGNORECASE,
+)
+
+
+class SubmissionThrottle:
+    """
+    Spaces out calls to sbatch, so that at most `rate` submissions are made per second.
+    """
+
+    def __init__(self, rate=1.0):
+        self.interval = 1.0 / rate if rate is not None and rate > 0 else 0.0
+        self._last = None
+
+    def wait(self):
+        if self._last is not None:
+            remaining = self._last + self.interval - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
+        self._last = time.monotonic()
+
+
+def find_job_by_token(token):
+    """
+    Look for a job submitted with the given token as its comment, e.g. when sbatch timed
+    out but slurmctld may have accepted the job anyway.
+    :param token: str, token passed to sbatch with --comment
+    :return: str, slurm job id; None if not found (or squeue is unavailable)
+    """
+    try:
+        out = subprocess.run(
+            ["squeue", "--noheader", "-u", os.environ.get("USER", ""), "-o", "%i|%k"],
+            capture_output=True,
+            encoding="UTF-8",
+            timeout=60,
+            check=True,
+        ).stdout
+    except (OSError, subprocess.SubprocessError) as err:
+        logger.warning(f"Could not query squeue for submission {token}: {err}")
+        return None
+
+    for line in out.splitlines():
+        slurm_id, _, comment = line.strip().partition("|")
+        if comment.strip() == token:
+            # array jobs are listed as <array job id>_<index>
+            return slurm_id.split("_")[0]
+    return None
+
+
+def run_sbatch(script, cwd, sbatch_args=None, token=None, retries=5, backoff=2.0):
+    """
+    Call sbatch --parsable on a script, retrying with exponential backoff (plus jitter) when
+    it fails for transient reasons. Before each retry, the queue is checked for a job with
+    this submission's token, in case the previous attempt did go through.
+    :param script: path of the script to submit
+    :param cwd: directory to submit from
+    :param sbatch_args: optional list of extra arguments for sbatch
+    :param token: str, unique token for this submission (passed as --comment)
+    :param retries: number of retries upon transient errors
+    :param backoff: seconds to wait before the first retry (doubled every retry)
+    :return: str, slurm job id
+    """
+    cmd = ["sbatch", "--parsable"]
+    if token is not None:
+        cmd.append(f"--comment={token}")
+    cmd += (sbatch_args or []) + [str(script)]
+
+    for attempt in range(retries + 1):
+        if attempt > 0:
+            delay = backoff * 2 ** (attempt - 1) * (1 + random.random() * 0.25)
+            logger.warning(
+                f"Retrying submission of {script} in {delay:.1f}s "
+                f"(attempt {attempt + 1} of {retries + 1})."
+            )
+            time.sleep(delay)
+            if token is not None:
+                slurm_id = find_job_by_token(token)
+                if slurm_id is not None:
+                    logger.warning(
+                        f"The previous attempt to submit {script} went through after all."
+                    )
+                    return slurm_id
+
+        try:
+            res = subprocess.run(
+                cmd, capture_output=True, encoding="UTF-8", cwd=str(cwd), timeout=120
+            )
+        except subprocess.TimeoutExpired:
+            logger.warning(f"sbatch timed out while submitting {script}.")
+            continue
+
+        if res.returncode == 0:
+            # --parsable output looks like this: '18334739' or '18334739;cluster'
+            return res.stdout.strip().split(";")[0]
+
+        error = (res.stderr or res.stdout).strip()
+        if TRANSIENT_SBATCH_ERRORS.search(error) is None:
+            raise RuntimeError(f"sbatch could not submit {script}: {error}")
+        logger.warning(f"sbatch could not submit {script} (transient): {error}")
+
+    raise RuntimeError(
+        f"sbatch could not submit {script} after {retries + 1} attempts. "
+        f"Is slurmctld responding?"
+    )
+
+
+def sbatch_scripts(id, dirs):
+    """
+    Names of the scripts to submit for an sbatch_id: its parts, if its array was split
+    (only the first one, if parts are chained, since each part submits the next), or
+    sb-<sbatch_id> otherwise.
+    :param id: sbatch_id (int)
+    :param dirs: dirs dictionary generated by calculate_directories.
+    :return: list of script names, without extension
+    """
+    from ..utils.io import load_sbatch_manifest
+
+    # arrays split into several parts are submitted one part at a time; chained
+    # parts submit each other, so only the first one is submitted here
+    manifest = load_sbatch_manifest(id, dirs)
+    if manifest is not None and len(manifest["parts"]) > 1:
+        parts = manifest["parts"]
+        if manifest.get("chained", False):
+            parts = parts[:1]
+        return [part["name"] for part in parts]
+
+    return [f"sb-{str(id).zfill(4)}"]
+
+
+def submission_elements(id, script_name, dirs, sbatch_args):
+    """
+    Jobs run by each array element of a submission, for the crosswalk (see
+    ..db.SlurmhelperDB.add_sbatch_job()).
+    :param id: sbatch_id (int)
+    :param script_name: name of the submitted script, without extension
+    :param dirs: dirs dictionary generated by calculate_directories.
+    :param sbatch_args: list of extra arguments given to sbatch
+    :return: tuple (array, elements): the --array index list submitted (None if not an
+             array), and a dict {array index: [job ids]}; jobs that may run in any element
+             (--dynamic arrays) or that are not in an array are under None.
+    """
+    from .runner import read_runner_jobs
+    from ..utils.io import load_sbatch_manifest
+    from ..utils.misc import compact_index_ranges, expand_index_ranges
+
+    manifest = load_sbatch_manifest(id, dirs)
+    parts = [] if manifest is None else manifest["parts"]
+    parts = [part for part in parts if part["name"] == script_name]
+    if len(parts) == 0:
+        script = Path(dirs["slurm_scripts"]) / f"{script_name}.sh"
+        return None, {None: read_runner_jobs(script)}
+
+    part = parts[0]
+    array = compact_index_ranges(range(part["start_index"], part["end_index"] + 1))
+    for arg in sbatch_args:
+        if arg.startswith("--array="):
+            array = arg[len("--array=") :]
+
+    if part.get("dynamic", False):
+        return array, {None: part["jobs"]}
+    elements = part["elements"]
+    return array, {
+        idx: elements[idx] for idx in expand_index_ranges(array) if idx in elements
+    }
+
+
+def script_hash(path):
+    """
+    Hash of the contents of a script, telling apart scripts prepped again under the same
+    name from the ones submitted before.
+    :param path: path to the script
+    :return: str, hex digest; None if the script does not exist
+    """
+    import hashlib
+
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def record_chained_submissions(dirs, config=None):
+    """
+    Add the parts of chained arrays submitted by their previous part (see
+    ..jobs.cli_helpers.build_chain_call()) to the crosswalk, if not there yet.
+    :param dirs: dirs dictionary generated by calculate_directories.
+    :param config: dict, output of load_spec() (for the spec name and version)
+    :return:
+    """
+    from ..db import SlurmhelperDB
+
+    db = SlurmhelperDB(dirs)
+    config = config or dict()
+    for id_file in glob.glob(
+        os.path.join(dirs["slurm_scripts"], ".sb-*.submitted", "*", "slurm_id")
+    ):
+        id_file = Path(id_file)
+        if id_file.read_text().strip() == "":
+            continue
+        slurm_id = id_file.read_text().strip().split(";")[0]
+        if db.has_sbatch_job(slurm_id):
+            continue
+        script_name = id_file.parent.parent.name[1 : -len(".submitted")]
+        id = int(script_name.split("-")[1])
+        array, elements = submission_elements(id, script_name, dirs, [])
+        db.add_sbatch_job(
+            id,
+            {
+                "slurm_id": slurm_id,
+                "script": script_name,
+                "array": array,
+                "spec_name": config.get("spec_name", None),
+                "spec_version": config.get("spec_version", None),
+                "submitted_at": datetime.fromtimestamp(
+                    id_file.stat().st_mtime
+                ).isoformat(timespec="seconds"),
+                "script_hash": script_hash(
+                    Path(dirs["slurm_scripts"]) / f"{script_name}.sh"
+                ),
+                "elements": elements,
+            },
+        )
+
+
+def prepped_sbatch_ids(dirs):
+    """
+    All sbatch_ids with scripts prepped in this working directory.
+    :param dirs: dirs dictionary generated by calculate_directories.
+    :return: sorted list of sbatch_ids (int)
+    """
+    scripts = glob.glob(os.path.join(dirs["slurm_scripts"], "sb-????.sh")) + glob.glob(
+        os.path.join(dirs["slurm_scripts"], "sb-????-part*.sh")
+    )
+    ids = set()
+    for script in scripts:
+        m = re.match(r"sb-(\d{4})(-part\d+)?\.sh$", os.path.basename(script))
+        if m is not None:
+            ids.add(int(m.group(1)))
+    return sorted(ids)
+
+
+def submit_sbatch(id, dirs, **kwargs):
     """
     Helper function to submit sbatch scripts. It does so from a "crashes" file, such that any
     nipype related crash files would dump to a "crashes" directory corresponding to the sbatch submission.
     This hopefully makes debugging a bit easier?
     :param id: sbatch_id (int)
     :param dirs: dirs dictionary generated by calculate_directories.
-    :return:
+    :param kwargs: passed on to submit_sbatch_script()
+    :return: list of slurm job ids (None for scripts that were already submitted)
     """
-    from pathlib import Path
-    import subprocess
-    import os
+    return [
+        submit_sbatch_script(id, script_name, dirs, **kwargs)
+        for script_name in sbatch_scripts(id, dirs)
+    ]
 
-    script_to_submit = Path(dirs["slurm_scripts"]) / f"sb-{str(id).zfill(4)}.sh"
+
+def submit_campaign(
+    ids, dirs, rate=1.0, retries=5, backoff=2.0, force=False, dry=False, config=None
+):
+    """
+    Submit several sbatch_ids in one go, at most `rate` submissions per second.
+    :param ids: list of sbatch_ids (int); None to submit every prepped sbatch_id
+    :param dirs: dirs dictionary generated by calculate_directories.
+    :param rate: maximum number of submissions per second
+    :param retries: number of retries upon transient sbatch errors
+    :param backoff: seconds to wait before the first retry (doubled every retry)
+    :param force: submit scripts even if they were submitted before
+    :param dry: only print what would be submitted
+    :param config: dict, output of load_spec() (for the spec name and version)
+    :return: dict mapping sbatch_id to list of slurm job ids (None where skipped)
+    """
+    if ids is None:
+        ids = prepped_sbatch_ids(dirs)
+        print(f"Found {len(ids)} prepped sbatch ids.")
+
+    throttle = SubmissionThrottle(rate)
+    rv = dict()
+    for id in ids:
+        rv[id] = submit_sbatch(
+            id,
+            dirs,
+            force=force,
+            throttle=throttle,
+            retries=retries,
+            backoff=backoff,
+            dry=dry,
+            config=config,
+        )
+
+    submitted = [s for ids_ in rv.values() for s in ids_ if s is not None]
+    if not dry:
+        print(
+            f"Submitted {len(submitted)} scripts for {len(rv)} sbatch ids "
+            f"({sum([len(v) for v in rv.values()]) - len(submitted)} skipped)."
+        )
+    return rv
+
+
+def submit_sbatch_script(
+    id,
+    script_name,
+    dirs,
+    sbatch_args=None,
+    force=False,
+    throttle=None,
+    retries=5,
+    backoff=2.0,
+    dry=False,
+    config=None,
+):
+    """
+    Submits a single sbatch script for a given sbatch_id (see submit_sbatch()).
+    :param id: sbatch_id (int)
+    :param script_name: name of the script to submit, without extension (e.g., sb-0001)
+    :param dirs: dirs dictionary generated by calculate_directories.
+    :param sbatch_args: optional list of extra arguments for sbatch, which take precedence
+                        over the #SBATCH directives of the script (e.g., ["--array=3,17"])
+    :param force: submit even if this script (with these arguments) was submitted before
+    :param throttle: optional SubmissionThrottle shared by several submissions
+    :param retries: number of retries upon transient sbatch errors
+    :param backoff: seconds to wait before the first retry (doubled every retry)
+    :param dry: only print what would be submitted
+    :param config: dict, output of load_spec() (for the spec name and version)
+    :return: str, slurm job id; None if not submitted
+    """
+    from ..db import SlurmhelperDB
+
+    script_to_submit = Path(dirs["slurm_scripts"]) / f"{script_name}.sh"
     if not script_to_submit.exists():
         raise FileNotFoundError(
             f"Script for sbatch_id {id} not found\n\t(expected: {str(script_to_submit)})"
@@ -23,26 +363,62 @@ def submit_sbatch(id, dirs):
             "Crashes directory not found. Did you initialize this wd correctly?"
         )
 
+    # nothing gets submitted twice, unless asked to (scripts prepped again are new ones)
+    db = SlurmhelperDB(dirs)
+    sbatch_args = sbatch_args or []
+    digest = script_hash(script_to_submit)
+    previous = db.find_submissions(script_name, sbatch_args, digest)
+    if len(previous) > 0 and not force:
+        print(
+            f"Sbatch job {script_name}.sh was already submitted as slurm job "
+            f"{previous[-1]['slurm_id']} ({previous[-1]['submitted_at']}); skipping it. "
+            f"Use --force to submit it again."
+        )
+        return None
+
+    if dry:
+        print(f"Would submit {script_name}.sh {' '.join(sbatch_args)}")
+        return None
+
     # create directory from which we submit this
     # wd/crashes/sb-####/
     from_path = from_path / f"sb-{str(id).zfill(4)}"
     from_path.mkdir(parents=True, exist_ok=True)
 
-    cmd_output = subprocess.check_output(
-        ["sbatch", str(script_to_submit)],
-        encoding="UTF-8",
-        cwd=str(from_path),  # run from the pertinent crashes dir, so things are neat
+    if throttle is not None:
+        throttle.wait()
+    token = f"slurmhelper:{script_name}:{uuid.uuid4().hex[:12]}"
+    slurm_id = run_sbatch(
+        script_to_submit,
+        from_path,  # run from the pertinent crashes dir, so things are neat
+        sbatch_args,
+        token=token,
+        retries=retries,
+        backoff=backoff,
     )
 
-    # Output looks like this: 'Submitted batch job 18334739\n'
-    slurm_id = cmd_output.strip().replace("Submitted batch job ", "")
+    # keep track of which jobs run where
+    config = config or dict()
+    array, elements = submission_elements(id, script_name, dirs, sbatch_args)
+    db.add_sbatch_job(
+        id,
+        {
+            "slurm_id": slurm_id,
+            "script": script_name,
+            "array": array,
+            "sbatch_args": sbatch_args,
+            "spec_name": config.get("spec_name", None),
+            "spec_version": config.get("spec_version", None),
+            "submitted_at": datetime.now().isoformat(timespec="seconds"),
+            "token": token,
+            "script_hash": digest,
+            "elements": elements,
+        },
+    )
 
     print(
-        f"Sbatch job sb-{str(id).zfill(4)}.sh submitted.\n"
+        f"Sbatch job {script_name}.sh submitted.\n"
         f"The Slurm ID for this job (seen in squeue) is {slurm_id}."
     )
 
-    # TODO: Save this sbatch_id and slurm_id crosswalk to an internal database, allowing us to track what slurm job id corresponds with our internal
-    #       sbatch_id.
-
-    return cmd_output
+    return slurm_id
@@ -5,7 +5,6 @@ Definition of Job object class, associated methods, and TestableJob class extens
 # This file contains the base job class, which is then augmented for each
 # specific use case with tests, etc.
 import logging
-from pathlib import Path
 from string import Formatter
 
 import pandas as pd
@@ -48,14 +47,10 @@ def build_job_objects(dirs, config, job_list=None):
     :param config: dict generated from reading the .yml spec
     :return: list of job objects! :)
     """
-    # Read database file
-    p_csvfile = Path(dirs["base"]).joinpath("db.csv")
-    if p_csvfile.exists():
-        df = pd.read_csv(p_csvfile)
-    else:
-        raise ValueError(
-            "The specified database csv file does not exist:\n%s" % str(p_csvfile)
-        )
+    from ..db import SlurmhelperDB
+
+    # Read the job table stored by init
+    df = SlurmhelperDB(dirs).load_jobs()
 
     # We MUST have an order_id column!!
     if "order_id" not in df.columns:
@@ -119,3 +114,80 @@ def build_job_objects(dirs, config, job_list=None):
     ]
 
     return job_obj_list
+
+
+# default names of the (optional) db columns holding per-job resource needs
+DEFAULT_RESOURCE_COLUMNS = {"time": "job_time", "mem": "job_mem", "cpus": "job_cpus"}
+
+
+def load_job_resources(dirs, config, job_list=None):
+    """
+    Read per-job resource needs (time, memory, cpus) from the job database, if available.
+    Column names default to job_time, job_mem and job_cpus, but can be remapped through a
+    resource_columns dict in your spec, e.g. {time: walltime, mem: mem_mb, cpus: n_thr}.
+    Numeric times are read as minutes; strings are parsed as timedeltas (e.g. '01:30:00').
+    :param dirs: output of ..utils.io:calculate_directories()
+    :param config: dict generated from reading the .yml spec
+    :param job_list: list of job ids (integers) to consider. If none, all jobs in db.
+    :return: pandas DataFrame with order_id plus one column (time, mem, cpus) for each
+             resource found in the db; None if the db defines no resource columns.
+    """
+    resource_columns = {
+        **DEFAULT_RESOURCE_COLUMNS,
+        **(config.get("resource_columns", None) or dict()),
+    }
+
+    from ..db import SlurmhelperDB
+
+    df = SlurmhelperDB(dirs).load_jobs(job_list)
+
+    found = {k: v for (k, v) in resource_columns.items() if v in df.columns}
+    if len(found) == 0:
+        return None
+
+    logger.info(f"Per-job resource columns found in db: {found}")
+
+    rv = df[["order_id"] + list(found.values())].rename(
+        columns={v: k for (k, v) in found.items()}
+    )
+    if "time" in rv.columns:
+        if pd.api.types.is_numeric_dtype(rv["time"]):
+            rv["time"] = pd.to_timedelta(rv["time"], unit="minutes")
+        else:
+            rv["time"] = pd.to_timedelta(rv["time"])
+    for col in {"mem", "cpus"}.intersection(rv.columns):
+        rv[col] = rv[col].astype("Int64")
+
+    return rv.reset_index(drop=True)
+
+
+def group_resource_classes(resources, job_list):
+    """
+    Group jobs into resource classes, i.e. sets of jobs with identical time / memory / cpu needs.
+    :param resources: output of load_job_resources()
+    :param job_list: list of job ids (integers) to group
+    :return: list of (resource dict, job id list) tuples, sorted from smallest to largest class
+             needs. Resources a job does not specify are left as None.
+    """
+    if resources is None:
+        return [(dict(), list(job_list))]
+
+    dims = [c for c in ["time", "mem", "cpus"] if c in resources.columns]
+    resources = resources[resources.order_id.isin(job_list)]
+
+    classes = []
+    for key, grp in resources.groupby(dims, dropna=False, sort=True):
+        key = key if isinstance(key, tuple) else (key,)
+        spec = {
+            dim: (None if pd.isna(val) else val) for (dim, val) in zip(dims, key)
+        }
+        if spec.get("time", None) is not None:
+            spec["time"] = pd.Timedelta(spec["time"]).to_pytimedelta()
+        for dim in {"mem", "cpus"}.intersection(spec.keys()):
+            if spec[dim] is not None:
+                spec[dim] = int(spec[dim])
+        # keep the user's job ordering within a class
+        ids = set(grp.order_id.tolist())
+        classes.append((spec, [j for j in job_list if j in ids]))
+
+    return classes
@@ -34,6 +34,12 @@ spec_optional_keys = {
     "job_ramp_up_time",
     "expected_n_files",
     "compute_function",
+    "resource_columns",
+    "max_array_size",
+    "max_submit_jobs",
+    "job_class_columns",
+    "duration_model",
+    "skip_up_to_date",
 }
 
 
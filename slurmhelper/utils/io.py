@@ -2,6 +2,7 @@
 Utility functions leveraged for I/O filesystem operations.
 """
 
+import json
 import logging
 import os
 import subprocess
@@ -91,6 +92,51 @@ def initialize_directories(dirs):
         p.mkdir(parents=True, exist_ok=True)
 
 
+# values of the bytes of the status file (see status_file_path())
+JOB_STATUS_CODES = {"pending": 0, "running": 1, "success": 2, "failed": 3, "skipped": 4}
+
+
+def status_file_path(dirs):
+    """
+    Path to the status file of a working directory: one byte per order_id (at offset
+    order_id), set by wrappers as jobs start and end (see JOB_STATUS_CODES).
+    :param dirs: dict, output of calculate_directories()
+    :return: Path object
+    """
+    return Path(dirs["base"]) / "status.bin"
+
+
+def ensure_status_file(dirs, max_order_id):
+    """
+    Create the status file (all jobs pending), or grow it so that it holds a byte for every
+    order_id up to max_order_id. Existing statuses are kept.
+    :param dirs: dict, output of calculate_directories()
+    :param max_order_id: int, largest order_id to make room for
+    :return:
+    """
+    path = status_file_path(dirs)
+    size = int(max_order_id) + 1
+    with open(path, "ab") as f:
+        if f.tell() < size:
+            # zero-filled (i.e., pending), without writing out the bytes
+            f.truncate(size)
+            logger.info(f"Status file {path} holds {size} jobs.")
+
+
+def read_status_file(dirs):
+    """
+    Map the status file into memory, read-only.
+    :param dirs: dict, output of calculate_directories()
+    :return: numpy array of uint8, indexed by order_id (None if there is no status file)
+    """
+    import numpy as np
+
+    path = status_file_path(dirs)
+    if not path.exists() or path.stat().st_size == 0:
+        return None
+    return np.memmap(path, dtype=np.uint8, mode="r")
+
+
 def write_job_script(job_id, sbatch_id, dirs, script):
     """
     Helper function to facilitate writing a command line script for a given job, to
@@ -127,6 +173,52 @@ def write_job_script(job_id, sbatch_id, dirs, script):
             logger.info(f"Wrote file: {path_sbatch}")
 
 
+def sbatch_manifest_path(sbatch_id, dirs):
+    """
+    Path to the manifest describing how an sbatch_id family is laid out.
+    :param sbatch_id: int, sbatch_id
+    :param dirs: dict, output of calculate_directories()
+    :return: Path object
+    """
+    return Path(dirs["slurm_scripts"]) / "sb-{sbatch_id:04d}.json".format(
+        sbatch_id=int(sbatch_id)
+    )
+
+
+def write_sbatch_manifest(sbatch_id, dirs, manifest):
+    """
+    Save the manifest of an sbatch job array family (array scripts, element indices, job ids per
+    element, requested resources) next to its scripts, in <wd>/scripts/slurm/sb-<sbatch_id>.json.
+    :param sbatch_id: int, sbatch_id
+    :param dirs: dict, output of calculate_directories()
+    :param manifest: dict, json-serializable manifest
+    :return:
+    """
+    path = sbatch_manifest_path(sbatch_id, dirs)
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    logger.info(f"Wrote file: {path}")
+
+
+def load_sbatch_manifest(sbatch_id, dirs):
+    """
+    Read the manifest of an sbatch job array family, written by write_sbatch_manifest().
+    :param sbatch_id: int, sbatch_id
+    :param dirs: dict, output of calculate_directories()
+    :return: dict with manifest, or None if no manifest exists (e.g., not an array, or
+             prepped with an older version of slurmhelper).
+    """
+    path = sbatch_manifest_path(sbatch_id, dirs)
+    if not path.exists():
+        return None
+    with open(path, "r") as f:
+        manifest = json.load(f)
+    # json keys are always strings; element indices are integers
+    for part in manifest["parts"]:
+        part["elements"] = {int(k): v for (k, v) in part["elements"].items()}
+    return manifest
+
+
 def copy_or_clean(job_list, operation, path_scripts):
     """
     Helper function designed to facilitate:
@@ -18,6 +18,45 @@ def split_list(alist, wanted_parts=1):
     ]
 
 
+def compact_index_ranges(indices):
+    """
+    Format a list of integers the way sbatch --array expects sparse index lists,
+    collapsing consecutive runs into ranges, e.g. [3, 17, 40, 41, 42] -> "3,17,40-42".
+    :param indices: iterable of integers
+    :return: str
+    """
+    chunks = []
+    for i in sorted(set(indices)):
+        if len(chunks) > 0 and chunks[-1][1] == i - 1:
+            chunks[-1][1] = i
+        else:
+            chunks.append([i, i])
+    return ",".join(
+        [str(start) if start == end else f"{start}-{end}" for (start, end) in chunks]
+    )
+
+
+def expand_index_ranges(spec):
+    """
+    Inverse of compact_index_ranges(): expand an sbatch --array index list into integers,
+    e.g. "3,17,40-42%5" -> [3, 17, 40, 41, 42]. Steps (e.g., "1-9:2") are honored, and the
+    throttle (%N) is ignored.
+    :param spec: str, as given to sbatch --array
+    :return: sorted list of integers
+    """
+    indices = set()
+    for chunk in spec.split("%")[0].split(","):
+        chunk = chunk.strip()
+        if chunk == "":
+            continue
+        bounds, _, step = chunk.partition(":")
+        start, _, end = bounds.partition("-")
+        indices.update(
+            range(int(start), int(end or start) + 1, int(step) if step else 1)
+        )
+    return sorted(indices)
+
+
 def factors(n):
     """
     Finds all factors for a given number.
@@ -7,10 +7,7 @@ import logging
 import os
 import re
 import time
-import subprocess
 from pathlib import Path
-from io import StringIO
-from pprint import pprint
 
 import pandas as pd
 
@@ -18,6 +15,13 @@ from ..jobs.utils import build_job_objects
 
 logger = logging.getLogger("cli")
 
+# number of threads scanning job logs at once; opening and reading logs is I/O-bound, and
+# on parallel filesystems every open/stat waits on a metadata server
+DEFAULT_SCAN_WORKERS = 8
+
+# resources measured by runners, as found in job sidecars (see ..jobs.runner.MEASURE_SHIM)
+RESOURCE_KEYS = ["max_rss_kb", "user_cpu", "sys_cpu", "read_bytes", "write_bytes"]
+
 
 def pretty_cli_header(str, pad_char, n_cols=60, start_newline=True, end_newline=True):
     start = ""
@@ -38,13 +42,87 @@ def pretty_cli_header(str, pad_char, n_cols=60, start_newline=True, end_newline=
     return "\n".join(rv)
 
 
-def list_slurm(dirs):
+def list_slurm(dirs, job_list=None, status=None):
     """
     Helpful function, prints out existing scripts in the directory structure for
-    the user to review and such.
+    the user to review and such. Scripts recorded in the database by prep / prep-array
+    are listed from there, along with the jobs they run and what they request; the scripts
+    directory is only scanned for working directories prepped by older versions of
+    slurmhelper (which cannot be filtered by job or status).
     :param dirs: dict output of calculate_directories()
+    :param job_list: list of job ids (int); only list scripts running these jobs
+    :param status: str, only list scripts running jobs whose latest known status is this one
     :return:
     """
+    from ..db import SlurmhelperDB
+    from .misc import compact_index_ranges
+
+    db = SlurmhelperDB(dirs)
+    scripts = db.find_scripts() if db.db_file.exists() else []
+    if len(scripts) > 0:
+        serial = [s for s in scripts if s["kind"] == "sbatch"]
+        arrays = [s for s in scripts if s["kind"] == "array"]
+        n_elements = dict()
+        for s in scripts:
+            if s["kind"] == "element":
+                part = s["name"].rsplit("-", 1)[0]
+                n_elements[part] = n_elements.get(part, 0) + 1
+        print(
+            f"{len(serial)} sbatch submission scripts and "
+            f"{len(set([s['sbatch_id'] for s in arrays]))} sbatch job arrays found."
+        )
+
+        matches = None
+        if job_list is not None or status is not None:
+            matches = dict()
+            for row in db.find_script_jobs(job_list, status):
+                matches.setdefault(row["name"], []).append(row)
+            if len(matches) == 0:
+                print("No script runs jobs matching these criteria.")
+                return
+
+        rows = []
+        for s in serial + arrays:
+            if matches is not None and s["name"] not in matches:
+                continue
+            row = {
+                "sbatch_id": "{id:04d}".format(id=s["sbatch_id"]),
+                "script": f"{s['name']}.sh",
+                "array": s["array"] or "-",
+                "elements": n_elements.get(s["name"], "-"),
+                "jobs": "?" if s["n_jobs"] is None else s["n_jobs"],
+                "job ids": s["job_ranges"] or "-",
+                "time": s["time"] or "?",
+                "mem": s["mem"] or "?",
+                "tasks": "?" if s["n_tasks"] is None else s["n_tasks"],
+            }
+            if matches is not None:
+                found = matches[s["name"]]
+                row["matching jobs"] = compact_index_ranges(
+                    [r["order_id"] for r in found]
+                )
+                row["in elements"] = (
+                    compact_index_ranges(
+                        [r["array_index"] for r in found if r["array_index"] is not None]
+                    )
+                    or "-"
+                )
+            rows.append(row)
+        print(pd.DataFrame(rows).to_string(index=False))
+        return
+
+    if job_list is not None or status is not None:
+        if not db.db_file.exists():
+            raise ValueError(
+                f"No slurmhelper database found at {db.db_file}; check that --wd-path "
+                f"and --spec-file are the ones the scripts were prepped with."
+            )
+        raise ValueError(
+            "Scripts in this working directory were prepped by an older version of "
+            "slurmhelper, which did not record which jobs they run; prep them again to "
+            "list them by job id or status."
+        )
+
     sbatch_files = glob.glob(os.path.join(dirs["slurm_scripts"], "sb-????.sh"))
     found_sbatch = [re.search("sb-(.+?).sh", x).group(1) for x in sbatch_files]
     if not found_sbatch:
@@ -86,14 +164,149 @@ def list_slurm(dirs):
     return
 
 
-def check_queue():
-    # assumes slurm
-    out = subprocess.check_output(
-        ["squeue", "-u", os.environ["USER"]], encoding="UTF-8"
+def lookup_crosswalk(dirs, job_list=None, slurm_ids=None, config=None):
+    """
+    Print which Slurm jobs ran (or were submitted to run) the given user jobs, and which user
+    jobs were submitted in the given Slurm jobs, from the crosswalk recorded upon submission.
+    :param dirs: dict output of calculate_directories()
+    :param job_list: list of job ids (int) to look up
+    :param slurm_ids: list of Slurm job ids to look up, e.g. 18334739 or 18334739_117
+    :param config: dict, output of load_spec()
+    :return:
+    """
+    from ..db import SlurmhelperDB
+    from ..jobs.submit import record_chained_submissions
+
+    record_chained_submissions(dirs, config)
+    db = SlurmhelperDB(dirs)
+
+    for job_id in job_list or []:
+        found = db.find_slurm_jobs(job_id)
+        if len(found) == 0:
+            print(f"Job {job_id:05d}: no submission recorded.")
+            continue
+        print(f"Job {job_id:05d}:")
+        for row in found:
+            slurm_id = row["slurm_id"]
+            if row["array_index"] is not None:
+                slurm_id += f"_{row['array_index']}"
+            print(
+                f"  slurm job {slurm_id} ({row['script']}.sh, "
+                f"submitted {row['submitted_at']})"
+            )
+
+    for slurm_id in slurm_ids or []:
+        job_id, _, array_index = str(slurm_id).partition("_")
+        jobs = db.find_user_jobs(
+            job_id, int(array_index) if array_index != "" else None
+        )
+        if len(jobs) == 0:
+            print(f"Slurm job {slurm_id}: no jobs recorded.")
+        else:
+            print(f"Slurm job {slurm_id}: {len(jobs)} jobs")
+            pretty_print_job_ids(jobs)
+
+
+def check_queue(dirs, config=None, ttl=None):
+    """
+    Summarize the user's jobs in the queue that belong to this working directory: how many
+    tasks of each submitted sbatch job / array part are pending, running or completing (and
+    why they are pending), and which user jobs are running right now. Queued jobs are mapped
+    to submissions by their Slurm job id, or else by their name (sb-XXXX...).
+    :param dirs: dict output of calculate_directories()
+    :param config: dict, output of load_spec()
+    :param ttl: seconds a cached squeue result may be reused for (see
+                .scheduler.run_scheduler_query()); the default if None
+    :return: pandas DataFrame, one row per queued job / group of array elements
+    """
+    from ..db import SlurmhelperDB
+    from ..jobs.submit import record_chained_submissions
+    from .scheduler import DEFAULT_CACHE_TTL, query_squeue, scheduler_cache_dir
+
+    record_chained_submissions(dirs, config)
+    db = SlurmhelperDB(dirs)
+    submissions = {sub["slurm_id"]: sub for sub in db.list_submissions()}
+
+    rows = []
+    n_other = 0
+    squeue = query_squeue(
+        cache_dir=scheduler_cache_dir(dirs),
+        ttl=DEFAULT_CACHE_TTL if ttl is None else ttl,
+    )
+    for row in squeue:
+        sub = submissions.get(row["slurm_id"], None)
+        m = re.match(r"^sb-(\d+)", row["name"])
+        if sub is not None:
+            row.update({"sbatch_id": sub["sbatch_id"], "script": sub["script"]})
+        elif m is not None:
+            row.update({"sbatch_id": int(m.group(1)), "script": row["name"]})
+        else:
+            n_other += 1
+            continue
+        row["n_tasks"] = len(row["array_tasks"]) if row["array_tasks"] else 1
+        rows.append(row)
+
+    queue = pd.DataFrame(
+        rows,
+        columns=[
+            "sbatch_id",
+            "script",
+            "slurm_id",
+            "job_id",
+            "array_tasks",
+            "n_tasks",
+            "state",
+            "reason",
+            "time_used",
+            "time_left",
+            "cpus",
+            "name",
+        ],
+    )
+    print(
+        f"{int(queue['n_tasks'].sum())} tasks of this working directory in the queue"
+        + (f" ({n_other} other jobs of yours)." if n_other > 0 else ".")
+    )
+    if len(queue) == 0:
+        return queue
+
+    print(pretty_cli_header("tasks by state", "~"))
+    by_state = queue.pivot_table(
+        index=["sbatch_id", "script", "slurm_id"],
+        columns="state",
+        values="n_tasks",
+        aggfunc="sum",
+        fill_value=0,
+    )
+    print(by_state.to_string())
+
+    pending = queue[queue["state"] == "PENDING"]
+    if len(pending) > 0:
+        print(pretty_cli_header("pending tasks by reason", "~"))
+        print(
+            pending.groupby(["script", "reason"])["n_tasks"]
+            .sum()
+            .to_frame()
+            .to_string()
+        )
+
+    # jobs the runners of running tasks reported as started (see ..db.SlurmhelperDB.merge_journals())
+    running = set()
+    for row in queue[queue["state"] == "RUNNING"].itertuples():
+        for task in row.array_tasks or [None]:
+            running.add((row.slurm_id, task))
+    running_jobs = sorted(
+        [
+            order_id
+            for (order_id, outcome) in db.find_outcomes(status="running").items()
+            if (outcome["slurm_id"], outcome["array_index"]) in running
+        ]
     )
-    df = pd.read_fwf(StringIO(out))
-    # TODO: merge this with info on sbatch thingys, then do some magic to make it more informative!
-    pprint(df)
+    if len(running_jobs) > 0:
+        print(f"\njobs running right now (n = {len(running_jobs)}):")
+        pretty_print_job_ids(["{j:05d}".format(j=j) for j in running_jobs])
+
+    return queue
 
 
 def read_log_file_lines(path_to_file):
@@ -118,6 +331,59 @@ def read_log_file_lines(path_to_file):
     return lines
 
 
+def read_log_tail_lines(path_to_file, n=1, block_size=8192):
+    """
+    Read the last lines of a log, the way read_log_file_lines() would (stripped, without
+    stty warnings), but without reading the whole file: blocks are read from the end until
+    n lines are found, so the cost does not grow with the size of the log.
+    :param path_to_file: path to the log
+    :param n: number of lines wanted
+    :param block_size: bytes to read at once, doubled as long as more are needed
+    :return: list of up to n str (fewer if the log is shorter)
+    """
+    if not os.path.exists(str(path_to_file)):
+        raise FileNotFoundError(f"Invalid log file specified: {str(path_to_file)}")
+
+    with open(path_to_file, "rb") as log:
+        pos = log.seek(0, os.SEEK_END)
+        data = b""
+        while True:
+            size = min(block_size, pos)
+            pos -= size
+            log.seek(pos)
+            data = log.read(size) + data
+            lines = data.splitlines()
+            if pos > 0:
+                lines = lines[1:]  # may start halfway through a line
+            lines = [
+                s.decode("utf-8", "replace").strip()
+                for s in lines
+                if b"stty: standard input: Inappropriate ioctl for device" not in s
+            ]
+            if len(lines) >= n or pos == 0:
+                return lines[-n:] if n > 0 else []
+            block_size *= 2
+
+
+def read_job_sidecar(path):
+    """
+    Read the JSON sidecar a runner writes next to a job's log once the job is over (see
+    ..jobs.runner.job_sidecar_path()).
+    :param path: path to the sidecar
+    :return: dict, or None if there is no (readable) sidecar
+    """
+    import json
+
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        logger.warning(f"Could not read the job sidecar {path}; falling back to its log.")
+        return None
+
+
 def pretty_print_log(log_path, head, tail, full, header=None):
     """
     Pretty prints the job log header and footer. Sensitivity optional, shows more
@@ -220,16 +486,303 @@ def check_log(id, type, dirs, config, head=None, tail=None, full=False):
                 # TODO: implement something here?
 
 
+def scan_job_logs(jobs, scan, workers=None):
+    """
+    Apply a function reading job logs to every job, with a pool of threads, and report how
+    fast logs were scanned. Results are in the same order as jobs, just as if they were
+    scanned one at a time.
+    :param jobs: list of job objects
+    :param scan: function taking a job object
+    :param workers: number of threads (DEFAULT_SCAN_WORKERS if None; 1 to scan serially)
+    :return: list of results of scan, one per job
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    workers = DEFAULT_SCAN_WORKERS if workers is None else max(1, int(workers))
+    t0 = time.time()
+    if workers == 1 or len(jobs) < 2:
+        results = [scan(job) for job in jobs]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(scan, jobs))
+    elapsed = time.time() - t0
+
+    if len(jobs) > 0:
+        print(
+            f"Scanned logs of {len(jobs)} jobs in {elapsed:.2f}s "
+            f"({len(jobs) / max(elapsed, 1e-6):.0f} jobs/s, {workers} threads)."
+        )
+    return results
+
+
+def job_log_record(job):
+    """
+    Whether a job succeeded, and its runtime if so. Whether it succeeded comes from its sidecar
+    if there is one (see ..jobs.runner.job_sidecar_path()), otherwise from its log; the runtime
+    always comes from the log (see parse_runtime()). Jobs their run script skipped because
+    their outputs were up to date have no runtime, nor resources used.
+    :param job: job object (with a log or a sidecar)
+    :return: tuple (bool, int runtime in seconds or None, dict of resources used or None)
+    """
+    sidecar = job.read_job_sidecar()
+    if sidecar is not None:
+        if sidecar.get("up_to_date", False):
+            return True, None, None
+        resources = None
+        if "max_rss_kb" in sidecar:
+            resources = {k: sidecar[k] for k in RESOURCE_KEYS}
+            resources.update(
+                {
+                    "order_id": int(job.id),
+                    "walltime": int(sidecar["end"]) - int(sidecar["start"]),
+                }
+            )
+        if sidecar["exit_code"] != 0:
+            return False, None, resources
+        return True, parse_runtime(job) if job.has_job_log else None, resources
+    if not job.ran_successfully:
+        return False, None, None
+    return True, parse_runtime(job), None
+
+
+def stat_job_logs(dirs):
+    """
+    Modification time and size of every job log, from a single scan of the job logs directory.
+    :param dirs: dict output of calculate_directories()
+    :return: dict {file name: (mtime_ns, size)}, for logs and job sidecars
+    """
+    stats = dict()
+    with os.scandir(dirs["job_logs"]) as entries:
+        for entry in entries:
+            if entry.name.endswith((".txt", ".json")) and entry.is_file():
+                st = entry.stat()
+                stats[entry.name] = (st.st_mtime_ns, st.st_size)
+    return stats
+
+
+def index_job_logs(dirs, job_obj_list, workers=None, rescan=False):
+    """
+    Find out what the logs of the given jobs say, only parsing the logs that changed since
+    they were last parsed (based on their modification time and size), and keep the index of
+    parsed logs up to date (see ..db.SlurmhelperDB.find_log_index()). Jobs that have a sidecar
+    (see ..jobs.runner.job_sidecar_path()) are indexed on both their sidecar and their log.
+    :param dirs: dict output of calculate_directories()
+    :param job_obj_list: list of job objects
+    :param workers: number of threads scanning logs (see scan_job_logs())
+    :param rescan: parse all logs again, ignoring the index
+    :return: dict {order_id: (success, runtime)}, for the jobs that have a log or a sidecar
+    """
+    from ..db import SlurmhelperDB
+
+    db = SlurmhelperDB(dirs)
+    if rescan:
+        db.clear_log_index()
+    index = db.find_log_index()
+    stats = stat_job_logs(dirs)
+
+    rv = dict()
+    stale = []
+    for job in job_obj_list:
+        found = [
+            stats[name]
+            for name in [
+                os.path.basename(job._jd["this_job_sidecar_file"]),
+                os.path.basename(job._jd["this_job_log_file"]),
+            ]
+            if name in stats
+        ]
+        if len(found) == 0:
+            continue
+        # a change to either file is seen (e.g., the end of a log flushed after its sidecar)
+        stat = (max([st[0] for st in found]), sum([st[1] for st in found]))
+        cached = index.get(int(job.id), None)
+        if cached is not None and cached[:2] == stat:
+            rv[int(job.id)] = cached[2:]
+        else:
+            stale.append((job, stat))
+
+    if len(stale) > 0:
+        records = scan_job_logs([job for (job, _) in stale], job_log_record, workers)
+        for ((job, stat), record) in zip(stale, records):
+            rv[int(job.id)] = record[:2]
+        db.update_log_index(
+            [
+                (int(job.id), stat[0], stat[1], ok, rt)
+                for ((job, stat), (ok, rt, _)) in zip(stale, records)
+            ]
+        )
+        db.update_job_resources([used for (_, _, used) in records if used is not None])
+    print(
+        f"{len(rv) - len(stale)} job logs unchanged since they were last parsed, "
+        f"{len(stale)} parsed."
+    )
+    return rv
+
+
+def classify_jobs(dirs, config, job_list=None, workers=None, rescan=False):
+    """
+    Sort jobs by how far along they are, based on their logs.
+    :param dirs: dict output of calculate_directories()
+    :param config: dict, output of load_spec()
+    :param job_list: list of job ids (integers); all jobs in the db if None
+    :param workers: number of threads scanning logs (see scan_job_logs())
+    :param rescan: parse all logs again, instead of only those that changed
+    :return: tuple of lists of job objects, in order_id order (all jobs, jobs with logs,
+             successful jobs)
+    """
+    logger.info(f"Building job objects...")
+    job_obj_list = sorted(
+        build_job_objects(dirs, config, job_list), key=lambda job: int(job.id)
+    )
+
+    records = index_job_logs(dirs, job_obj_list, workers, rescan)
+    with_logs = [job for job in job_obj_list if int(job.id) in records]
+    with_success = [job for job in with_logs if records[int(job.id)][0]]
+
+    return job_obj_list, with_logs, with_success
+
+
+def load_skipped_jobs(dirs):
+    """
+    Find jobs that element runners did not start, because they were not expected to finish
+    within the walltime left or a warning signal came first (see jobs.runner.skipped_jobs_path()).
+    :param dirs: dict output of calculate_directories()
+    :return: set of job ids (integers)
+    """
+    skipped = set()
+    for path in glob.glob(os.path.join(dirs["slurm_logs"], "*.skipped")):
+        with open(path, "r") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) > 0 and fields[0].isdigit():
+                    skipped.add(int(fields[0]))
+    return skipped
+
+
+def find_incomplete_jobs(dirs, config, job_list=None, workers=None, rescan=False):
+    """
+    Find jobs that need to be run again: those whose logs indicate failure, and those
+    without logs (never ran, or were killed before they could write one). Jobs that element
+    runners did not start (see load_skipped_jobs()), and that have not succeeded since, are
+    also listed on their own.
+    :param dirs: dict output of calculate_directories()
+    :param config: dict, output of load_spec()
+    :param job_list: list of job ids (integers); all jobs in the db if None
+    :param workers: number of threads scanning logs (see scan_job_logs())
+    :param rescan: parse all logs again, instead of only those that changed
+    :return: dict with sorted lists of job ids (integers), under keys failed, no_log and
+             skipped
+    """
+    job_obj_list, with_logs, with_success = classify_jobs(
+        dirs, config, job_list, workers, rescan
+    )
+    all_ids = set([int(job.id) for job in job_obj_list])
+    log_ids = set([int(job.id) for job in with_logs])
+    success_ids = set([int(job.id) for job in with_success])
+
+    return {
+        "failed": sorted(log_ids - success_ids),
+        "no_log": sorted(all_ids - log_ids),
+        "skipped": sorted((load_skipped_jobs(dirs) & all_ids) - success_ids),
+    }
+
+
+def record_job_outcomes(dirs, job_obj_list, with_logs, with_success):
+    """
+    Save the status of jobs (success, failed, skipped or no_log), as found by classify_jobs(),
+    to the database. Jobs that journals show as running (started, with no end event since)
+    keep that status until they write their sidecar: their log may just not be complete yet.
+    :param dirs: dict output of calculate_directories()
+    :param job_obj_list: list of job objects considered
+    :param with_logs: list of job objects with logs
+    :param with_success: list of job objects whose logs indicate success
+    :return:
+    """
+    from ..db import SlurmhelperDB
+
+    db = SlurmhelperDB(dirs)
+    log_ids = set([int(job.id) for job in with_logs])
+    success_ids = set([int(job.id) for job in with_success])
+    skipped_ids = load_skipped_jobs(dirs)
+    running_ids = set(
+        db.find_outcomes([int(job.id) for job in job_obj_list], status="running").keys()
+    )
+
+    outcomes = []
+    for job in job_obj_list:
+        job_id = int(job.id)
+        if job_id in running_ids and job.read_job_sidecar() is None:
+            continue
+        if job_id in success_ids:
+            status = "success"
+        elif job_id in skipped_ids:
+            status = "skipped"
+        elif job_id in log_ids:
+            status = "failed"
+        else:
+            status = "no_log"
+        outcomes.append({"order_id": job_id, "status": status})
+    db.record_outcomes(outcomes)
+
+
+def count_job_statuses(dirs, job_list=None):
+    """
+    Count jobs by the status wrappers recorded in the status file (see
+    ..utils.io.status_file_path()), without reading any logs.
+    :param dirs: dict output of calculate_directories()
+    :param job_list: list of job ids (integers); all jobs in the db if None
+    :return: dict {status: number of jobs}, or None if there is no status file
+    """
+    import numpy as np
+
+    from .io import JOB_STATUS_CODES, read_status_file
+
+    status = read_status_file(dirs)
+    if status is None:
+        return None
+    if job_list is None:
+        from ..db import SlurmhelperDB
+
+        job_list = SlurmhelperDB(dirs).job_ids()
+    ids = np.asarray(job_list, dtype=np.int64)
+    # jobs beyond the end of the file were never started
+    values = np.zeros(len(ids), dtype=np.uint8)
+    in_file = ids < len(status)
+    values[in_file] = status[ids[in_file]]
+    counts = np.bincount(values, minlength=len(JOB_STATUS_CODES))
+    return {name: int(counts[code]) for (name, code) in JOB_STATUS_CODES.items()}
+
+
 def check_completed(
-    dirs, config, job_list=None, return_completed_list=False, failed_report=False
+    dirs,
+    config,
+    job_list=None,
+    return_completed_list=False,
+    failed_report=False,
+    quick=False,
+    workers=None,
+    rescan=False,
 ):
     # if job list is none, assume all of them are the ones we care about...
     # basically copypaste from check_runtimes
 
-    logger.info(f"Building job objects...")
-    job_obj_list = build_job_objects(dirs, config, job_list)
-
-    with_logs = list(filter(lambda x: x.has_job_log, job_obj_list))
+    if quick:
+        t0 = time.time()
+        counts = count_job_statuses(dirs, job_list)
+        if counts is None:
+            raise FileNotFoundError(
+                "No status file found in this working directory; run without --quick."
+            )
+        n_jobs = sum(counts.values())
+        print(f"jobs considered: {n_jobs} (from the status file, in {time.time() - t0:.3f}s)")
+        for (name, n) in counts.items():
+            print(f"    {name}: {n} ({n * 100 / max(n_jobs, 1):.1f}%)")
+        return None
+
+    job_obj_list, with_logs, with_success = classify_jobs(
+        dirs, config, job_list, workers, rescan
+    )
+    record_job_outcomes(dirs, job_obj_list, with_logs, with_success)
 
     if return_completed_list and len(with_logs) < len(job_obj_list):
         logger.warning(
@@ -237,8 +790,6 @@ def check_completed(
             f"only {len(with_logs)} of those have valid log files."
         )
 
-    with_success = list(filter(lambda x: x.ran_successfully, with_logs))
-
     if return_completed_list and len(with_logs) < len(job_list):
         logger.warning(
             f"Of the {len(with_logs)} jobs with logs, only "
@@ -259,6 +810,13 @@ def check_completed(
             set([str(job) for job in with_logs])
             - set([str(job) for job in with_success])
         )
+        skipped_ids = list(
+            set(["{job:05d}".format(job=j) for j in load_skipped_jobs(dirs)])
+            & (
+                set([str(job) for job in job_obj_list])
+                - set([str(job) for job in with_success])
+            )
+        )
         print("\n~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~")
         print("~ slurmhelper check completed: results ~~~~~~~~")
         print("~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~\n")
@@ -274,6 +832,12 @@ def check_completed(
         if len(no_logs_ids) > 0:
             print(f"\njobs without logfiles (n = {len(no_logs_ids)})")
             pretty_print_job_ids(sorted(no_logs_ids))
+        if len(skipped_ids) > 0:
+            print(
+                f"\njobs not started by their wrapper (walltime running out, or a warning "
+                f"signal), not yet completed (n = {len(skipped_ids)})"
+            )
+            pretty_print_job_ids(sorted(skipped_ids))
         if len(failed_job_ids) > 0:
             print(f"\nfailed jobs (n = {len(failed_job_ids)}):")
             pretty_print_job_ids(sorted(failed_job_ids))
@@ -300,29 +864,648 @@ def check_completed(
     return rv
 
 
-def check_runtimes(dirs, config, job_list=None):
+def watch_completion(
+    dirs,
+    config,
+    job_list=None,
+    interval=2.0,
+    n_failed=10,
+    poll=False,
+    workers=None,
+    rescan=False,
+):
+    """
+    Follow jobs as they run: after a first check (see classify_jobs()), watch the job logs
+    and slurm logs directories, and only re-check the jobs whose logs or sidecars changed
+    (and merge journals that changed), redrawing a compact progress display. Runs until all
+    jobs succeeded, or until interrupted (Ctrl-C).
+    :param dirs: dict output of calculate_directories()
+    :param config: dict, output of load_spec()
+    :param job_list: list of job ids (integers); all jobs in the db if None
+    :param interval: seconds to gather changes for between redraws
+    :param n_failed: number of recently failed jobs to show
+    :param poll: poll directories for changes, even if inotify is available
+    :param workers: number of threads scanning logs for the first check
+    :param rescan: whether the first check parses all logs again, ignoring the log index
+    :return:
+    """
+    import sys
+    from collections import deque
+    from datetime import datetime
+
+    from ..db import SlurmhelperDB
+    from .watch import watch_directories
+
+    db = SlurmhelperDB(dirs)
+    db.merge_journals(dirs)
+    job_obj_list, with_logs, with_success = classify_jobs(
+        dirs, config, job_list, workers, rescan
+    )
+    jobs = {
+        os.path.splitext(os.path.basename(job._jd["this_job_log_file"]))[0]: job
+        for job in job_obj_list
+    }
+    status = {int(job.id): "not started" for job in job_obj_list}
+    status.update({int(job.id): "failed" for job in with_logs})
+    status.update({int(job.id): "succeeded" for job in with_success})
+    running = set()
+    counts = {"succeeded": 0, "running": 0, "failed": 0, "not started": 0}
+    recently_failed = deque(maxlen=n_failed)
+
+    def shown(job_id):
+        # jobs being rerun (or still writing their log) are running, whatever their log says
+        if status[job_id] != "succeeded" and job_id in running:
+            return "running"
+        return status[job_id]
+
+    def update(job_id, new_status=None, is_running=None):
+        before = shown(job_id)
+        if new_status is not None:
+            status[job_id] = new_status
+        if is_running is True:
+            running.add(job_id)
+        elif is_running is False:
+            running.discard(job_id)
+        after = shown(job_id)
+        if before != after:
+            counts[before] -= 1
+            counts[after] += 1
+            if after == "failed":
+                recently_failed.append(job_id)
+            elif job_id in recently_failed:
+                recently_failed.remove(job_id)
+
+    def refresh_running():
+        now = set(db.find_outcomes(status="running").keys()) & set(status.keys())
+        for job_id in now - running:
+            update(job_id, is_running=True)
+        for job_id in running - now:
+            update(job_id, is_running=False)
+
+    for job_id in status.keys():
+        counts[shown(job_id)] += 1
+    recently_failed.extend([j for j in sorted(status.keys()) if status[j] == "failed"])
+    refresh_running()
+
+    tty = sys.stdout.isatty()
+    n_lines = 0
+    last = None
+    watcher = watch_directories([dirs["job_logs"], dirs["slurm_logs"]], poll)
+    print(
+        f"Watching {len(status)} jobs ({type(watcher).__name__.replace('Watcher', '')}); "
+        f"Ctrl-C to stop."
+    )
+    try:
+        while True:
+            total = max(len(status), 1)
+            bar = "#" * int(40 * counts["succeeded"] / total)
+            lines = [
+                f"[{datetime.now().strftime('%H:%M:%S')}] "
+                f"succeeded {counts['succeeded']}/{len(status)} "
+                f"({counts['succeeded'] * 100 / total:.1f}%) | "
+                f"running {counts['running']} | failed {counts['failed']} | "
+                f"not started {counts['not started']}",
+                f"[{bar:<40}]",
+            ]
+            if len(recently_failed) > 0:
+                lines.append(
+                    "recently failed: "
+                    + " ".join(["{j:05d}".format(j=j) for j in recently_failed])
+                )
+            if tty:
+                # move back up to overwrite the previous display
+                if n_lines > 0:
+                    sys.stdout.write(f"\033[{n_lines}F\033[J")
+                sys.stdout.write("\n".join(lines) + "\n")
+                sys.stdout.flush()
+                n_lines = len(lines)
+            elif lines[0].partition("] ")[2] != last:
+                print(lines[0])
+                last = lines[0].partition("] ")[2]
+
+            if counts["succeeded"] == len(status):
+                print("All jobs succeeded.")
+                break
+
+            changed = watcher.changes(interval)
+            if changed is None:
+                logger.warning("Missed some changes; checking all jobs again.")
+                changed = set(
+                    [(dirs["job_logs"], f"{name}.txt") for name in jobs.keys()]
+                    + [(dirs["slurm_logs"], ".journal")]
+                )
+
+            # journals first, so that jobs that just started are known to be running
+            if any([d == dirs["slurm_logs"] and n.endswith(".journal") for (d, n) in changed]):
+                db.merge_journals(dirs)
+                refresh_running()
+
+            stems = set(
+                [
+                    os.path.splitext(n)[0]
+                    for (d, n) in changed
+                    if d == dirs["job_logs"] and n.endswith((".txt", ".json"))
+                ]
+            )
+            for stem in stems:
+                job = jobs.get(stem, None)
+                if job is None:
+                    continue
+                try:
+                    success = job_log_record(job)[0]
+                except FileNotFoundError:
+                    continue  # e.g., the sidecar of a job starting again was just removed
+                update(int(job.id), "succeeded" if success else "failed")
+    except KeyboardInterrupt:
+        print("")
+    finally:
+        watcher.close()
+
+
+def parse_runtime(job):
+    """
+    Parse the runtime out of the log of a successfully completed job.
+    :param job: Job object (with a log indicating success)
+    :return: int, runtime in seconds; None if the job log has none
+    """
     # assumptions about runtime: formatting, position
-    # runtime_unit = seconds
-    runtime_unit = "seconds"
     runtime_line_position = -3
-    runtime_strip_str = "runtime: "
+    runtime_prefix = "runtime: "
+
+    lines = job.read_job_log_tail(-runtime_line_position)
+    if any(["outputs are up to date" in line for line in lines[-2:]]):
+        return None  # skipped by its run script (see skip_up_to_date): nothing to time
+    try:
+        line = lines[runtime_line_position]
+        if not line.startswith(runtime_prefix):
+            raise ValueError(line)
+        return int(line[len(runtime_prefix) :])
+    except (IndexError, ValueError):
+        # reported for all jobs at once, by indexed_runtimes()
+        logger.debug(f"Could not parse a runtime from the log of job {job}.")
+        return None
+
+
+def parse_runtimes(jobs, workers=None):
+    """
+    Parse runtimes out of the logs of successfully completed jobs.
+    :param jobs: list of Job objects (with logs indicating success)
+    :param workers: number of threads scanning logs (see scan_job_logs())
+    :return: pandas DataFrame with columns order_id, runtime (in seconds)
+    """
+    runtimes = scan_job_logs(jobs, parse_runtime, workers)
+    rows = [
+        {"order_id": job.id, "runtime": rt}
+        for (job, rt) in zip(jobs, runtimes)
+        if rt is not None
+    ]
+
+    return pd.DataFrame(rows, columns=["order_id", "runtime"])
 
+
+def indexed_runtimes(dirs, jobs):
+    """
+    Runtimes of successfully completed jobs, as recorded in the index of parsed job logs
+    (see index_job_logs(), which should have been run on these jobs first).
+    :param dirs: dict output of calculate_directories()
+    :param jobs: list of Job objects (with logs indicating success)
+    :return: pandas DataFrame with columns order_id, runtime (in seconds)
+    """
+    from ..db import SlurmhelperDB
+
+    index = SlurmhelperDB(dirs).find_log_index()
+    rows = []
+    for job in jobs:
+        entry = index.get(int(job.id), None)
+        if entry is not None and entry[3] is not None:
+            rows.append({"order_id": job.id, "runtime": entry[3]})
+
+    if len(rows) < len(jobs):
+        logger.warning(
+            f"{len(jobs) - len(rows)} of {len(jobs)} successfully completed jobs have no "
+            f"'runtime: <seconds>' line at the end of their log (or were skipped as up to "
+            f"date), and are left out of runtime statistics."
+        )
+    return pd.DataFrame(rows, columns=["order_id", "runtime"])
+
+
+def collect_runtimes(dirs, config, job_list=None, workers=None, rescan=False):
+    """
+    Collect runtimes of successfully completed jobs, from their job logs.
+    :param dirs: directory dictionary, as produced by .io:compute_directories()
+    :param config: config parameter dictionary
+    :param job_list: list of job ids to consider; if None, all jobs in the db.
+    :param workers: number of threads scanning logs (see scan_job_logs())
+    :param rescan: parse all logs again, instead of only those that changed
+    :return: pandas DataFrame with columns order_id, runtime (in seconds)
+    """
     with_success = check_completed(
-        dirs, config, job_list, failed_report=False, return_completed_list=True
+        dirs,
+        config,
+        job_list,
+        failed_report=False,
+        return_completed_list=True,
+        workers=workers,
+        rescan=rescan,
+    )
+    return indexed_runtimes(dirs, with_success)
+
+
+def summarize_runtimes(runtimes, db, group_by, outlier_iqr=1.5):
+    """
+    Describe runtimes for each group of jobs sharing values of the given db columns, and
+    flag outliers: jobs more than outlier_iqr interquartile ranges below the first quartile
+    or above the third quartile of their group (Tukey's fences).
+    :param runtimes: pandas DataFrame with columns order_id, runtime (in seconds)
+    :param db: pandas DataFrame, the job database (db.csv)
+    :param group_by: list of db columns to group jobs by
+    :param outlier_iqr: width of the fences, in interquartile ranges
+    :return: tuple of pandas DataFrames (per-group summary, indexed by group, with count,
+             percentiles and number of outliers; per-job runtimes with their group columns
+             and an outlier column)
+    """
+    missing = [c for c in group_by if c not in db.columns]
+    if len(missing) > 0:
+        raise ValueError(
+            f"Cannot group by {missing}: not columns of the job database. Available "
+            f"columns are: {', '.join(db.columns)}"
+        )
+
+    merged = runtimes.astype({"order_id": int}).merge(
+        db[["order_id"] + group_by], on="order_id", how="left"
     )
+    grouped = merged.groupby(group_by)["runtime"]
+    summary = grouped.describe(percentiles=[0.25, 0.5, 0.75, 0.9, 0.95])
+
+    fences = pd.DataFrame(
+        {
+            "lower": summary["25%"] - outlier_iqr * (summary["75%"] - summary["25%"]),
+            "upper": summary["75%"] + outlier_iqr * (summary["75%"] - summary["25%"]),
+        }
+    ).reset_index()
+    merged = merged.merge(fences, on=group_by, how="left")
+    merged["outlier"] = (merged["runtime"] < merged["lower"]) | (
+        merged["runtime"] > merged["upper"]
+    )
+    merged = merged.drop(columns=["lower", "upper"])
+
+    summary["outliers"] = merged.groupby(group_by)["outlier"].sum().astype(int)
+    summary["count"] = summary["count"].astype(int)
+    return summary, merged
+
+
+def export_table(df, path):
+    """
+    Write a table to CSV or Parquet, depending on the extension of the path given.
+    :param df: pandas DataFrame
+    :param path: output path, ending in .csv or .parquet
+    :return:
+    """
+    if str(path).endswith(".parquet"):
+        try:
+            df.to_parquet(path)
+        except ImportError as err:
+            raise ImportError(
+                f"Writing Parquet files needs pyarrow (or fastparquet) installed: {err}"
+            )
+    elif str(path).endswith(".csv"):
+        df.to_csv(path)
+    else:
+        raise ValueError(
+            f"Cannot tell what format to export to from {path}: use .csv or .parquet"
+        )
+    print(f"Wrote {len(df)} rows to {path}")
 
-    runtimes = []
-    for job in with_success:
-        lines = job.read_job_log_lines()
-        rt = int(lines[runtime_line_position].strip(runtime_strip_str))
-        runtimes.append(rt)
+
+def check_runtimes(
+    dirs, config, job_list=None, workers=None, rescan=False, group_by=None, export=None
+):
+    """
+    Describe the runtimes of successfully completed jobs: overall, and, if group_by is given,
+    for each group of jobs sharing values of those db columns (see summarize_runtimes()).
+    :param dirs: dict output of calculate_directories()
+    :param config: dict, output of load_spec()
+    :param job_list: list of job ids to consider; if None, all jobs in the db.
+    :param workers: number of threads scanning logs (see scan_job_logs())
+    :param rescan: parse all logs again, instead of only those that changed
+    :param group_by: optional list of db columns to group jobs by
+    :param export: optional path (.csv or .parquet) to write the per-group summary to (or,
+                   without group_by, the runtime of each job)
+    :return:
+    """
+    # runtime_unit = seconds
+    runtime_unit = "seconds"
+
+    runtimes = collect_runtimes(dirs, config, job_list, workers, rescan)
+    if len(runtimes) == 0:
+        print(
+            "No runtimes found for these jobs: runtimes are read from a "
+            "'runtime: <seconds>' line that run scripts print at the end of job logs."
+        )
+        return
 
     runtime_df = pd.DataFrame(
-        pd.to_timedelta(runtimes, unit=runtime_unit), columns=["runtime"]
+        pd.to_timedelta(runtimes["runtime"].values, unit=runtime_unit),
+        columns=["runtime"],
     )
     # print out descriptive stats! :)
     print(runtime_df.describe(percentiles=[0.25, 0.5, 0.75, 0.90, 0.95]))
 
+    if not group_by:
+        if export is not None:
+            export_table(runtimes.set_index("order_id"), export)
+        return
+
+    from ..db import SlurmhelperDB
+
+    db = SlurmhelperDB(dirs).load_jobs(job_list)
+    summary, per_job = summarize_runtimes(runtimes, db, group_by)
+
+    print(pretty_cli_header(f"runtimes (seconds) by {', '.join(group_by)}", "~"))
+    print(summary.to_string())
+    outliers = per_job[per_job["outlier"]]
+    if len(outliers) > 0:
+        print(f"\noutlier jobs (n = {len(outliers)}):")
+        for (key, grp) in outliers.groupby(group_by):
+            key = key if isinstance(key, tuple) else (key,)
+            print(f"{', '.join([str(k) for k in key])}:")
+            pretty_print_job_ids(
+                [
+                    f"{int(j):05d} ({int(rt)}s)"
+                    for (j, rt) in zip(grp["order_id"], grp["runtime"])
+                ]
+            )
+
+    if export is not None:
+        export_table(summary, export)
+
+
+def recommend_resources(usage, percentile=95, margin=0.1):
+    """
+    Recommend what to request for jobs like the given ones, from the resources they used: the
+    given percentile of peak memory and wall time (plus a safety margin; wall time in whole
+    minutes), and of the number of threads kept busy (CPU time / wall time, rounded up).
+    :param usage: pandas DataFrame, with columns walltime (seconds), mem_mb and threads
+    :param percentile: percentile of past usage to size requests for (0-100)
+    :param margin: safety margin, as a fraction of memory and wall time (e.g., 0.1 = 10%)
+    :return: dict with keys n, mem_mb, n_thr and walltime (sbatch notation)
+    """
+    import math
+    from datetime import timedelta
+
+    from .time import delta_to_slurm_time
+
+    q = percentile / 100
+    # in whole minutes, as sbatch takes them (a time limit of 0 is not a valid request)
+    minutes = max(1, int(math.ceil(usage["walltime"].quantile(q) * (1 + margin) / 60)))
+    return {
+        "n": len(usage),
+        "mem_mb": int(math.ceil(usage["mem_mb"].quantile(q) * (1 + margin))),
+        "n_thr": max(1, int(math.ceil(usage["threads"].quantile(q)))),
+        "walltime": delta_to_slurm_time(timedelta(minutes=minutes)),
+    }
+
+
+def check_resources(
+    dirs, config, job_list=None, percentile=95, margin=0.1, workers=None, rescan=False
+):
+    """
+    Report the resources used by jobs (as measured by their runners, see
+    ..jobs.runner.MEASURE_SHIM), and what to request for them: overall, and for each job
+    class if your spec defines job_class_columns.
+    :param dirs: dict output of calculate_directories()
+    :param config: dict, output of load_spec()
+    :param job_list: list of job ids (integers); all jobs in the db if None
+    :param percentile: percentile of past usage to size requests for (0-100)
+    :param margin: safety margin, as a fraction of memory and wall time
+    :param workers: number of threads scanning logs (see scan_job_logs())
+    :param rescan: parse all logs again, instead of only those that changed
+    :return: pandas DataFrame of recommendations, one row per job class ("all" for all jobs)
+    """
+    from ..db import SlurmhelperDB
+
+    db = SlurmhelperDB(dirs).load_jobs(job_list)
+    if job_list is None:
+        job_list = db.order_id.tolist()
+    # bring measurements up to date with the latest sidecars
+    classify_jobs(dirs, config, job_list, workers, rescan)
+
+    used = pd.DataFrame(
+        list(SlurmhelperDB(dirs).find_job_resources(job_list).values()),
+        columns=["order_id", "walltime"] + RESOURCE_KEYS,
+    )
+    if len(used) == 0:
+        print(
+            "No resource measurements found for these jobs. They are taken by wrappers "
+            "prepped with this version of slurmhelper, on nodes where python3 is available."
+        )
+        return None
+
+    used["mem_mb"] = used["max_rss_kb"] / 1024
+    used["cpu"] = used["user_cpu"] + used["sys_cpu"]
+    used["threads"] = used["cpu"] / used["walltime"].clip(lower=1)
+    used["read_mb"] = used["read_bytes"] / 1024 ** 2
+    used["write_mb"] = used["write_bytes"] / 1024 ** 2
+    shown = ["walltime", "mem_mb", "cpu", "threads", "read_mb", "write_mb"]
+
+    class_columns = [
+        c for c in (config.get("job_class_columns", None) or []) if c in db.columns
+    ]
+    groups = [("all", used)]
+    if len(class_columns) > 0:
+        merged = used.merge(db[["order_id"] + class_columns], on="order_id")
+        for (key, grp) in merged.groupby(class_columns):
+            key = key if isinstance(key, tuple) else (key,)
+            groups.append((", ".join([str(k) for k in key]), grp))
+
+    recommendations = dict()
+    for (name, grp) in groups:
+        print(pretty_cli_header(f"jobs: {name}", "~", n_cols=60))
+        print(grp[shown].describe(percentiles=[0.5, 0.9, percentile / 100]))
+        recommendations[name] = recommend_resources(grp, percentile, margin)
+
+    rv = pd.DataFrame.from_dict(recommendations, orient="index")
+    print(
+        pretty_cli_header(
+            f"recommended requests (p{percentile:g}, +{margin * 100:g}% margin)",
+            "~",
+            n_cols=60,
+        )
+    )
+    print(rv)
+    return rv
+
+
+def load_sacct_records(dirs, submissions, chunk_size=200, ttl=None):
+    """
+    Slurm accounting records of the given submissions (and of all their array elements).
+    Records of jobs in a final state are cached in the database, so sacct is only asked
+    about submissions with elements that were still pending or running when last queried.
+    :param dirs: dict output of calculate_directories()
+    :param submissions: list of submission dicts (see ..db.SlurmhelperDB.list_submissions())
+    :param chunk_size: number of Slurm job ids per sacct call
+    :param ttl: seconds a cached sacct result may be reused for (see
+                .scheduler.run_scheduler_query()); the default if None
+    :return: dict {job id (e.g., 123 or 123_4): record dict}
+    """
+    from ..db import SlurmhelperDB
+    from .misc import expand_index_ranges
+    from .scheduler import (
+        DEFAULT_CACHE_TTL,
+        TERMINAL_STATES,
+        query_sacct,
+        scheduler_cache_dir,
+    )
+
+    db = SlurmhelperDB(dirs)
+    records = db.find_sacct_records([sub["slurm_id"] for sub in submissions])
+
+    stale = []
+    for sub in submissions:
+        if sub["array"]:
+            expected = [
+                f"{sub['slurm_id']}_{i}" for i in expand_index_ranges(sub["array"])
+            ]
+        else:
+            expected = [sub["slurm_id"]]
+        if any([job_id not in records for job_id in expected]):
+            stale.append(sub["slurm_id"])
+
+    print(
+        f"Accounting records of {len(submissions) - len(stale)} slurm jobs cached, "
+        f"{len(stale)} to query."
+    )
+    if len(stale) > 0:
+        queried = query_sacct(
+            stale,
+            chunk_size,
+            scheduler_cache_dir(dirs),
+            DEFAULT_CACHE_TTL if ttl is None else ttl,
+        )
+        db.add_sacct_records(
+            [r for r in queried.values() if r["state"] in TERMINAL_STATES]
+        )
+        records.update(queried)
+
+    return records
+
+
+def check_efficiency(
+    dirs, config, sbatch_ids=None, chunk_size=200, export=None, ttl=None
+):
+    """
+    Report how efficiently submitted sbatch jobs / arrays used what they requested, from
+    Slurm accounting (sacct): core-hours requested (cpus x time limit), allocated (cpus x
+    elapsed) and used (CPU time), memory efficiency (peak RSS over requested memory) and time
+    spent waiting in the queue, per submission.
+    :param dirs: dict output of calculate_directories()
+    :param config: dict, output of load_spec()
+    :param sbatch_ids: list of sbatch_ids (int) to report on; all submissions if None
+    :param chunk_size: number of Slurm job ids per sacct call
+    :param export: optional path (.csv or .parquet) to write the report to
+    :param ttl: seconds a cached sacct result may be reused for (see load_sacct_records())
+    :return: pandas DataFrame, one row per submission
+    """
+    from ..db import SlurmhelperDB
+    from ..jobs.submit import record_chained_submissions
+
+    record_chained_submissions(dirs, config)
+    db = SlurmhelperDB(dirs)
+    submissions = db.list_submissions(sbatch_ids)
+    if len(submissions) == 0:
+        print("No submissions recorded for these sbatch_ids.")
+        return None
+
+    records = pd.DataFrame(
+        list(load_sacct_records(dirs, submissions, chunk_size, ttl).values())
+    )
+    if len(records) == 0:
+        print("sacct has no records of these submissions (yet).")
+        return None
+
+    records["core_h_requested"] = (
+        records["alloc_cpus"] * records["timelimit"].fillna(0) / 3600
+    )
+    records["core_h_allocated"] = records["cpu_time"] / 3600
+    records["core_h_used"] = records["total_cpu"].fillna(0) / 3600
+    records["mem_efficiency"] = records["max_rss_mb"] / records["req_mem_mb"]
+
+    rows = []
+    for sub in submissions:
+        grp = records[records["slurm_id"] == sub["slurm_id"]]
+        if len(grp) == 0:
+            continue
+        states = grp["state"].value_counts()
+        rows.append(
+            {
+                "sbatch_id": sub["sbatch_id"],
+                "script": sub["script"],
+                "slurm_id": sub["slurm_id"],
+                "n_jobs": len(db.find_user_jobs(sub["slurm_id"])),
+                "n_tasks": len(grp),
+                "states": ", ".join([f"{k}: {v}" for (k, v) in states.items()]),
+                "core_h_requested": grp["core_h_requested"].sum(),
+                "core_h_allocated": grp["core_h_allocated"].sum(),
+                "core_h_used": grp["core_h_used"].sum(),
+                "cpu_efficiency": grp["core_h_used"].sum()
+                / max(grp["core_h_allocated"].sum(), 1e-9),
+                "mem_efficiency_mean": grp["mem_efficiency"].mean(),
+                "mem_efficiency_max": grp["mem_efficiency"].max(),
+                "queue_wait_median": grp["queue_wait"].median(),
+                "queue_wait_max": grp["queue_wait"].max(),
+            }
+        )
+    rv = pd.DataFrame(rows).set_index("script")
+
+    print(pretty_cli_header("efficiency per submission", "~"))
+    with pd.option_context("display.float_format", "{:.2f}".format):
+        print(rv.drop(columns=["states"]).to_string())
+    print("\nstates:")
+    for (script, states) in rv["states"].items():
+        print(f"    {script}: {states}")
+    print(
+        f"\ntotal: {rv['core_h_requested'].sum():.1f} core-hours requested, "
+        f"{rv['core_h_allocated'].sum():.1f} allocated, {rv['core_h_used'].sum():.1f} used "
+        f"({rv['core_h_used'].sum() * 100 / max(rv['core_h_allocated'].sum(), 1e-9):.0f}% "
+        f"of allocated)."
+    )
+
+    if export is not None:
+        export_table(rv, export)
+    return rv
+
+
+def runtime_model_from_logs(dirs, config, percentile=95, workers=None, rescan=False):
+    """
+    Fit a runtime model (see .time:fit_runtime_model()) to all jobs completed so far in
+    this working directory. Jobs are grouped by the job_class_columns of your spec, if any.
+    :param dirs: directory dictionary, as produced by .io:compute_directories()
+    :param config: config parameter dictionary
+    :param percentile: percentile of past runtimes to use as the per-job estimate
+    :param workers: number of threads scanning logs (see scan_job_logs())
+    :param rescan: parse all logs again, instead of only those that changed
+    :return: dict, runtime model
+    """
+    from ..db import SlurmhelperDB
+    from .time import fit_runtime_model
+
+    model_cfg = config.get("duration_model", None) or dict()
+
+    # logs are only around for jobs in the db, so going by it is fine
+    db = SlurmhelperDB(dirs).load_jobs()
+    _, _, with_success = classify_jobs(
+        dirs, config, db.order_id.tolist(), workers, rescan
+    )
+    runtimes = indexed_runtimes(dirs, with_success)
+
+    return fit_runtime_model(
+        runtimes,
+        db,
+        class_columns=config.get("job_class_columns", None),
+        percentile=percentile,
+        min_samples=model_cfg.get("min_samples", 5),
+    )
+
 
 def check_runs(job_list, dirs, args, config):
     """
@@ -334,6 +1517,7 @@ def check_runs(job_list, dirs, args, config):
     :param config: config parameter dictionary
     :return:
     """
+    from ..db import SlurmhelperDB
     from ..jobs.classes import TestableJob
 
     if len(job_list) < 1:
@@ -342,16 +1526,8 @@ def check_runs(job_list, dirs, args, config):
     if args.verbose:
         print("loading database....")
 
-    # assumption, we use the database specified as a global earlier in the script
-    db_filepath = Path(dirs["base"]).joinpath("db.csv")
-    if db_filepath.exists():
-        db = pd.read_csv(db_filepath)
-    else:
-        raise (
-            FileNotFoundError,
-            "Database file db.csv is missing from your working directory!",
-        )
-    db.sort_values("order_id")  # ensure they're sorted properly
+    # the job table stored by init, in order_id order
+    db = SlurmhelperDB(dirs).load_jobs()
 
     # calculate a globbing expression to check for outputs
     sfmt_glob = config["output_path_subject_expr"].format
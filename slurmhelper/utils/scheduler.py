@@ -0,0 +1,452 @@
+"""
+Functions used to query the Slurm scheduler (and its configuration) on behalf of slurmhelper.
+Queries can go through a small on-disk cache in the working directory (see run_scheduler_query()),
+so that repeated or concurrent invocations (e.g., in watch loops) share a single call to slurmctld.
+"""
+
+import logging
+import os
+import re
+import subprocess
+import time
+
+logger = logging.getLogger("cli")
+
+# how long (in seconds) cached scheduler query results are used, unless told otherwise
+DEFAULT_CACHE_TTL = 30
+
+# cached results older than this (in seconds) are deleted
+CACHE_MAX_AGE = 24 * 3600
+
+
+def scheduler_cache_dir(dirs):
+    """
+    Directory where scheduler query results are cached (see run_scheduler_query()).
+    :param dirs: dict output of calculate_directories()
+    :return: str, path
+    """
+    return os.path.join(dirs["base"], ".scheduler_cache")
+
+
+def resolve_cache_ttl(config, args):
+    """
+    Figure out how long cached scheduler query results may be used: --cache-ttl if given,
+    else the scheduler_cache_ttl key of your spec, else DEFAULT_CACHE_TTL.
+    :param config: dict, output of load_spec()
+    :param args: parsed ArgParse object
+    :return: int, seconds (0 to not use the cache)
+    """
+    if getattr(args, "cache_ttl", None) is not None:
+        return args.cache_ttl
+    if (config or dict()).get("scheduler_cache_ttl", None) is not None:
+        return int(config["scheduler_cache_ttl"])
+    return DEFAULT_CACHE_TTL
+
+
+def run_scheduler_query(cmd, cache_dir=None, ttl=DEFAULT_CACHE_TTL):
+    """
+    Run a scheduler command (squeue, sacct, scontrol...) and return its output, reusing the
+    output of the same command if it ran less than ttl seconds ago. The cache entry is locked
+    while the command runs, so that concurrent invocations wait for it rather than querying
+    the scheduler too.
+    :param cmd: list, command and its arguments
+    :param cache_dir: directory to cache results in (see scheduler_cache_dir()); no caching
+                      if None
+    :param ttl: seconds; no caching if 0
+    :return: str, output of the command
+    """
+    if cache_dir is None or not ttl or ttl <= 0:
+        return subprocess.check_output(cmd, encoding="UTF-8")
+
+    import fcntl
+    import hashlib
+
+    os.makedirs(cache_dir, exist_ok=True)
+    key = hashlib.sha1("\0".join(cmd).encode("UTF-8")).hexdigest()[:16]
+    path = os.path.join(cache_dir, f"{os.path.basename(cmd[0])}-{key}")
+
+    with open(f"{path}.lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            age = time.time() - os.stat(path).st_mtime
+            if age < ttl:
+                logger.info(f"Using the output of {cmd[0]} from {age:.0f}s ago.")
+                with open(path, "r") as f:
+                    return f.read()
+        except FileNotFoundError:
+            pass
+
+        out = subprocess.check_output(cmd, encoding="UTF-8")
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(out)
+        os.replace(tmp, path)
+
+    prune_scheduler_cache(cache_dir)
+    return out
+
+
+def prune_scheduler_cache(cache_dir, max_age=CACHE_MAX_AGE):
+    """
+    Delete cached scheduler query results older than max_age (lock files are kept, since
+    other invocations may hold them).
+    :param cache_dir: see scheduler_cache_dir()
+    :param max_age: seconds
+    :return:
+    """
+    now = time.time()
+    with os.scandir(cache_dir) as entries:
+        for entry in entries:
+            if entry.name.endswith(".lock"):
+                continue
+            try:
+                if now - entry.stat().st_mtime > max_age:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass  # pruned by someone else
+
+
+def parse_scontrol_config(out):
+    """
+    Parse the output of `scontrol show config` into a dict.
+    :param out: str, output of scontrol show config
+    :return: dict with {parameter: value} (values are kept as strings)
+    """
+    rv = dict()
+    for line in out.splitlines():
+        m = re.match(r"^(\w+)\s+=\s+(.*)$", line.strip())
+        if m is not None:
+            rv[m.group(1)] = m.group(2).strip()
+    return rv
+
+
+def query_cluster_limits(cache_dir=None, ttl=DEFAULT_CACHE_TTL):
+    """
+    Ask the scheduler about array and submission limits. MaxArraySize is read from
+    `scontrol show config`; MaxSubmitJobs (a per-user association limit) from `sacctmgr`.
+    :param cache_dir: directory to cache query results in (see run_scheduler_query())
+    :param ttl: seconds cached query results are used for
+    :return: dict with keys max_array_size and max_submit_jobs (None where unknown)
+    """
+    limits = {"max_array_size": None, "max_submit_jobs": None}
+
+    try:
+        out = run_scheduler_query(["scontrol", "show", "config"], cache_dir, ttl)
+        cfg = parse_scontrol_config(out)
+        if cfg.get("MaxArraySize", "").isdigit():
+            limits["max_array_size"] = int(cfg["MaxArraySize"])
+    except (OSError, subprocess.CalledProcessError) as err:
+        logger.warning(f"Could not query scontrol for cluster limits: {err}")
+
+    try:
+        out = run_scheduler_query(
+            [
+                "sacctmgr",
+                "--noheader",
+                "--parsable2",
+                "show",
+                "assoc",
+                f"where user={os.environ.get('USER', '')}",
+                "format=MaxSubmit",
+            ],
+            cache_dir,
+            ttl,
+        )
+        values = [int(v) for v in out.split() if v.strip().isdigit()]
+        if len(values) > 0:
+            limits["max_submit_jobs"] = min(values)
+    except (OSError, subprocess.CalledProcessError) as err:
+        logger.warning(f"Could not query sacctmgr for submission limits: {err}")
+
+    logger.info(f"Limits reported by the scheduler: {limits}")
+    return limits
+
+
+def resolve_array_limits(config, args, cache_dir=None):
+    """
+    Figure out the array size and submission limits to respect when prepping arrays. In order
+    of precedence: --max-array-size / --max-submit-jobs, the max_array_size / max_submit_jobs
+    keys of your spec, and (if --query-limits is given) what the scheduler reports.
+    :param config: dict, output of load_spec()
+    :param args: parsed ArgParse object
+    :param cache_dir: directory to cache scheduler query results in (see
+                      run_scheduler_query())
+    :return: dict with keys max_array_size and max_submit_jobs (None if unlimited)
+    """
+    limits = {"max_array_size": None, "max_submit_jobs": None}
+
+    if args.query_limits:
+        limits.update(
+            query_cluster_limits(cache_dir, resolve_cache_ttl(config, args))
+        )
+
+    for key in limits.keys():
+        if config.get(key, None) is not None:
+            limits[key] = int(config[key])
+        if getattr(args, key) is not None:
+            limits[key] = getattr(args, key)
+
+    return limits
+
+
+def array_part_capacity(limits, start_index=100, chained=False):
+    """
+    Maximum number of elements a single array may have under the given limits.
+    Array task ids must stay below MaxArraySize; and, if parts are chained, one part may be
+    pending while the previous one runs, so each part can only use half of MaxSubmitJobs.
+    :param limits: dict, output of resolve_array_limits()
+    :param start_index: index of the first array element
+    :param chained: whether parts of an array family are chained with dependencies
+    :return: int, or None if unlimited
+    """
+    caps = []
+    if limits["max_array_size"] is not None:
+        caps.append(limits["max_array_size"] - start_index)
+    if limits["max_submit_jobs"] is not None:
+        caps.append(
+            limits["max_submit_jobs"] // 2 if chained else limits["max_submit_jobs"]
+        )
+
+    if len(caps) == 0:
+        return None
+
+    cap = min(caps)
+    if cap < 1:
+        raise ValueError(
+            f"The array limits given ({limits}) leave no room for array elements "
+            f"numbered from {start_index}."
+        )
+    return cap
+
+
+# states after which a job's accounting record no longer changes
+TERMINAL_STATES = {
+    "BOOT_FAIL",
+    "CANCELLED",
+    "COMPLETED",
+    "DEADLINE",
+    "FAILED",
+    "NODE_FAIL",
+    "OUT_OF_MEMORY",
+    "PREEMPTED",
+    "TIMEOUT",
+}
+
+# fields queried from sacct (in this order)
+SACCT_FIELDS = [
+    "JobID",
+    "JobName",
+    "State",
+    "Submit",
+    "Start",
+    "End",
+    "ElapsedRaw",
+    "TimelimitRaw",
+    "AllocCPUS",
+    "TotalCPU",
+    "CPUTimeRAW",
+    "ReqMem",
+    "MaxRSS",
+    "ExitCode",
+]
+
+MEMORY_UNITS = {"K": 1 / 1024, "M": 1, "G": 1024, "T": 1024 ** 2}
+
+
+def parse_slurm_memory(value, alloc_cpus=1):
+    """
+    Parse a memory amount as reported by sacct (e.g., 16000M, 4Gc, 123456K) into megabytes.
+    Per-cpu amounts (suffix c, from older versions of Slurm) are multiplied by alloc_cpus.
+    :param value: str
+    :param alloc_cpus: number of cpus allocated
+    :return: float, megabytes; None if empty
+    """
+    m = re.match(r"^([\d.]+)([KMGT]?)([cn]?)$", str(value).strip())
+    if m is None:
+        return None
+    mb = float(m.group(1)) * MEMORY_UNITS[m.group(2) or "M"]
+    if m.group(3) == "c":
+        mb *= max(1, int(alloc_cpus))
+    return mb
+
+
+def parse_sacct_duration(value):
+    """
+    Parse a duration as reported by sacct's TotalCPU ([DD-][HH:]MM:SS[.mmm]) into seconds.
+    :param value: str
+    :return: float, seconds; None if empty
+    """
+    from .time import slurm_time_to_seconds
+
+    value = str(value).strip()
+    if value == "":
+        return None
+    whole, _, fraction = value.partition(".")
+    if whole.count(":") == 1 and "-" not in whole:
+        whole = "0:" + whole  # MM:SS, which sbatch would read as minutes:seconds too
+    return slurm_time_to_seconds(whole) + float("0." + (fraction or "0"))
+
+
+def parse_sacct_time(value):
+    """
+    Parse a timestamp as reported by sacct (e.g., 2022-03-01T10:00:00).
+    :param value: str
+    :return: datetime, or None if unknown (e.g., jobs that did not start)
+    """
+    from datetime import datetime
+
+    try:
+        return datetime.fromisoformat(str(value).strip())
+    except ValueError:
+        return None
+
+
+def parse_sacct_output(out):
+    """
+    Parse the output of `sacct --parsable2 --noheader --format=<SACCT_FIELDS>` into one
+    record per job (or array element). The peak memory of a job is the largest of its steps'.
+    Array elements not yet broken out of their array (e.g., 123_[5-10]) are left out.
+    :param out: str, output of sacct
+    :return: dict {job id (e.g., 123 or 123_4): record dict}
+    """
+    records = dict()
+    steps = []
+    for line in out.splitlines():
+        fields = line.split("|")
+        if len(fields) != len(SACCT_FIELDS):
+            continue
+        row = dict(zip(SACCT_FIELDS, fields))
+        job_id, dot, _ = row["JobID"].partition(".")
+        if dot:
+            steps.append((job_id, row))
+            continue
+        m = re.match(r"^(\d+)(?:_(\d+))?$", job_id)
+        if m is None:
+            continue
+        alloc_cpus = int(row["AllocCPUS"] or 0)
+        submit = parse_sacct_time(row["Submit"])
+        start = parse_sacct_time(row["Start"])
+        records[job_id] = {
+            "job_id": job_id,
+            "slurm_id": m.group(1),
+            "array_index": int(m.group(2)) if m.group(2) is not None else None,
+            "name": row["JobName"],
+            # e.g., "CANCELLED by 123", or "CANCELLED+" if sacct truncated it
+            "state": row["State"].split(" ")[0].rstrip("+"),
+            "submit": row["Submit"],
+            "start": row["Start"],
+            "end": row["End"],
+            "queue_wait": (start - submit).total_seconds()
+            if submit is not None and start is not None
+            else None,
+            "elapsed": int(row["ElapsedRaw"] or 0),
+            "timelimit": int(row["TimelimitRaw"]) * 60
+            if row["TimelimitRaw"].isdigit()
+            else None,
+            "alloc_cpus": alloc_cpus,
+            "total_cpu": parse_sacct_duration(row["TotalCPU"]),
+            "cpu_time": int(row["CPUTimeRAW"] or 0),
+            "req_mem_mb": parse_slurm_memory(row["ReqMem"], alloc_cpus),
+            "max_rss_mb": parse_slurm_memory(row["MaxRSS"]),
+            "exit_code": row["ExitCode"],
+        }
+
+    for (job_id, row) in steps:
+        rss = parse_slurm_memory(row["MaxRSS"])
+        if job_id in records and rss is not None:
+            records[job_id]["max_rss_mb"] = max(records[job_id]["max_rss_mb"] or 0, rss)
+
+    return records
+
+
+def query_sacct(slurm_ids, chunk_size=200, cache_dir=None, ttl=DEFAULT_CACHE_TTL):
+    """
+    Ask Slurm accounting about the given jobs (all elements of arrays included), a chunk of
+    job ids at a time so that command lines stay short.
+    :param slurm_ids: list of Slurm job ids
+    :param chunk_size: number of job ids per sacct call
+    :param cache_dir: directory to cache query results in (see run_scheduler_query())
+    :param ttl: seconds cached query results are used for
+    :return: dict {job id (e.g., 123 or 123_4): record dict} (see parse_sacct_output())
+    """
+    slurm_ids = [str(s) for s in slurm_ids]
+    records = dict()
+    for i in range(0, len(slurm_ids), chunk_size):
+        chunk = slurm_ids[i : i + chunk_size]
+        out = run_scheduler_query(
+            [
+                "sacct",
+                "--parsable2",
+                "--noheader",
+                f"--format={','.join(SACCT_FIELDS)}",
+                f"--jobs={','.join(chunk)}",
+            ],
+            cache_dir,
+            ttl,
+        )
+        records.update(parse_sacct_output(out))
+        logger.info(f"Queried sacct for {len(chunk)} slurm jobs.")
+    return records
+
+
+# fields queried from squeue: job id (e.g., 123_4 or 123_[5-10]), array job id, array task
+# id(s), state, reason, time used, time left, cpus and name (last, in case it holds a "|")
+SQUEUE_FORMAT = "%i|%F|%K|%T|%r|%M|%L|%C|%j"
+
+
+def parse_squeue_output(out):
+    """
+    Parse the output of `squeue --noheader --format=<SQUEUE_FORMAT>`.
+    :param out: str, output of squeue
+    :return: list of dicts with keys job_id, slurm_id (the array job id for array elements),
+             array_tasks (list of array indices, None if not an array), state, reason,
+             time_used, time_left, cpus and name. Pending elements of an array may be
+             listed together, as a single row with several array_tasks.
+    """
+    from .misc import expand_index_ranges
+
+    rows = []
+    for line in out.splitlines():
+        fields = line.strip().split("|", SQUEUE_FORMAT.count("|"))
+        if len(fields) != SQUEUE_FORMAT.count("|") + 1:
+            continue
+        job_id, slurm_id, tasks, state, reason, used, left, cpus, name = fields
+        tasks = tasks.strip("[]")
+        rows.append(
+            {
+                "job_id": job_id,
+                "slurm_id": slurm_id,
+                "array_tasks": expand_index_ranges(tasks)
+                if re.match(r"^\d", tasks)
+                else None,
+                "state": state,
+                "reason": reason,
+                "time_used": used,
+                "time_left": left,
+                "cpus": int(cpus) if cpus.isdigit() else None,
+                "name": name,
+            }
+        )
+    return rows
+
+
+def query_squeue(user=None, cache_dir=None, ttl=DEFAULT_CACHE_TTL):
+    """
+    List a user's jobs in the queue.
+    :param user: user name (default: $USER)
+    :param cache_dir: directory to cache query results in (see run_scheduler_query())
+    :param ttl: seconds cached query results are used for
+    :return: list of dicts (see parse_squeue_output())
+    """
+    out = run_scheduler_query(
+        [
+            "squeue",
+            "--noheader",
+            "-u",
+            user or os.environ.get("USER", ""),
+            f"--format={SQUEUE_FORMAT}",
+        ],
+        cache_dir,
+        ttl,
+    )
+    return parse_squeue_output(out)
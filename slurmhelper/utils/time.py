@@ -2,8 +2,11 @@
 Various functions to optimize sbatch arrays given time constraints & prior knowledge of what to expect.
 """
 
+import logging
 import math
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
+
+logger = logging.getLogger("cli")
 
 
 def get_latest_date(list_iso_dates):
@@ -49,26 +52,168 @@ def delta_to_slurm_time(tdelta):
     return as_string
 
 
-def calculate_wall_time(n_jobs, config):
+def slurm_time_to_seconds(slurm_time):
+    """
+    Parse sbatch-compatible time notation into seconds. Accepts all formats sbatch does:
+    minutes, minutes:seconds, hours:minutes:seconds, days-hours, days-hours:minutes and
+    days-hours:minutes:seconds.
+    :param slurm_time: str, e.g. as produced by delta_to_slurm_time()
+    :return: int, seconds
+    """
+    slurm_time = str(slurm_time).strip()
+    if "-" in slurm_time:
+        days, rest = slurm_time.split("-")
+        fields = [int(x) for x in rest.split(":")]
+        fields += [0] * (3 - len(fields))  # days-hours[:minutes[:seconds]]
+        hours, minutes, seconds = fields
+        hours += int(days) * 24
+    else:
+        fields = [int(x) for x in slurm_time.split(":")]
+        if len(fields) == 3:
+            hours, minutes, seconds = fields
+        else:  # minutes[:seconds]
+            hours = 0
+            minutes, seconds = (fields + [0])[:2]
+    return (hours * 60 + minutes) * 60 + seconds
+
+
+def calculate_wall_time(n_jobs, config, concurrency=1):
     """
     Function to calculate the total time for a long job script. This will operate from certain assumptions about
     time to "ramp up" and load modules, etc., and time consumed per job.
     :param n_jobs: number of jobs in script being prepped
+    :param concurrency: number of jobs run at once within the script (default: 1, i.e., serially)
     :return: wall time, formatted as string
     """
-
-    wall_time = config["job_ramp_up_time"] + n_jobs * config["job_time"]
+    n_serial = math.ceil(n_jobs / max(1, concurrency))
+    wall_time = config["job_ramp_up_time"] + n_serial * config["job_time"]
     return delta_to_slurm_time(wall_time)
 
 
-def calculate_min_number_of_parcels(n_jobs, config):
+def calculate_min_number_of_parcels(n_jobs, config, concurrency=1):
     """
     Estimate the minimum number of parcels necessary such that the time per parcel would not
     exceed the maximum time per job recommended by the team
     :param n_jobs: number of total jobs to be submitted by you greedy user
+    :param concurrency: number of jobs run at once within each parcel (default: 1)
     :return: minimum number of array parcels to divide things into
     """
     # assumption: divide ids in equal numbers of packets, such that no list is longer than 23 hours
     max_job_time_secs = config["max_job_time"].total_seconds()
-    total_time = n_jobs * config["job_time"].total_seconds()
+    total_time = n_jobs * config["job_time"].total_seconds() / max(1, concurrency)
     return math.ceil(total_time / max_job_time_secs)
+
+
+def calculate_min_number_of_parcels_from_estimates(
+    job_times, config, concurrency=1, margin=0.1
+):
+    """
+    Like calculate_min_number_of_parcels(), but from per-job runtime estimates (see
+    estimate_job_times()): the fewest parcels, as divvied up by split_list(), whose estimated
+    wall times (see estimate_wall_time()) all fit within max_job_time.
+    :param job_times: list of timedeltas, one per job, in the order jobs are parcelled out
+    :param config: dict, the spec (for max_job_time and job_ramp_up_time)
+    :param concurrency: number of jobs run at once within each parcel
+    :param margin: safety margin, as a fraction of the estimate (e.g., 0.1 = 10%)
+    :return: minimum number of array parcels to divide things into; one per job if some
+             jobs do not fit within max_job_time on their own
+    """
+    from .misc import split_list
+
+    max_job_time_secs = config["max_job_time"].total_seconds()
+
+    def fits(parcel):
+        wall_time = estimate_wall_time(parcel, config, concurrency, margin)
+        return slurm_time_to_seconds(wall_time) <= max_job_time_secs
+
+    if not fits([max(job_times)]):
+        return len(job_times)
+
+    total_time = sum([t.total_seconds() for t in job_times]) * (1 + margin)
+    n_parcels = max(1, math.ceil(total_time / max(1, concurrency) / max_job_time_secs))
+    while n_parcels < len(job_times) and not all(
+        [fits(p) for p in split_list(job_times, wanted_parts=n_parcels)]
+    ):
+        n_parcels += 1
+    return min(n_parcels, len(job_times))
+
+
+def fit_runtime_model(runtimes, db, class_columns=None, percentile=95, min_samples=5):
+    """
+    Build a simple runtime model from the runtimes of completed jobs: a given percentile of past
+    runtimes, overall and (if class columns are given) for each job class, i.e. each combination
+    of values of those db columns (e.g., task).
+    :param runtimes: pandas DataFrame with columns order_id, runtime (seconds)
+    :param db: pandas DataFrame, the job database (db.csv)
+    :param class_columns: list of db columns defining job classes, or None
+    :param percentile: percentile of past runtimes to use as the per-job estimate (0-100)
+    :param min_samples: minimum number of completed jobs needed to trust an estimate
+    :return: dict with keys columns (list), overall (timedelta or None), classes (dict mapping
+             class values to timedeltas), and n (number of runtimes used)
+    """
+    class_columns = [c for c in (class_columns or []) if c in db.columns]
+    model = {"columns": class_columns, "overall": None, "classes": dict(), "n": 0}
+
+    if runtimes is None or len(runtimes) == 0:
+        return model
+
+    model["n"] = len(runtimes)
+    q = percentile / 100
+
+    if len(runtimes) >= min_samples:
+        model["overall"] = timedelta(seconds=float(runtimes["runtime"].quantile(q)))
+
+    if len(class_columns) > 0:
+        merged = runtimes.merge(db[["order_id"] + class_columns], on="order_id")
+        for (key, grp) in merged.groupby(class_columns):
+            if len(grp) >= min_samples:
+                key = key if isinstance(key, tuple) else (key,)
+                model["classes"][key] = timedelta(
+                    seconds=float(grp["runtime"].quantile(q))
+                )
+
+    return model
+
+
+def estimate_job_times(model, db, job_list):
+    """
+    Per-job runtime estimates from a runtime model (see fit_runtime_model()). Jobs whose class
+    does not have enough history get the overall estimate.
+    :param model: dict, output of fit_runtime_model()
+    :param db: pandas DataFrame, the job database (db.csv)
+    :param job_list: list of job ids (integers)
+    :return: dict mapping job id to timedelta; None if the model has no usable estimate
+    """
+    if model["overall"] is None and len(model["classes"]) == 0:
+        return None
+
+    rows = db[db.order_id.isin(job_list)]
+    rv = dict()
+    for row in rows.to_dict(orient="records"):
+        key = tuple([row[c] for c in model["columns"]])
+        est = model["classes"].get(key, model["overall"])
+        if est is None:  # no class history, and not enough history overall
+            return None
+        rv[int(row["order_id"])] = est
+    return rv
+
+
+def estimate_wall_time(job_times, config, concurrency=1, margin=0.1):
+    """
+    Wall time for a script running the given jobs, from per-job runtime estimates (see
+    estimate_job_times()). With concurrency K, this uses the list-scheduling bound
+    sum / K + (1 - 1/K) * max, which is just the sum when jobs run serially.
+    :param job_times: list of timedeltas, one per job
+    :param config: dict, the spec (for job_ramp_up_time)
+    :param concurrency: number of jobs run at once within the script
+    :param margin: safety margin, as a fraction of the estimate (e.g., 0.1 = 10%)
+    :return: wall time, formatted as string
+    """
+    k = max(1, concurrency)
+    total = sum([t.total_seconds() for t in job_times])
+    longest = max([t.total_seconds() for t in job_times])
+    secs = (total / k + (1 - 1 / k) * longest) * (1 + margin)
+    wall_time = config.get("job_ramp_up_time", timedelta(0)) + timedelta(
+        seconds=math.ceil(secs)
+    )
+    return delta_to_slurm_time(wall_time)
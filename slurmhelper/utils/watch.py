@@ -0,0 +1,212 @@
+"""
+Watching directories for changed files, to follow a campaign as its jobs run (see
+.reporting.watch_completion()). Linux inotify is used through ctypes where available; elsewhere,
+directories are polled for changes in file modification time and size. inotify only sees changes
+made on the machine watching, so directories on network / parallel filesystems (where jobs write
+from compute nodes) are polled too.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import time
+
+logger = logging.getLogger("cli")
+
+# inotify event masks (see inotify(7))
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+# filesystems on which other machines' writes do not raise inotify events
+NETWORK_FILESYSTEMS = {
+    "afs",
+    "beegfs",
+    "ceph",
+    "cifs",
+    "fuse.sshfs",
+    "gpfs",
+    "lustre",
+    "nfs",
+    "nfs4",
+    "panfs",
+    "smb3",
+    "wekafs",
+}
+
+# struct inotify_event: int wd; uint32_t mask, cookie, len; char name[len]
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class InotifyWatcher:
+    """
+    Reports files created or changed in a set of directories, using inotify.
+    """
+
+    def __init__(self, paths):
+        """
+        :param paths: list of directories to watch
+        """
+        libc = ctypes.CDLL(
+            ctypes.util.find_library("c") or "libc.so.6", use_errno=True
+        )
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available on this system")
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self.paths = list(paths)
+        self._watches = dict()
+        for path in self.paths:
+            wd = libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                os.close(self._fd)
+                raise OSError(err, f"Cannot watch {path} with inotify")
+            self._watches[wd] = path
+
+    def changes(self, timeout):
+        """
+        Wait up to timeout seconds for files to change, then collect all changes reported
+        by then. Returns once the timeout is up, even if events are still coming in.
+        :param timeout: seconds
+        :return: set of (directory, file name) tuples; None if events were lost (the
+                 kernel's event queue overflowed), in which case everything may have changed
+        """
+        changed = set()
+        deadline = time.time() + timeout
+        while True:
+            ready, _, _ = select.select(
+                [self._fd], [], [], max(0, deadline - time.time())
+            )
+            if not ready:
+                return changed
+            try:
+                buf = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            offset = 0
+            while offset < len(buf):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(buf, offset)
+                offset += EVENT_HEADER.size
+                name = buf[offset : offset + length].rstrip(b"\0")
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    return None
+                if wd in self._watches and name:
+                    changed.add((self._watches[wd], os.fsdecode(name)))
+            # logs being written to keep events coming: do not wait for them to stop
+            if time.time() >= deadline:
+                return changed
+
+    def close(self):
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """
+    Reports files created or changed in a set of directories, by comparing the modification
+    time and size of their files from one call to the next. Every call lists the directories,
+    but no file is opened.
+    """
+
+    def __init__(self, paths):
+        """
+        :param paths: list of directories to watch
+        """
+        self.paths = list(paths)
+        self._seen = {path: self._scan(path) for path in self.paths}
+
+    @staticmethod
+    def _scan(path):
+        stats = dict()
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue  # removed meanwhile (e.g., temporary files)
+                stats[entry.name] = (st.st_mtime_ns, st.st_size)
+        return stats
+
+    def changes(self, timeout):
+        """
+        Wait timeout seconds, then list files that changed since the previous call.
+        :param timeout: seconds
+        :return: set of (directory, file name) tuples
+        """
+        time.sleep(timeout)
+        changed = set()
+        for path in self.paths:
+            stats = self._scan(path)
+            previous = self._seen[path]
+            changed.update(
+                [
+                    (path, name)
+                    for (name, st) in stats.items()
+                    if previous.get(name, None) != st
+                ]
+            )
+            self._seen[path] = stats
+        return changed
+
+    def close(self):
+        pass
+
+
+def filesystem_type(path):
+    """
+    Type of the filesystem a path is on, from the mount table (Linux only).
+    :param path: str
+    :return: str (e.g., ext4, nfs4, lustre), or None if unknown
+    """
+    path = os.path.realpath(path)
+    best, fs_type = "", None
+    try:
+        with open("/proc/self/mounts", "r") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mount_point = fields[1].replace("\\040", " ")
+                if (
+                    path == mount_point
+                    or path.startswith(mount_point.rstrip("/") + "/")
+                ) and len(mount_point) > len(best):
+                    best, fs_type = mount_point, fields[2]
+    except OSError:
+        return None
+    return fs_type
+
+
+def watch_directories(paths, poll=False):
+    """
+    Get a watcher for the given directories: inotify-based if possible, polling if asked to,
+    if inotify is not available, or if any directory is on a network filesystem.
+    :param paths: list of directories to watch
+    :param poll: whether to poll, even if inotify is available
+    :return: InotifyWatcher or PollingWatcher
+    """
+    remote = [p for p in paths if filesystem_type(p) in NETWORK_FILESYSTEMS]
+    if not poll and len(remote) > 0:
+        logger.warning(
+            f"{remote[0]} is on a {filesystem_type(remote[0])} filesystem, where inotify "
+            f"does not see what compute nodes write; polling for changes instead."
+        )
+        poll = True
+    if not poll:
+        try:
+            return InotifyWatcher(paths)
+        except (OSError, AttributeError) as err:
+            logger.warning(f"Cannot use inotify ({err}); polling for changes instead.")
+    return PollingWatcher(paths)
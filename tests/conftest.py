@@ -0,0 +1,35 @@
+import os
+import stat
+
+import pytest
+
+from slurmhelper.utils.io import calculate_directories, initialize_directories
+
+
+@pytest.fixture
+def fake_bin(tmp_path, monkeypatch):
+    """
+    Directory put first on PATH, to hold stand-ins for slurm commands. Returns a function
+    writing a stand-in (a bash script body) for a given command.
+    """
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}")
+
+    def write(name, body):
+        path = bin_dir / name
+        path.write_text("#!/bin/bash\n" + body)
+        path.chmod(path.stat().st_mode | stat.S_IXUSR)
+        return path
+
+    return write
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    """
+    An initialized working directory.
+    """
+    dirs = calculate_directories(str(tmp_path), "wd")
+    initialize_directories(dirs)
+    return dirs
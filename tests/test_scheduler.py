@@ -0,0 +1,97 @@
+from slurmhelper.utils import reporting, scheduler
+
+# sacct --parsable2 --noheader --format=<SACCT_FIELDS> for a serial job with its steps, an
+# array of two elements (one cancelled, with a truncated state) and a not yet broken out rest
+SACCT_OUTPUT = """\
+100|job_a|COMPLETED|2022-03-01T10:00:00|2022-03-01T10:05:00|2022-03-01T11:05:00|3600|120|4|03:20:00|14400|16000M||0:0
+100.batch|batch|COMPLETED|2022-03-01T10:05:00|2022-03-01T10:05:00|2022-03-01T11:05:00|3600||4|03:20:00|14400||9000M|0:0
+100.extern|extern|COMPLETED|2022-03-01T10:05:00|2022-03-01T10:05:00|2022-03-01T11:05:00|3600||4|00:00.010|14400||12000K|0:0
+200_1|job_b|CANCELLED by 123|2022-03-01T10:00:00|2022-03-01T10:00:30|2022-03-01T10:10:30|600|60|2|05:00|1200|2Gc||0:15
+200_1.batch|batch|CANCELLED|2022-03-01T10:00:30|2022-03-01T10:00:30|2022-03-01T10:10:30|600||2|05:00|1200||1.5G|0:15
+200_2|job_b|CANCELLED+|2022-03-01T10:00:00|Unknown|2022-03-01T10:01:00|0|60|2|00:00|0|2Gc||0:0
+200_[3-5]|job_b|PENDING|2022-03-01T10:00:00|Unknown|Unknown|0|60|2|00:00|0|2Gc||0:0
+"""
+
+# Stand-in for sacct: logs its arguments to sacct.calls, and prints the lines of sacct.out
+# of the jobs asked about
+SACCT = """
+here=$(dirname "$0")
+echo "$*" >> "$here/sacct.calls"
+for arg in "$@"; do
+    case "$arg" in
+        --jobs=*)
+            for id in $(echo "${arg#--jobs=}" | tr , ' '); do
+                grep -E "^${id}([._]|\\|)" "$here/sacct.out"
+            done;;
+    esac
+done
+exit 0
+"""
+
+
+def test_parse_steps_and_states():
+    records = scheduler.parse_sacct_output(SACCT_OUTPUT)
+    assert sorted(records.keys()) == ["100", "200_1", "200_2"]
+
+    job = records["100"]
+    assert job["state"] == "COMPLETED"
+    assert job["queue_wait"] == 300
+    assert job["timelimit"] == 7200
+    assert job["total_cpu"] == 12000
+    # the largest of the steps'
+    assert job["max_rss_mb"] == 9000
+
+    element = records["200_1"]
+    assert (element["slurm_id"], element["array_index"]) == ("200", 1)
+    assert element["state"] == "CANCELLED"
+    assert element["req_mem_mb"] == 4096
+    assert element["max_rss_mb"] == 1536
+
+    element = records["200_2"]
+    assert element["state"] == "CANCELLED"
+    assert element["queue_wait"] is None
+    assert element["max_rss_mb"] is None
+
+
+def sacct_calls(bin_dir):
+    calls = bin_dir / "sacct.calls"
+    return calls.read_text().splitlines() if calls.exists() else []
+
+
+def test_long_id_lists_are_chunked(fake_bin):
+    bin_dir = fake_bin("sacct", SACCT).parent
+    (bin_dir / "sacct.out").write_text(SACCT_OUTPUT)
+
+    slurm_ids = [100, 200] + list(range(300, 305))
+    records = scheduler.query_sacct(slurm_ids, chunk_size=3)
+    assert sorted(records.keys()) == ["100", "200_1", "200_2"]
+
+    calls = sacct_calls(bin_dir)
+    assert len(calls) == 3
+    jobs = [arg for call in calls for arg in call.split() if arg.startswith("--jobs=")]
+    assert jobs == ["--jobs=100,200,300", "--jobs=301,302,303", "--jobs=304"]
+
+
+def test_terminal_records_are_served_from_the_database(fake_bin, dirs):
+    bin_dir = fake_bin("sacct", SACCT).parent
+    (bin_dir / "sacct.out").write_text(SACCT_OUTPUT)
+    submissions = [
+        {"slurm_id": "100", "array": None},
+        {"slurm_id": "200", "array": "1-2"},
+    ]
+
+    records = reporting.load_sacct_records(dirs, submissions, ttl=0)
+    assert sorted(records.keys()) == ["100", "200_1", "200_2"]
+    assert len(sacct_calls(bin_dir)) == 1
+
+    # every element is in a final state, so sacct is not asked again
+    cached = reporting.load_sacct_records(dirs, submissions, ttl=0)
+    assert cached == records
+    assert len(sacct_calls(bin_dir)) == 1
+
+    # an element that was not in sacct's output is asked about again
+    submissions[1]["array"] = "1-3"
+    reporting.load_sacct_records(dirs, submissions, ttl=0)
+    calls = sacct_calls(bin_dir)
+    assert len(calls) == 2
+    assert "--jobs=200" in calls[1].split()
@@ -0,0 +1,206 @@
+import os
+import subprocess
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from slurmhelper.db import SlurmhelperDB
+from slurmhelper.jobs import submit
+from slurmhelper.jobs.cli_helpers import build_chain_call
+
+# Stand-in for sbatch: logs its arguments to sbatch.calls, fails with a transient error
+# as many times as sbatch.failures says (recording the job in the queue anyway if
+# sbatch.accept exists, as slurmctld may do when the reply times out), fails for good with
+# the contents of sbatch.error if it exists, and otherwise prints a --parsable job id.
+SBATCH = """
+here=$(dirname "$0")
+echo "$*" >> "$here/sbatch.calls"
+n=$(wc -l < "$here/sbatch.calls")
+if [ -e "$here/sbatch.error" ]; then
+    cat "$here/sbatch.error" >&2
+    exit 1
+fi
+if [ -s "$here/sbatch.failures" ] && [ "$(cat "$here/sbatch.failures")" -gt 0 ]; then
+    echo $(( $(cat "$here/sbatch.failures") - 1 )) > "$here/sbatch.failures"
+    if [ -e "$here/sbatch.accept" ]; then
+        for arg in "$@"; do
+            case "$arg" in --comment=*) echo "$((1000 + n))|${arg#--comment=}" >> "$here/queue";; esac
+        done
+    fi
+    echo "sbatch: error: Batch job submission failed: Socket timed out on send/recv operation" >&2
+    exit 1
+fi
+echo "$((1000 + n));cluster"
+"""
+
+# Stand-in for squeue -o "%i|%k": lists what the sbatch stand-in queued
+SQUEUE = """
+cat "$(dirname "$0")/queue" 2> /dev/null
+exit 0
+"""
+
+
+@pytest.fixture
+def sbatch(fake_bin, monkeypatch):
+    """
+    Put stand-ins for sbatch and squeue on PATH, and record retry delays instead of
+    sleeping. Returns the directory they live in, and the list of delays.
+    """
+    path = fake_bin("sbatch", SBATCH)
+    fake_bin("squeue", SQUEUE)
+    delays = []
+    monkeypatch.setattr(
+        submit, "time", SimpleNamespace(sleep=delays.append, monotonic=time.monotonic)
+    )
+    return path.parent, delays
+
+
+def sbatch_calls(bin_dir):
+    calls = bin_dir / "sbatch.calls"
+    return calls.read_text().splitlines() if calls.exists() else []
+
+
+def test_parsable_job_id(sbatch, tmp_path):
+    bin_dir, delays = sbatch
+    slurm_id = submit.run_sbatch("job.sh", tmp_path, ["--array=3,17"], token="tok")
+    assert slurm_id == "1001"
+    assert sbatch_calls(bin_dir) == ["--parsable --comment=tok --array=3,17 job.sh"]
+    assert delays == []
+
+
+def test_transient_failures_are_retried_with_backoff(sbatch, tmp_path):
+    bin_dir, delays = sbatch
+    (bin_dir / "sbatch.failures").write_text("3")
+    slurm_id = submit.run_sbatch(
+        "job.sh", tmp_path, token="tok", retries=5, backoff=2.0
+    )
+    assert slurm_id == "1004"
+    assert len(sbatch_calls(bin_dir)) == 4
+    # exponential backoff, with up to 25% jitter
+    assert len(delays) == 3
+    for (delay, base) in zip(delays, [2.0, 4.0, 8.0]):
+        assert base <= delay <= base * 1.25
+
+
+def test_retries_run_out(sbatch, tmp_path):
+    bin_dir, delays = sbatch
+    (bin_dir / "sbatch.failures").write_text("10")
+    with pytest.raises(RuntimeError, match="after 3 attempts"):
+        submit.run_sbatch("job.sh", tmp_path, retries=2, backoff=1.0)
+    assert len(sbatch_calls(bin_dir)) == 3
+
+
+def test_invalid_requests_are_not_retried(sbatch, tmp_path):
+    bin_dir, delays = sbatch
+    (bin_dir / "sbatch.error").write_text("sbatch: error: Invalid qos specification\n")
+    with pytest.raises(RuntimeError, match="Invalid qos"):
+        submit.run_sbatch("job.sh", tmp_path, ["--qos=bad"], retries=5)
+    assert len(sbatch_calls(bin_dir)) == 1
+    assert delays == []
+
+
+def test_ambiguous_failure_recovered_from_token(sbatch, tmp_path):
+    bin_dir, delays = sbatch
+    # the reply times out, but the job was queued anyway
+    (bin_dir / "sbatch.failures").write_text("1")
+    (bin_dir / "sbatch.accept").touch()
+    slurm_id = submit.run_sbatch("job.sh", tmp_path, token="slurmhelper:sb-0001:abc")
+    assert slurm_id == "1001"
+    # found in the queue from its --comment, so not submitted a second time
+    assert len(sbatch_calls(bin_dir)) == 1
+    assert len(delays) == 1
+
+
+def test_token_of_another_submission_is_ignored(sbatch, tmp_path):
+    bin_dir, delays = sbatch
+    (bin_dir / "queue").write_text("999_3|slurmhelper:sb-0002:def\n")
+    (bin_dir / "sbatch.failures").write_text("1")
+    slurm_id = submit.run_sbatch("job.sh", tmp_path, token="slurmhelper:sb-0001:abc")
+    assert slurm_id == "1002"
+    assert len(sbatch_calls(bin_dir)) == 2
+
+
+def write_script(dirs, name, jobs):
+    script = f"#!/bin/bash\n_sh_jobs=({' '.join([str(j) for j in jobs])})\n"
+    with open(f"{dirs['slurm_scripts']}/{name}.sh", "w") as f:
+        f.write(script)
+
+
+def test_submissions_are_idempotent_unless_forced(sbatch, dirs):
+    bin_dir, delays = sbatch
+    write_script(dirs, "sb-0001", [1, 2, 3])
+
+    first = submit.submit_sbatch_script(1, "sb-0001", dirs)
+    assert first == "1001"
+    assert submit.submit_sbatch_script(1, "sb-0001", dirs) is None
+    assert len(sbatch_calls(bin_dir)) == 1
+
+    # other sbatch arguments make another submission
+    assert submit.submit_sbatch_script(1, "sb-0001", dirs, ["--qos=x"]) == "1002"
+
+    forced = submit.submit_sbatch_script(1, "sb-0001", dirs, force=True)
+    assert forced == "1003"
+    assert len(sbatch_calls(bin_dir)) == 3
+
+    db = SlurmhelperDB(dirs)
+    assert [s["slurm_id"] for s in db.find_submissions("sb-0001")] == ["1001", "1003"]
+    assert db.find_user_jobs("1003") == [1, 2, 3]
+    # most recent first
+    assert [r["slurm_id"] for r in db.find_slurm_jobs(2)] == ["1003", "1002", "1001"]
+
+
+def test_scripts_prepped_again_are_submitted(sbatch, dirs):
+    bin_dir, delays = sbatch
+    write_script(dirs, "sb-0001", [1, 2, 3])
+    assert submit.submit_sbatch_script(1, "sb-0001", dirs) == "1001"
+
+    # the same script, written again
+    write_script(dirs, "sb-0001", [1, 2, 3])
+    assert submit.submit_sbatch_script(1, "sb-0001", dirs) is None
+
+    # other jobs prepped under the same sbatch_id
+    write_script(dirs, "sb-0001", [4, 5])
+    assert submit.submit_sbatch_script(1, "sb-0001", dirs) == "1002"
+    assert submit.submit_sbatch_script(1, "sb-0001", dirs) is None
+    assert len(sbatch_calls(bin_dir)) == 2
+    assert SlurmhelperDB(dirs).find_user_jobs("1002") == [4, 5]
+
+
+def test_campaign_skips_what_was_submitted(sbatch, dirs):
+    bin_dir, delays = sbatch
+    for id in [1, 2, 3]:
+        write_script(dirs, f"sb-{id:04d}", [id])
+    submit.submit_sbatch_script(2, "sb-0002", dirs)
+
+    rv = submit.submit_campaign(None, dirs, rate=None)
+    assert rv == {1: ["1002"], 2: [None], 3: ["1003"]}
+
+    rv = submit.submit_campaign([1, 2], dirs, rate=None, dry=True)
+    assert rv == {1: [None], 2: [None]}
+    assert len(sbatch_calls(bin_dir)) == 3
+
+
+def test_chained_parts_are_submitted_once_per_submission(sbatch, dirs):
+    bin_dir, delays = sbatch
+    write_script(dirs, "sb-0001-part2", [4, 5])
+    chain = build_chain_call("sb-0001-part2", 100, dirs)
+
+    def run_first_element(array_job_id):
+        env = {**os.environ, "SLURM_ARRAY_TASK_ID": "100"}
+        env["SLURM_ARRAY_JOB_ID"] = array_job_id
+        subprocess.run(["bash", "-c", chain], env=env, check=True)
+
+    run_first_element("500")
+    run_first_element("500")  # requeued
+    assert len(sbatch_calls(bin_dir)) == 1
+    submit.record_chained_submissions(dirs)
+
+    run_first_element("600")  # the first part was submitted again
+    assert len(sbatch_calls(bin_dir)) == 2
+    submit.record_chained_submissions(dirs)
+
+    db = SlurmhelperDB(dirs)
+    submissions = db.find_submissions("sb-0001-part2")
+    assert [s["slurm_id"] for s in submissions] == ["1001", "1002"]
+    assert db.find_user_jobs("1002") == [4, 5]
@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+from slurmhelper.jobs.cli_helpers import parcel_wall_time
+from slurmhelper.utils.misc import split_list
+from slurmhelper.utils.time import (
+    calculate_min_number_of_parcels_from_estimates,
+    slurm_time_to_seconds,
+)
+
+SPEC = {
+    "job_time": timedelta(hours=1),
+    "max_job_time": timedelta(hours=23),
+    "job_ramp_up_time": timedelta(minutes=5),
+}
+
+
+def test_parcels_are_sized_from_estimates():
+    # past jobs ran twice as long as the spec's job_time
+    job_times = {j: timedelta(hours=2) for j in range(1, 47)}
+    n_parcels = calculate_min_number_of_parcels_from_estimates(
+        list(job_times.values()), SPEC, margin=0.1
+    )
+    assert n_parcels == 5
+
+    parcels = split_list(list(job_times.keys()), wanted_parts=n_parcels)
+    time = parcel_wall_time(parcels, SPEC, history=(job_times, 0.1))
+    assert slurm_time_to_seconds(time) <= 23 * 3600
+
+
+def test_jobs_longer_than_max_job_time():
+    job_times = [timedelta(hours=30)] * 3
+    assert calculate_min_number_of_parcels_from_estimates(job_times, SPEC) == 3
+
+    history = ({1: timedelta(hours=30)}, 0.1)
+    assert parcel_wall_time([[1]], SPEC, history=history) == "23:0:0"
@@ -0,0 +1,29 @@
+import select
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from slurmhelper.utils import watch
+
+
+def test_changes_return_while_logs_keep_changing(tmp_path, monkeypatch):
+    try:
+        watcher = watch.InotifyWatcher([str(tmp_path)])
+    except OSError as err:
+        pytest.skip(f"inotify not available: {err}")
+
+    # a running job writes to its log every time the watcher waits for events
+    def write_then_select(rlist, wlist, xlist, timeout):
+        with open(tmp_path / "00001.txt", "a") as f:
+            f.write("still running\n")
+        return select.select(rlist, wlist, xlist, timeout)
+
+    monkeypatch.setattr(watch, "select", SimpleNamespace(select=write_then_select))
+    try:
+        start = time.time()
+        changed = watcher.changes(0.2)
+        assert time.time() - start < 5
+        assert changed == {(str(tmp_path), "00001.txt")}
+    finally:
+        watcher.close()